@@ -0,0 +1,70 @@
+""" Compares the runtime of the executables produced by the different compilation-paths of dbc:
+    - the ASMGenerator (unoptimized assembler-code)
+    - the CGenerator compiled with gcc -O0
+    - the CGenerator compiled with gcc -O2
+
+    Usage: python benchmarks/backends.py [-n RUNS]
+"""
+import os.path
+import sys
+import time
+import argparse
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from dbc.cli import main as dbc  # noqa: E402
+
+""" The examples to run and the input to feed to them via stdin"""
+examples = {
+    "fib": "32\n",
+    "square": "300\n",
+    "functions": "",
+    "age": "30\n",
+    "io": "5\n",
+}
+
+""" The compilation-paths to compare and the dbc-arguments to select them"""
+paths = {
+    "asm": [],
+    "c -O0": ["--backend", "c", "-O0"],
+    "c -O2": ["--backend", "c", "-O2"],
+}
+
+
+def measure(executable, stdin, runs):
+    """ Run the executable multiple times and return the fastest runtime in seconds """
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([executable], input=stdin.encode(),
+                       stdout=subprocess.DEVNULL)
+        duration = time.perf_counter() - start
+        best = duration if best is None else min(best, duration)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compare the runtime of the dbc backends')
+    parser.add_argument('-n', "--runs", type=int, default=5,
+                        help="How often to run every executable. The fastest run counts. Default: 5")
+    args = parser.parse_args()
+
+    exampledir = os.path.join(os.path.dirname(__file__), "..", "examples")
+    print("{:<12}".format("example") +
+          "".join("{:>12}".format(p) for p in paths))
+    with tempfile.TemporaryDirectory() as tmp:
+        for example, stdin in examples.items():
+            line = "{:<12}".format(example)
+            for i, pathargs in enumerate(paths.values()):
+                executable = os.path.join(tmp, "{}-{}".format(example, i))
+                dbc([os.path.join(exampledir, example+".basic"),
+                     "-o", executable] + pathargs)
+                line += "{:>10.2f}ms".format(
+                    measure(executable, stdin, args.runs)*1000)
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
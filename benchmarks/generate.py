@@ -0,0 +1,120 @@
+""" Generates synthetic DBASIC programms to measure the throughput of the compiler.
+    The size and shape of the programm can be scaled using the number of functions, the nesting-depth of IF/WHILE blocks
+    and the size of the generated expressions. The same parameters (and seed) always produce the same programm.
+
+    Usage: python benchmarks/generate.py [-f FUNCTIONS] [-d DEPTH] [-e EXPRSIZE] [-s SEED] > programm.basic
+"""
+import random
+import argparse
+
+
+class ProgrammGenerator:
+    """ Generates a random (but valid) DBASIC programm """
+
+    def __init__(self, functions=10, depth=2, exprsize=4, seed=0):
+        """ The number of functions (additionally to main) """
+        self.functions = functions
+        """ The maximal nesting-depth of IF and WHILE blocks """
+        self.depth = depth
+        """ The number of operands in every generated expression """
+        self.exprsize = exprsize
+        self.random = random.Random(seed)
+        """ Counter to generate unique variable names"""
+        self.varcounter = 0
+
+    def generate(self):
+        """ Returns the source-code of the generated programm"""
+        code = "GLOBAL INT counter = 0\n"
+        for i in range(self.functions):
+            code += self.function(i)
+        code += "FUNC main() INT\n"
+        code += "    INT result = 0\n"
+        for i in range(self.functions):
+            code += "    result = result + f{}(result, {})\n".format(
+                self.name(i), self.random.randint(0, 100))
+        code += "    print(\"%d\\n\", result)\n"
+        code += "    RETURN 0\n"
+        code += "END"
+        return code
+
+    def name(self, i):
+        """ DBASIC identifiers can only contain letters. Encode the number of the function using letters"""
+        name = ""
+        while True:
+            name += chr(ord("a") + i % 26)
+            i //= 26
+            if i == 0:
+                return name
+
+    def function(self, i):
+        """ Generate a function that has a local variable for every nesting level """
+        self.vars = ["a", "b"]
+        code = "FUNC f{}(INT a, INT b) INT\n".format(self.name(i))
+        code += self.block(self.depth, "    ", i)
+        code += "    RETURN {}\n".format(self.expression())
+        code += "END\n\n"
+        return code
+
+    def block(self, depth, indent, func):
+        """ Generate a block of statements containing nested blocks up to the given depth"""
+        code = ""
+        var = "v" + self.name(self.varcounter)
+        self.varcounter += 1
+        code += indent + "INT {} = {}\n".format(var, self.expression())
+        self.vars.append(var)
+        code += indent + "counter = counter + {}\n".format(self.expression())
+        if func > 0 and self.random.random() < 0.5:
+            # call a previously defined function
+            code += indent + "{} = {} + f{}({}, {})\n".format(
+                var, var, self.name(self.random.randrange(func)), self.expression(), self.expression())
+        if depth > 0:
+            code += indent + "IF ({}) < ({}) THEN\n".format(self.expression(), self.expression())
+            code += self.block(depth-1, indent + "    ", func)
+            code += indent + "ELSE\n"
+            code += self.block(depth-1, indent + "    ", func)
+            code += indent + "END\n"
+            loopvar = "l" + self.name(self.varcounter)
+            self.varcounter += 1
+            code += indent + "INT {} = 0\n".format(loopvar)
+            code += indent + "WHILE {} < 3 DO\n".format(loopvar)
+            code += self.block(depth-1, indent + "    ", 0)
+            code += indent + "    {} = {} + 1\n".format(loopvar, loopvar)
+            code += indent + "END\n"
+        return code
+
+    def expression(self):
+        """ Generate an expression with self.exprsize operands"""
+        code = self.operand()
+        for _ in range(self.exprsize - 1):
+            code += self.random.choice([" + ", " - ", " * ", " & ", " | "])
+            code += self.operand()
+        return code
+
+    def operand(self):
+        if self.random.random() < 0.3:
+            return str(self.random.randint(0, 1000))
+        return self.random.choice(self.vars)
+
+
+def generate(functions=10, depth=2, exprsize=4, seed=0):
+    """ Returns the source-code of a synthetic programm. See ProgrammGenerator for the parameters """
+    return ProgrammGenerator(functions, depth, exprsize, seed).generate()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Generate a synthetic DBASIC programm')
+    parser.add_argument('-f', "--functions", type=int, default=10,
+                        help="Number of functions. Default: 10")
+    parser.add_argument('-d', "--depth", type=int, default=2,
+                        help="Maximal nesting depth of IF/WHILE blocks. Default: 2")
+    parser.add_argument('-e', "--exprsize", type=int, default=4,
+                        help="Number of operands per expression. Default: 4")
+    parser.add_argument('-s', "--seed", type=int, default=0,
+                        help="Seed for the random-generator. Default: 0")
+    args = parser.parse_args()
+    print(generate(args.functions, args.depth, args.exprsize, args.seed), end="")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+""" Compares the interpreters of dbc (see dbc.interpret) with each other and with native execution:
+    - tree: The Interpreter, which walks the AST
+    - vm: The bytecode-interpreter (see dbc.vm)
+    - vm -O1: The bytecode-interpreter running the optimized AST
+    - closures: The interpreter that compiles the AST into python-closures (see dbc.closures)
+    - closures -O1: The closure-interpreter running the optimized AST
+    - native: The executable built by the asm-backend with -O1 (including the start of the process)
+
+    The programms are smaller versions of the kernels (benchmarks/kernels), as the interpreters are a lot slower than the executables.
+    The interpreters are measured without the time it takes to load the programm. Their output is compared with the output of the
+    executable.
+
+    Usage: python benchmarks/interpreters.py [-n RUNS] [-k FILTER]
+"""
+import io
+import os.path
+import sys
+import time
+import argparse
+import tempfile
+import subprocess
+from collections import OrderedDict
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import dbc.cli as cli  # noqa: E402
+import dbc.interpret as interpret  # noqa: E402
+import dbc.vm as vm  # noqa: E402
+import dbc.closures as closures  # noqa: E402
+
+""" The programms to run"""
+programms = OrderedDict([
+    ("fib", """FUNC fib(INT n) INT
+    IF n < 2 THEN
+        RETURN n
+    END
+    RETURN fib(n-1)+fib(n-2)
+END
+
+FUNC main() INT
+    print("%d\\n", fib(22))
+    RETURN 0
+END"""),
+    ("loops", """FUNC main() INT
+    INT sum = 0
+    INT i = 0
+    WHILE i < 400 DO
+        INT j = 0
+        WHILE j < 400 DO
+            sum = sum + (i & j)
+            j = j+1
+        END
+        i = i+1
+    END
+    print("%d\\n", sum)
+    RETURN 0
+END"""),
+    ("arith", """FUNC mod(INT a, INT b) INT
+    RETURN a - (a/b)*b
+END
+
+FUNC main() INT
+    INT seed = 12345
+    INT acc = 0
+    INT i = 0
+    WHILE i < 50000 DO
+        seed = (seed*1103515245 + 12345) & 2147483647
+        acc = acc + mod(seed/65536, 1000) - (seed & 255)*3 - (i/7)
+        i = i+1
+    END
+    print("%d\\n", acc)
+    RETURN 0
+END"""),
+    ("stride", """GLOBAL INT scale = 7
+
+FUNC main() INT
+    INT n = 300
+    INT sum = 0
+    INT i = 0
+    WHILE i < n DO
+        INT j = 0
+        WHILE j < n DO
+            sum = sum + ((j*8 + i*scale) & (n*4 - 1))
+            j = j+1
+        END
+        i = i+1
+    END
+    print("%d\\n", sum)
+    RETURN 0
+END"""),
+    ("printio", """FUNC main() INT
+    INT i = 0
+    WHILE i < 5000 DO
+        print("line %d: %d %d\\n", i, i*i, -i)
+        i = i+1
+    END
+    RETURN 0
+END"""),
+])
+
+""" The interpreters to compare. Name to the engine and the optimization-level"""
+engines = OrderedDict([
+    ("tree", (interpret.Interpreter, None)),
+    ("vm", (vm.Machine, None)),
+    ("vm -O1", (vm.Machine, 1)),
+    ("closures", (closures.ClosureCompiler, None)),
+    ("closures -O1", (closures.ClosureCompiler, 1)),
+])
+
+
+def measureengine(source, engine, optimize, runs):
+    """ Load the source into the engine and run it multiple times. Returns the fastest runtime in seconds and the output"""
+    best = None
+    for _ in range(runs):
+        out = io.StringIO()
+        syntaxtree = interpret.frontend(
+            [source], optimize=optimize, wholeprogramm=True)
+        programm = interpret.Programm(
+            syntaxtree, engine(syntaxtree, interpret.Console(out)))
+        start = time.perf_counter()
+        programm.main()
+        duration = time.perf_counter() - start
+        best = duration if best is None else min(best, duration)
+    return best, out.getvalue()
+
+
+def measureexecutable(executable, runs):
+    """ Run the executable multiple times. Returns the fastest runtime in seconds and the output"""
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run([executable], stdout=subprocess.PIPE,
+                                stdin=subprocess.DEVNULL, check=True)
+        duration = time.perf_counter() - start
+        best = duration if best is None else min(best, duration)
+    return best, result.stdout.decode()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compare the interpreters of dbc with native execution')
+    parser.add_argument('-n', "--runs", type=int, default=3,
+                        help="How often to run every programm. The fastest run counts. Default: 3")
+    parser.add_argument('-k', "--filter", type=str, action="append",
+                        help="Only run the programms with this name. Can be given multiple times")
+    args = parser.parse_args()
+
+    # the speedup of the interpreters over walking the tree
+    speedups = ["vm", "closures"]
+    columns = list(engines) + ["native"] + [e + " x" for e in speedups]
+    print("{:<10}".format("programm") +
+          "".join("{:>14}".format(c) for c in columns))
+    status = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, source in programms.items():
+            if args.filter and name not in args.filter:
+                continue
+            times = OrderedDict()
+            outputs = set()
+            for engine, (cls, optimize) in engines.items():
+                times[engine], output = measureengine(
+                    source, cls, optimize, args.runs)
+                outputs.add(output)
+            path = os.path.join(tmp, name + ".basic")
+            with open(path, "w") as f:
+                f.write(source)
+            executable = os.path.join(tmp, name)
+            if cli.run([path, "-o", executable, "-O1"]):
+                raise RuntimeError("Could not build " + name)
+            times["native"], output = measureexecutable(executable, args.runs)
+            outputs.add(output)
+            line = "{:<10}".format(name)
+            line += "".join("{:>12.2f}ms".format(t*1000)
+                            for t in times.values())
+            line += "".join("{:>13.1f}x".format(times["tree"] / times[e])
+                            for e in speedups)
+            print(line)
+            if len(outputs) > 1:
+                print("Output of {} differs between the interpreters and the executable".format(name))
+                status = 1
+    sys.exit(status)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+""" Runs the benchmark-suite of dbc and stores the results as JSON:
+    - compile: The time every stage of the compiler needs for synthetic programms of different sizes (see generate.py) and the kernels.
+      Additionally the semantic checks are measured with every pipeline of checkers (check:<pipeline>, see dbc.driver.checkpipelines)
+      and a traversal of the checked AST by the plain dbc.visit.Visitor (walk), which measures the overhead of the visitor-dispatch
+    - runtime: The runtime of the executables built from the kernels (benchmarks/kernels/*.basic) with every backend
+
+    All timings are the best of multiple runs. If a baseline (the JSON-output of an earlier run) is given, the results are compared
+    against it and every measurement that got slower by more than the threshold is reported as regression.
+
+    Usage: python benchmarks/run.py [-n RUNS] [-o results.json] [--baseline baseline.json] [--threshold PERCENT] [-k FILTER]
+"""
+import os
+import os.path
+import sys
+import copy
+import glob
+import json
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+from collections import OrderedDict
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import dbc  # noqa: E402
+import dbc.cli as cli  # noqa: E402
+import dbc.driver as driver  # noqa: E402
+from dbc.visit import Visitor  # noqa: E402
+from generate import generate  # noqa: E402
+
+""" The synthetic programms used to measure the compiler. Name to parameters of generate()"""
+programms = OrderedDict([
+    ("small", dict(functions=10, depth=2, exprsize=4)),
+    ("medium", dict(functions=50, depth=2, exprsize=5)),
+    ("large", dict(functions=200, depth=2, exprsize=5)),
+])
+
+""" The compilation-paths used to build the kernels and the dbc-arguments to select them"""
+backends = OrderedDict([
+    ("asm", []),
+    ("asm -O1", ["-O1"]),
+    ("asm -O2", ["-O2"]),
+    ("asm --memoize", ["--memoize"]),
+    ("c -O0", ["--backend", "c", "-O0"]),
+    ("c -O2", ["--backend", "c", "-O2"]),
+])
+
+""" The directory containing the kernels"""
+kerneldir = os.path.join(os.path.dirname(__file__), "kernels")
+
+
+def kernels():
+    """ Returns a dict of kernel-name to the path of it's source-file"""
+    return OrderedDict((os.path.splitext(os.path.basename(f))[0], f) for f in sorted(glob.glob(os.path.join(kerneldir, "*.basic"))))
+
+
+def timecompile(source, runs):
+    """ Compile the source multiple times and return the best wall-time (in seconds) of every stage.
+    Memory is not measured, as tracemalloc would distort the timings"""
+    best = OrderedDict()
+    for _ in range(runs):
+        stats = driver.timepasses(source, memory=False)
+        for name, stage in stats.passes.items():
+            best[name] = min(best.get(name, stage["wall"]), stage["wall"])
+    best["total"] = sum(v for k, v in best.items())
+    return best
+
+
+def timechecks(source, runs):
+    """ Run the semantic checks on the source with every pipeline of checkers and walk the checked AST.
+    Returns the best wall-time (in seconds) of every pipeline and the walk"""
+    tree = driver.parsesource(source)
+    best = OrderedDict()
+    for pipeline in driver.checkpipelines:
+        for _ in range(runs):
+            syntaxtree = copy.deepcopy(tree)
+            start = time.perf_counter()
+            driver.check(syntaxtree, pipeline=pipeline)
+            duration = time.perf_counter() - start
+            name = "check:" + pipeline
+            best[name] = min(best.get(name, duration), duration)
+    for _ in range(runs):
+        start = time.perf_counter()
+        Visitor().visit(syntaxtree)
+        duration = time.perf_counter() - start
+        best["walk"] = min(best.get("walk", duration), duration)
+    return best
+
+
+def timeexecutable(executable, runs):
+    """ Run the executable multiple times. Returns the fastest runtime in seconds and the output of the programm"""
+    best = None
+    output = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run([executable], stdout=subprocess.PIPE,
+                                stdin=subprocess.DEVNULL, check=True)
+        duration = time.perf_counter() - start
+        best = duration if best is None else min(best, duration)
+        output = result.stdout
+    return best, output
+
+
+def benchcompile(runs, selected):
+    """ Measure the compiler on the synthetic programms and the kernels """
+    results = OrderedDict()
+    for name, params in programms.items():
+        if selected(name):
+            source = generate(**params)
+            results[name] = timecompile(source, runs)
+            report("compile", name, results[name]["total"])
+            checks = timechecks(source, runs)
+            for what, seconds in checks.items():
+                report("compile", "{} ({})".format(name, what), seconds)
+            results[name].update(checks)
+    for name, path in kernels().items():
+        if selected(name):
+            with open(path) as f:
+                results[name] = timecompile(f.read(), runs)
+            report("compile", name, results[name]["total"])
+    return results
+
+
+def benchruntime(runs, selected, tmp):
+    """ Build every kernel with every backend and measure the executables.
+    Returns the results and a list of kernels whose output differs between the backends"""
+    results = OrderedDict()
+    mismatches = []
+    for name, path in kernels().items():
+        if not selected(name):
+            continue
+        results[name] = OrderedDict()
+        outputs = set()
+        for i, (backend, args) in enumerate(backends.items()):
+            executable = os.path.join(tmp, "{}-{}".format(name, i))
+            if cli.run([path, "-o", executable] + args):
+                raise RuntimeError(
+                    "Could not build {} with backend {}".format(name, backend))
+            results[name][backend], output = timeexecutable(executable, runs)
+            outputs.add(output)
+            report("runtime", "{} ({})".format(name, backend),
+                   results[name][backend])
+        if len(outputs) > 1:
+            mismatches.append(name)
+    return results, mismatches
+
+
+def report(kind, name, seconds):
+    print("{:<10}{:<24}{:>12.2f}ms".format(kind, name, seconds*1000))
+
+
+def compare(results, baseline, threshold):
+    """ Compare results against baseline. Returns a list of messages for every measurement that is more than threshold (percent) slower"""
+    regressions = []
+    for kind in ["compile", "runtime"]:
+        for name, measurements in results.get(kind, {}).items():
+            for what, seconds in measurements.items():
+                old = baseline.get(kind, {}).get(name, {}).get(what)
+                # ignore measurements that are too short to be compared reliably
+                if not old or old < 0.001:
+                    continue
+                change = (seconds - old) / old * 100
+                if change > threshold:
+                    regressions.append("{} {} {}: {:.2f}ms -> {:.2f}ms (+{:.1f}%)".format(
+                        kind, name, what, old*1000, seconds*1000, change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Run the dbc benchmark-suite')
+    parser.add_argument('-n', "--runs", type=int, default=3,
+                        help="How often to run every measurement. The fastest run counts. Default: 3")
+    parser.add_argument('-o', "--output", type=str,
+                        help="Write the results as JSON to this file")
+    parser.add_argument("--baseline", type=str,
+                        help="Compare the results against this file (the output of an earlier run)")
+    parser.add_argument("--threshold", type=float, default=10,
+                        help="Slowdown (in percent) compared to the baseline that is reported as regression. Default: 10")
+    parser.add_argument('-k', "--filter", type=str, action="append",
+                        help="Only run the programms/kernels with this name. Can be given multiple times")
+    parser.add_argument("--no-compile", action="store_true",
+                        help="Do not measure the compiler")
+    parser.add_argument("--no-runtime", action="store_true",
+                        help="Do not measure the executables")
+    args = parser.parse_args()
+
+    def selected(name):
+        return not args.filter or name in args.filter
+
+    results = OrderedDict()
+    results["info"] = OrderedDict([
+        ("version", dbc.__version__),
+        ("python", platform.python_version()),
+        ("machine", platform.machine()),
+        ("runs", args.runs),
+    ])
+    if not args.no_compile:
+        results["compile"] = benchcompile(args.runs, selected)
+    mismatches = []
+    if not args.no_runtime:
+        with tempfile.TemporaryDirectory() as tmp:
+            results["runtime"], mismatches = benchruntime(
+                args.runs, selected, tmp)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+
+    status = 0
+    for name in mismatches:
+        print("Output of kernel {} differs between the backends".format(name))
+        status = 1
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for regression in regressions:
+            print("Regression: " + regression)
+        if regressions:
+            status = 1
+        else:
+            print("No regressions compared to " + args.baseline)
+    sys.exit(status)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,3 @@
+""" DBASIC - A minimal programming language (and compiler), for learning to write a compiler """
+
+__version__ = "0.0.1"
@@ -37,6 +37,10 @@ class Programm:
         In contrast to self.funcdefs this list does NOT contain AST Nodes
         """
         self.globalvartypes = None
+        """ This field is not populated by the parser but later by the VariableChecker.
+        It contains the dbc.symbols.SymbolTable of the programm, to look up functions and variables by name.
+        """
+        self.symbols = None
 
 
 class Unary:
@@ -113,6 +117,10 @@ class If:
         self.statements = statements
         """ A list of statements to execute if the condition is False"""
         self.elsestatements = elsestatements
+        """ These fields are not populated by the parser but by dbc.profile.annotate() (see --use-profile).
+        They contain how often the condition was evaluated and how often it was true in the profiled runs (or None if there is no profile)"""
+        self.count = None
+        self.taken = None
         self.line = line
 
 
@@ -124,6 +132,10 @@ class While:
         self.exp = exp
         """ A list of statements that will be executed until the condition is False"""
         self.statements = statements
+        """ These fields are not populated by the parser but by dbc.profile.annotate() (see --use-profile).
+        They contain the number of iterations and how often the loop was entered in the profiled runs (or None if there is no profile)"""
+        self.count = None
+        self.entries = None
         self.line = line
 
 
@@ -146,6 +158,9 @@ class Call:
         self.args = args
         """If true: This call was a stand-alone statement(and not part of an expression). The C-generator needs to know this to append a ';'"""
         self.isStatement = isStatement
+        """ This field is not populated by the parser but by dbc.profile.annotate() (see --use-profile).
+        It contains how often this call was executed in the profiled runs (or None if there is no profile)"""
+        self.count = None
         self.line = line
 
 
@@ -171,6 +186,10 @@ class FuncDef:
         self.localvartypes = None
         """ The return type of this function as string (e.g. "INT")"""
         self.returntype = returntype
+        """ These fields are not populated by the parser but by dbc.profile.annotate() (see --use-profile).
+        They contain how often the function was called and the cycles spent in it in the profiled runs (or None if there is no profile)"""
+        self.count = None
+        self.cycles = None
         self.line = line
 
 
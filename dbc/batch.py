@@ -0,0 +1,270 @@
+""" Compiles many source-files at once. The frontend and the code-generation of every file run in parallel on a pool of worker-processes,
+    while the gcc-invocations (assembling, compiling and linking) run as concurrent subprocesses.
+    Files are always processed and reported in the order they were given, so the results do not depend on the number of parallel jobs.
+"""
+import os
+import os.path
+import time
+import glob
+import asyncio
+import resource
+import threading
+import concurrent.futures
+from collections import OrderedDict
+
+import dbc.ast as ast
+import dbc.parse as parse
+import dbc.driver as driver
+import dbc.runtime as runtime
+from dbc.visit import VisitorError
+import dbc.stats as statistics
+import dbc.profile as profiling
+from dbc.errors import CheckError
+
+""" Caches the code generated by generate(). Pays off when the same process compiles the same files multiple times (e.g. the compile-server)"""
+codecache = OrderedDict()
+""" The maximal number of entries in codecache"""
+codecachesize = 256
+""" Protects codecache. Multiple threads can compile at the same time (e.g. in the compile-server)"""
+codecachelock = threading.Lock()
+
+""" The errors that are reported for a single file (instead of aborting the whole compilation)"""
+compileerrors = (parse.ParserError, VisitorError,
+                 CheckError, SyntaxError, driver.LinkError, OSError)
+
+
+class Unit:
+    """ A single source-file that is compiled """
+
+    def __init__(self, infile):
+        """ The path of the source-file"""
+        self.infile = infile
+        """ The content of the source-file"""
+        self.source = None
+        """ Signatures (ast.FuncDef without statements) of the functions defined in this file. Only needed when linking multiple files."""
+        self.functions = []
+        """ Functions defined in the other files, that are linked into the same programm"""
+        self.externals = dict()
+        """ The generated code """
+        self.code = None
+        """ The object-file compiled from this file """
+        self.object = None
+        """ The entries of the profile (see --use-profile) that belong to this file"""
+        self.profiledata = None
+        """ The message of the error that occured while compiling this file """
+        self.error = None
+
+
+def expandinputs(inputs):
+    """ Returns the files to compile for the given inputs. Directories are replaced by all .basic files in them and globs by the files they match.
+    The results are sorted, so the order of the files does not depend on the filesystem."""
+    files = []
+    for inp in inputs:
+        if os.path.isdir(inp):
+            files += sorted(glob.glob(os.path.join(inp, "*.basic")))
+        elif any(c in inp for c in "*?["):
+            files += sorted(glob.glob(inp))
+        else:
+            files.append(inp)
+    return files
+
+
+def signatures(infile, debug=False):
+    """ Worker: read and parse a file and return it's source and the signatures of it's functions (or the error that occured)"""
+    try:
+        with open(infile, "r") as f:
+            source = f.read()
+        syntaxtree = driver.parsesource(source, debug)
+        functions = [ast.FuncDef(f.name, f.args, f.argtypes, [], f.returntype, f.line)
+                     for f in syntaxtree.funcdefs]
+        return source, functions, None
+    except compileerrors as e:
+        return None, None, str(e)
+
+
+def generate(source, requiremain, externals, options, debug=False, stats=None, filename=None, profiledata=None):
+    """ Worker: run frontend and code-generation for the given source with the given driver.Options and return the generated code
+    (or the error that occured). profiledata are the profile-entries used to optimize the code.
+    If stats is a dbc.stats.Statistics object, the stages of the compilation are measured and the measurements are returned as third value.
+    In this case the codecache is bypassed, as it would skip the stages that should be measured."""
+    key = (source, requiremain, tuple(sorted(driver.signature(f) for f in externals.values())), tuple(options.key()),
+           (options.profile or options.debuginfo) and filename, profiledata and profiling.digest(profiledata))
+    with codecachelock:
+        if key in codecache and not stats:
+            codecache.move_to_end(key)
+            return codecache[key], None, None
+    try:
+        code = driver.compileunit(source, options, requiremain, externals, debug=debug, stats=stats or statistics.nostats,
+                                  filename=filename, profiledata=profiledata)
+    except compileerrors as e:
+        return None, str(e), stats
+    with codecachelock:
+        codecache[key] = code
+        if len(codecache) > codecachesize:
+            codecache.popitem(last=False)
+    return code, None, stats
+
+
+async def gcc(args, code, limit):
+    """ Run gcc as asynchronous subprocess. Raises LinkError if gcc fails.
+
+    :params args: The arguments for gcc
+    :params code: The code to pass to gcc via stdin (or None)
+    :params limit: A semaphore that limits the number of concurrently running gcc-processes
+    """
+    async with limit:
+        proc = await asyncio.create_subprocess_exec("gcc", *args, stdin=asyncio.subprocess.PIPE if code is not None else None,
+                                                    stderr=asyncio.subprocess.PIPE)
+        _, stderr = await proc.communicate(code.encode() if code is not None else None)
+        if proc.returncode != 0:
+            raise driver.LinkError(stderr.decode())
+
+
+async def buildobject(unit, key, options, limit, rebuild=False):
+    """ Compile the generated code of unit into a (cached) object-file. If rebuild is true, the object is built even if it is already cached"""
+    async def build(path):
+        await gcc(driver.objectargs(path, options.backend, options.optimize, options.debuginfo), unit.code, limit)
+    try:
+        unit.object = await runtime.cachedfileasync(key, ".o", build, rebuild)
+    except compileerrors as e:
+        unit.error = str(e)
+
+
+async def buildexecutable(units, objects, outfile, gccargs, limit, profile=False):
+    """ Link the objects of the given units (and additional object-files) into an executable. Returns the error that occured (or None)"""
+    try:
+        await gcc(driver.linkargs([u.object for u in units] + objects, outfile, gccargs, profile), None, limit)
+    except compileerrors as e:
+        return str(e)
+
+
+def build(infiles, objects=[], options=driver.Options(), target="binary", compileonly=False, outfile=None, gccargs=[], separate=False,
+          jobs=1, debug=False, stats=None, useprofile=None):
+    """ Compile the given source-files.
+
+    :params infiles: The source-files to compile
+    :params objects: Additional object-files to link to the programm
+    :params options: The driver.Options to compile with. options.backend is used to build object-files (See driver.compileobject())
+    :params target: The kind of output to generate (asm, c or binary)
+    :params compileonly: If true (and target is binary), the sources are only compiled to object-files, but not linked
+    :params outfile: The output-file. If None, the names of the outputs are derived from the inputs.
+    :params gccargs: Additional arguments for gcc when linking
+    :params separate: If true, every source-file is a complete programm and linked into it's own executable. Otherwise all files are linked together.
+    :params jobs: The number of files to process in parallel. 0 means: use all cpus
+    :params debug: Enable debugging output
+    :params stats: A dbc.stats.Statistics object that the measurements of all stages of all files are added to.
+                   If given, all caches are bypassed, so that every stage is actually executed.
+    :params useprofile: The entries of a profile (see dbc.profile.load()) used to optimize the programm
+    :returns: A list of (file,error-message) tuples for all errors that occured
+    """
+    jobs = jobs or os.cpu_count()
+    units = [Unit(f) for f in infiles]
+    for unit in units:
+        unit.profiledata = profiling.forfile(
+            useprofile, unit.infile) if useprofile else None
+    # every file needs to be a complete programm, if it is not linked to other files
+    requiremain = not compileonly and (
+        separate or len(infiles) + len(objects) == 1)
+    # without a binary as output, the target is the kind of code to generate
+    codeoptions = options if target == "binary" else options.replace(backend=target)
+
+    # with a single job there is nothing to parallelize. Do not pay the cost for starting worker-processes
+    if jobs > 1 and len(units) > 1:
+        executor = concurrent.futures.ProcessPoolExecutor(jobs)
+    else:
+        executor = None
+
+    def run(func, *argslists):
+        # map func over the units in the pool (or in this process). Results are returned in order
+        if executor:
+            return list(executor.map(func, *argslists))
+        return list(map(func, *argslists))
+
+    try:
+        # read and parse all files first. If multiple files are linked together, every file needs to know the signatures of the functions of the others
+        for unit, (source, functions, error) in zip(units, run(signatures, infiles, [debug]*len(units))):
+            unit.source, unit.functions, unit.error = source, functions, error
+        if not separate:
+            functions = dict()
+            for unit in units:
+                for func in unit.functions or []:
+                    functions[func.name] = func
+            for unit in units:
+                unit.externals = {k: v for k, v in functions.items()
+                                  if v not in (unit.functions or [])}
+
+        # objects that are already in the cache do not need to be generated again
+        keys = dict()
+        for unit in units:
+            if target == "binary" and not unit.error:
+                keys[unit] = driver.objectkey(
+                    unit.source, requiremain, unit.externals, options, unit.infile, unit.profiledata)
+                if os.path.isfile(os.path.join(runtime.cachedir(), keys[unit]+".o")) and not stats:
+                    unit.object = os.path.join(
+                        runtime.cachedir(), keys[unit]+".o")
+        pending = [u for u in units if not u.error and not u.object]
+
+        # generate code for all files in parallel
+        results = run(generate, [u.source for u in pending], [requiremain]*len(pending), [u.externals for u in pending],
+                      [codeoptions]*len(pending), [debug]*len(pending),
+                      [statistics.Statistics(memory=stats.memory) if stats else None for _ in pending],
+                      [u.infile for u in pending], [u.profiledata for u in pending])
+        for unit, (code, error, unitstats) in zip(pending, results):
+            unit.code, unit.error = code, error
+            if unitstats:
+                stats.merge(unitstats)
+    finally:
+        if executor:
+            executor.shutdown()
+
+    if target != "binary":
+        # if the users does not want a binary as output we are done now. Just write the code to the files
+        for unit in units:
+            if not unit.error:
+                with open(outfile or os.path.splitext(unit.infile)[0] + "." + target, "w") as of:
+                    of.write(unit.code)
+        return [(u.infile, u.error) for u in units if u.error]
+
+    # make sure the runtime is built before the linker-processes need it
+    try:
+        runtime.runtimeobject()
+    except compileerrors as e:
+        # no file can be linked without it
+        return [(u.infile, u.error or str(e)) for u in units]
+    # gcc runs in subprocesses. The best we can do is measure the time until all of them are finished and the cpu-time they used
+    wall = time.perf_counter()
+    cpu = resource.getrusage(resource.RUSAGE_CHILDREN)
+    errors = asyncio.run(gccphase(units, objects, keys, pending, options, compileonly, outfile, gccargs, separate, jobs, bool(stats)))
+    if stats:
+        used = resource.getrusage(resource.RUSAGE_CHILDREN)
+        stats.record("gcc", time.perf_counter() - wall,
+                     used.ru_utime - cpu.ru_utime + used.ru_stime - cpu.ru_stime)
+    return errors
+
+
+async def gccphase(units, objects, keys, pending, options, compileonly, outfile, gccargs, separate, jobs, rebuild):
+    """ Second half of build(): run all the needed gcc-processes concurrently """
+    limit = asyncio.Semaphore(jobs)
+    await asyncio.gather(*[buildobject(u, keys[u], options, limit, rebuild) for u in pending if not u.error])
+    good = [u for u in units if not u.error]
+
+    if compileonly:
+        # if the user only wants objects, we are done. Place a copy of the objects next to the sources
+        for unit in good:
+            with open(unit.object, "rb") as obj, open(outfile or os.path.splitext(unit.infile)[0] + ".o", "wb") as of:
+                of.write(obj.read())
+    elif separate:
+        # every file is it's own programm
+        results = await asyncio.gather(*[buildexecutable([u], objects, outfile or os.path.splitext(u.infile)[0], gccargs, limit, options.profile)
+                                         for u in good])
+        for unit, error in zip(good, results):
+            unit.error = error
+    elif len(good) == len(units):
+        # link all objects and the runtime into one executable
+        outfile = outfile or os.path.splitext(
+            units[0].infile if units else objects[0])[0]
+        error = await buildexecutable(units, objects, outfile, gccargs, limit, options.profile)
+        if error:
+            return [(outfile, error)]
+
+    return [(u.infile, u.error) for u in units if u.error]
@@ -0,0 +1,158 @@
+import dbc.ast as ast
+from dbc.errors import CheckError
+from dbc.symbols import SymbolTable
+from dbc.checktypes import TypeChecker
+from collections import OrderedDict
+
+
+class SemanticChecker(TypeChecker):
+    """ Does the work of the VariableChecker and the TypeChecker in a single traversal of the AST:
+    Declares and resolves the variables, builds the symbol-table, annotates the expressions with their types and checks the calls.
+    The resulting annotations are exactly the ones of the two separate checkers. (Only for invalid programms the reported error can differ,
+    if the programm contains multiple errors)
+
+    The TypeChecker needs the signatures of all functions and the types of all local variables of a function, even of the ones declared
+    behind the currently checked node. So before a function's body is checked, the declarations of it's local variables are collected
+    (which only looks at the statements, not at the expressions), and all functions are entered into the symbol-table before the first one is checked.
+    """
+
+    def __init__(self, requiremain=True, externals=None):
+        super().__init__(externals)
+        """ If true, the programm must contain a main-function. See VariableChecker"""
+        self.requiremain = requiremain
+        """ The symbol-table that is built for the programm"""
+        self.symbols = SymbolTable()
+        """ Contains all global variables declared in the programm and their default values. See ast.Programm"""
+        self.globalvars = self.symbols.globalvars
+        """ Contains all local variables and their default values of the function that is currently beeing analysed. See ast.FuncDef"""
+        self.localvars = OrderedDict()
+        """ Contains all local variables and their types of the function that is currently beeing analysed."""
+        self.localvartypes = OrderedDict()
+        """ The local variables of the current function that are declared before the currently checked node"""
+        self.declared = set()
+        """ True while the value of a LocalDef is checked. The VariableChecker does not check them, the variables in it only need to be
+        declared somewhere in the function"""
+        self.definition = False
+        """ Contains all string constants declared in the programm. See ast.Programm"""
+        self.constants = dict()
+        """ Keep a counter of constants to generate unique labels for them"""
+        self.constantcounter = 0
+
+    def check(self, node):
+        """ Main method for the checker. Checks the given programm and annotates it with variable and type information"""
+        self.rootnode = node
+        return self.visitProgramm(node)
+
+    def visitProgramm(self, node):
+        # first visit all global variables
+        for glob in node.globaldefs:
+            self.visit(glob)
+        # calls can refer to functions that are defined later. The first definition of a name counts (the others are errors)
+        for func in node.funcdefs:
+            if not self.symbols.function(func.name):
+                self.symbols.define(func)
+        # then analyse all defined functions
+        definedfunctions = set()
+        for func in node.funcdefs:
+            self.visit(func)
+            # can not have two functions with the same name
+            if func.name in definedfunctions:
+                raise CheckError(
+                    "Function {} has previously been defined.".format(func.name), func)
+            definedfunctions.add(func.name)
+
+        if self.requiremain and not "main" in definedfunctions:
+            raise CheckError(
+                "Every programm needs to have a function called 'main'", None)
+
+        # annotate the progamm node with information about globals and constants
+        node.globalvars = self.symbols.globalvars
+        node.globalvartypes = self.symbols.globalvartypes
+        node.constants = self.constants
+        node.symbols = self.symbols
+
+    def declarations(self, statements):
+        """ Collect the local variables declared by the given statements (and the blocks nested in them), in declaration-order"""
+        for statement in statements:
+            t = type(statement)
+            if t == ast.LocalDef:
+                statement.name = self.symbols.intern(statement.name)
+                self.localvars[statement.name] = statement.value
+                self.localvartypes[statement.name] = statement.type
+            elif t == ast.If:
+                self.declarations(statement.statements)
+                if statement.elsestatements:
+                    self.declarations(statement.elsestatements)
+            elif t == ast.While:
+                self.declarations(statement.statements)
+
+    def visitFuncdef(self, node):
+        self.localvars = OrderedDict()
+        self.localvartypes = OrderedDict()
+        node.args = [self.symbols.intern(arg) for arg in node.args]
+        for i, arg in enumerate(node.args):
+            self.localvars[arg] = 0
+            self.localvartypes[arg] = node.argtypes[i]
+        self.declarations(node.statements)
+        node.localvars = self.localvars
+        node.localvartypes = self.localvartypes
+        self.declared = set(node.args)
+        super().visitFuncdef(node)
+        if type(node.statements[-1]) != ast.Return:
+            raise CheckError(
+                "Functions must end with a return-statement", node)
+
+    def visitVar(self, node):
+        node.name = self.symbols.intern(node.name)
+        # make sure variables are only used AFTER they have been declared
+        declared = self.localvartypes if self.definition else self.declared
+        # get the type from the declaration of the variable. Locals can not hide globals (see visitLocaldef)
+        if node.name in declared:
+            node.type = self.localvartypes[node.name]
+        elif node.name in self.globalvars:
+            node.type = self.symbols.globalvartypes[node.name]
+        else:
+            raise CheckError(
+                "Variable {} needs to be declared before use".format(node.name), node)
+
+    def visitStr(self, node):
+        # take note of all string constants
+        self.constants[node.value] = ".Lstr"+str(self.constantcounter)
+        self.constantcounter += 1
+        super().visitStr(node)
+
+    def visitAssign(self, node):
+        node.name = self.symbols.intern(node.name)
+        # make sure variables are only used AFTER they have been declared
+        if node.name not in self.globalvars and node.name not in self.declared:
+            raise CheckError(
+                "Variable {} needs to be declared before assignment".format(node.name), node)
+        super().visitAssign(node)
+
+    def visitCall(self, node):
+        node.name = self.symbols.intern(node.name)
+        super().visitCall(node)
+
+    def visitGlobaldef(self, node):
+        node.name = self.symbols.intern(node.name)
+        # make sure global variables are only declared once
+        if node.name in self.globalvars:
+            raise CheckError(
+                "Global variable {} has already been declared".format(node.name), node)
+        # globals can only be initialized using constants. Check it.
+        if type(node.value) != ast.Const:
+            raise CheckError(
+                "Global variables can only be initialized using constants", node)
+        self.symbols.globalvars[node.name] = node.value.value
+        self.symbols.globalvartypes[node.name] = node.type
+        super().visitGlobaldef(node)
+
+    def visitLocaldef(self, node):
+        # make sure global variables are only declared once per function
+        if node.name in self.globalvars:
+            raise CheckError(
+                "Local variable {} has already been declared".format(node.name), node)
+        self.declared.add(node.name)
+        self.definition = True
+        super().visitLocaldef(node)
+        self.definition = False
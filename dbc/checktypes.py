@@ -11,9 +11,14 @@ class TypeChecker(Visitor):
     Additionaly it tags all expression Nodes with a type.
     """
 
-    def __init__(self):
+    def __init__(self, externals=None):
+        """ Definitions (ast.FuncDef) of functions that are defined in other compilation-units, but are linked into the same programm.
+        Calls to them are type-checked like calls to functions of this programm. Is a dict with the function-name as key"""
+        self.externals = externals or dict()
         """ Point at the root node of the programm"""
         self.rootnode = None
+        """ The symbol-table of the programm (built by the VariableChecker)"""
+        self.symbols = None
         """ Points at the function node that is currently processed """
         self.currentfunc = None
         super().__init__()
@@ -21,6 +26,7 @@ class TypeChecker(Visitor):
     def check(self, node):
         """ Main method for the checker. Checks the given programm for type errors"""
         self.rootnode = node
+        self.symbols = node.symbols
         return self.visitProgramm(node)
 
     def visitUnary(self, node):
@@ -58,10 +64,7 @@ class TypeChecker(Visitor):
 
     def visitVar(self, node):
         # get the type from the declaration of the variable
-        if node.name in self.currentfunc.localvartypes:
-            node.type = self.currentfunc.localvartypes[node.name]
-        else:
-            node.type = self.rootnode.globalvartypes[node.name]
+        node.type = self.symbols.vartype(node.name, self.currentfunc)
 
     def visitConst(self, node):
         # consts are getting their type set by the parser. (Yes, this is a strange exception...)
@@ -97,22 +100,17 @@ class TypeChecker(Visitor):
     def visitAssign(self, node):
         self.visit(node.value)
         # find the type of the variable. Could be a global or a local variable
-        if self.currentfunc != None and node.name in self.currentfunc.localvartypes:
-            vartype = self.currentfunc.localvartypes[node.name]
-        else:
-            vartype = self.rootnode.globalvartypes[node.name]
+        vartype = self.symbols.vartype(node.name, self.currentfunc)
         # make sure the assigned value has the same type as the variable
         if node.value.type != vartype:
             raise CheckError(
                 "Cannot assign {} type value to a {}-Variable".format(node.value.type, vartype), node)
 
     def visitLocaldef(self, node):
-        self.visit(node.value)
-        # a defintion is always also an assignment. pass it on.
+        # a defintion is always also an assignment. pass it on. (visitAssign types the value)
         self.visitAssign(node)
 
     def visitGlobaldef(self, node):
-        self.visit(node.value)
         # a defintion is always also an assignment. pass it on.
         self.visitAssign(node)
 
@@ -147,7 +145,8 @@ class TypeChecker(Visitor):
             if len(node.args) < 1:
                 raise CheckError(
                     "print() needs at least one argument", node)
-            self.visit(node.args[0])
+            for arg in node.args:
+                self.visit(arg)
             if node.args[0].type != "CONSTSTR":
                 raise CheckError(
                     "First argument to print must be a string", node)
@@ -155,15 +154,14 @@ class TypeChecker(Visitor):
         # every other function
         else:
             # find the definition of the function
-            funcdef = None
-            for f in self.rootnode.funcdefs:
-                if f.name == node.name:
-                    funcdef = f
-                    break
+            funcdef = self.symbols.function(
+                node.name) or self.externals.get(node.name)
 
             if not funcdef:
                 # we did not find a definition for this function. It is probably an extern function
-                # there is no type checking to do
+                # there is no type checking to do. But the arguments still need to get their types.
+                for arg in node.args:
+                    self.visit(arg)
                 node.type = None
                 return
 
@@ -1,6 +1,7 @@
 import dbc.ast as ast
 from dbc.visit import Visitor
 from dbc.errors import CheckError
+from dbc.symbols import SymbolTable
 from collections import OrderedDict
 
 
@@ -8,13 +9,18 @@ class VariableChecker(Visitor):
     """ This class extends Visitor and is responsible for two things:
     - Extracting (global and local) variable and constant declarations and annotating the AST with information about them
     - Checking semantic rules regarding variables. (must be declared before used, can only be declared once etc.)
+    It also builds the symbol-table of the programm (see dbc.symbols) and interns the names used in the AST.
     """
 
-    def __init__(self):
+    def __init__(self, requiremain=True):
+        """ If true, the programm must contain a main-function. Compilation-units that are only linked into a programm (see dbc -c) do not need one"""
+        self.requiremain = requiremain
+        """ The symbol-table that is built for the programm"""
+        self.symbols = SymbolTable()
         """ Contains all global variables declared in the programm and their default values. See ast.Programm"""
-        self.globalvars = dict()
+        self.globalvars = self.symbols.globalvars
         """ Contains all global variables declared in the programm and their types. See ast.Programm"""
-        self.globalvartypes = dict()
+        self.globalvartypes = self.symbols.globalvartypes
         """ Contains all local variables and their default values of the function that is currently beeing analysed. Is ordered by declaratin-order. See ast.FuncDef"""
         self.localvars = OrderedDict()
         """ Contains all local variables and their types of the function that is currently beeing analysed."""
@@ -34,16 +40,15 @@ class VariableChecker(Visitor):
         for glob in node.globaldefs:
             self.visit(glob)
         # then analyse all defined functions
-        definedfunctions = set()
         for func in node.funcdefs:
             self.visit(func)
             # can not have two functions with the same name
-            if func.name in definedfunctions:
+            if self.symbols.function(func.name):
                 raise CheckError(
                     "Function {} has previously been defined.".format(func.name), func)
-            definedfunctions.add(func.name)
+            self.symbols.define(func)
 
-        if not "main" in definedfunctions:
+        if self.requiremain and not self.symbols.function("main"):
             raise CheckError(
                 "Every programm needs to have a function called 'main'", None)
 
@@ -51,8 +56,10 @@ class VariableChecker(Visitor):
         node.globalvars = self.globalvars
         node.globalvartypes = self.globalvartypes
         node.constants = self.constants
+        node.symbols = self.symbols
 
     def visitVar(self, node):
+        node.name = self.symbols.intern(node.name)
         # make sure variables are only used AFTER they have been declared
         if node.name not in self.globalvars and node.name not in self.localvars:
             raise CheckError(
@@ -64,6 +71,7 @@ class VariableChecker(Visitor):
         self.constantcounter += 1
 
     def visitAssign(self, node):
+        node.name = self.symbols.intern(node.name)
         # make sure variables are only used AFTER they have been declared
         if node.name not in self.globalvars and node.name not in self.localvars:
             raise CheckError(
@@ -71,10 +79,7 @@ class VariableChecker(Visitor):
         self.visit(node.value)
 
     def visitCall(self, node):
-        # because of limitations in the code-generator for x86-64 assembler function calls can only take 6 or less arguments
-        if len(node.args) > 6:
-            raise CheckError(
-                "Function-calls can take at most 6 arguments", node)
+        node.name = self.symbols.intern(node.name)
         for arg in node.args:
             self.visit(arg)
 
@@ -83,6 +88,7 @@ class VariableChecker(Visitor):
         # all following visitLocaldef() calls will write their variables to this dict
         self.localvars = OrderedDict()
         self.localvartypes = OrderedDict()
+        node.args = [self.symbols.intern(arg) for arg in node.args]
         for i, arg in enumerate(node.args):
             self.localvars[arg] = 0
             self.localvartypes[arg] = node.argtypes[i]
@@ -98,6 +104,7 @@ class VariableChecker(Visitor):
                 "Functions must end with a return-statement", node)
 
     def visitGlobaldef(self, node):
+        node.name = self.symbols.intern(node.name)
         # make sure global variables are only declared once
         if node.name in self.globalvars:
             raise CheckError(
@@ -111,6 +118,7 @@ class VariableChecker(Visitor):
         self.globalvartypes[node.name] = node.type
 
     def visitLocaldef(self, node):
+        node.name = self.symbols.intern(node.name)
         # make sure global variables are only declared once per function
         if node.name in self.globalvars:
             raise CheckError(
@@ -1,98 +1,289 @@
 """ This is the entry-point for the compiler console application. After installation it can be invoked by typing 'dbc' to the console """
-import dbc.tokenize as tokenize
 import dbc.parse as parse
-from dbc.visit import VisitorError
-from dbc.formatasm import format
-import dbc.generateasm as generateasm
-import dbc.generatec as generatec
-from dbc.checkvariables import VariableChecker
-from dbc.checktypes import TypeChecker
-from dbc.errors import CheckError
+import dbc.batch as batch
+import dbc.driver as driver
+import dbc.stats as statistics
+import dbc.profile as profile
+from dbc.errors import ExecutionError
 
 import sys
 import argparse
-import subprocess
 import os.path
 
+""" Input-files with these extensions are not compiled but passed to the linker as they are"""
+linkerinputs = [".o", ".a", ".s", ".asm", ".so"]
+
+
+class ArgumentParser(argparse.ArgumentParser):
+    """ An ArgumentParser that writes all it's messages (help, usage-errors) to the given stream instead of stdout/stderr.
+    This way the compile-server can send them back to the client """
+
+    def __init__(self, out, **kwargs):
+        self.out = out
+        super().__init__(**kwargs)
+
+    def _print_message(self, message, file=None):
+        if message:
+            self.out.write(message)
+
 
 def main(args=None):
-    """ Main entrypoint for the DBASIC compiler CLI application 
+    """ Main entrypoint for the DBASIC compiler CLI application
 
         :params args: Optional command line arguments (mainly used for testing). If None, sys.argv is used.
     """
+    status = run(args)
+    if status:
+        sys.exit(status)
+
+
+def run(args=None, out=None, cwd=None, server=False):
+    """ Run the compiler with the given command-line arguments
+
+        :params args: The command line arguments. If None, sys.argv is used.
+        :params out: The stream to write all output to. Defaults to sys.stdout
+        :params cwd: The directory relative paths are relative to. Defaults to the current working directory.
+        :params server: True if the compile-server runs the compiler for a client (see dbc.server)
+        :returns: The exit-status (0 on success)
+    """
+    out = out or sys.stdout
+    args = sys.argv[1:] if args is None else args
+    cwd = cwd or os.getcwd()
+    # subcommands are handled separately
+    if args and args[0] == "profile-report":
+        return profilereport(args[1:], out, cwd)
+    if args and args[0] == "run":
+        return runprogramm(args[1:], out, cwd)
+
     # setup CLI-Arguments
-    parser = argparse.ArgumentParser(description='Compile DBASIC file')
-    parser.add_argument('infile', type=str, help='The file to compile')
+    parser = ArgumentParser(out, description='Compile DBASIC file')
+    parser.add_argument('infiles', type=str, nargs="*",
+                        help='The files to compile. Can also be directories (all .basic files in it) or globs. ' +
+                        'Object- and assembler-files (.o, .a, .so, .s, .asm) are passed to the linker as they are')
     parser.add_argument('-o', "--outfile", type=str,
                         help="The file to write to")
     parser.add_argument('-t', "--type", type=str, default="binary",
                         help="Type of output to generate. Can be asm, c, binary. Default: binary")
+    parser.add_argument('-c', "--compile", action="store_true",
+                        help="Only compile the input files to object-files (.o), do not link them")
+    parser.add_argument("--separate", action="store_true",
+                        help="Every input file is a complete programm. Build an executable for every file instead of linking them together")
+    parser.add_argument('-j', "--jobs", type=int, default=1,
+                        help="Number of files to compile in parallel. 0 uses all available cpus. Default: 1")
+    parser.add_argument("--backend", type=str, default="asm",
+                        help="Code-generator used to build binaries and objects. Can be asm or c (compiles the generated c-code using gcc). Default: asm")
+    parser.add_argument('-O', "--optimize", type=int,
+                        help="Optimization level (like -O2). For the asm-backend, -O1 enables constant folding and propagation, loop-optimizations, common subexpression elimination, dead-code elimination and keeps the most used variables in callee-saved registers and -O2 also specializes functions for constant arguments and unrolls counted loops. " +
+                        "Default: 0 for the asm-backend, 2 for the c-backend")
+    parser.add_argument("--unroll", type=int,
+                        help="Unroll counted loops this many times (asm-backend, -O1 and higher). 1 disables unrolling. Default: 4 for -O2 and higher, 1 for -O1")
     parser.add_argument('--debug', type=bool, help="Enable debugging output")
-    parser.add_argument('-g', "--gccargs", type=str,
+    parser.add_argument('-g', "--debug-info", action="store_true",
+                        help="Generate debug-information (source-lines, call-frames), so debuggers and profilers like gdb and perf can show DBASIC source-lines")
+    parser.add_argument("--gccargs", type=str,
                         help="Additional args for gcc")
+    parser.add_argument("--time-passes", action="store_true",
+                        help="Report the time and memory needed by every stage of the compiler")
+    parser.add_argument("--stats", action="store_true",
+                        help="Report statistics about the compiled programm (number of tokens, AST-nodes, instructions etc.)")
+    parser.add_argument("--stats-format", type=str, default="text",
+                        help="Format of the --time-passes and --stats report. Can be text or json. Default: text")
+    parser.add_argument("--stats-file", type=str,
+                        help="Write the --time-passes and --stats report to this file instead of stdout")
+    parser.add_argument("--profile", action="store_true",
+                        help="Instrument the programm to count calls, loop-iterations and branches and measure the time spent in every function. " +
+                        "The instrumented programm writes the profile to $DBC_PROFILE (default: dbc.profile) when it exits. See: dbc profile-report")
+    parser.add_argument("--use-profile", type=str,
+                        help="Optimize the programm using a profile recorded by a programm built with --profile (inline hot calls, lay out the hot paths of IFs)")
+    parser.add_argument("--memoize", action="store_true",
+                        help="Cache the results of pure recursive functions (that only depend on their arguments) in a fixed-size table, " +
+                        "so they are not computed again for the same arguments")
+    parser.add_argument("--omit-frame-pointer", action="store_true",
+                        help="Do not keep a frame-pointer in %%rbp in any function (asm-backend). Without it, debuggers and profilers can not walk the stack, so it is ignored with -g. " +
+                        "With -O1 and higher, functions that do not call other functions never have one")
+    parser.add_argument("--server", action="store_true",
+                        help="Start a compile-server that compiles the files it receives from dbc-client")
+    parser.add_argument("--socket", type=str,
+                        help="The unix-socket the compile-server listens on. Default: $DBC_SOCKET, $XDG_RUNTIME_DIR/dbc.sock or /tmp/dbc-<uid>.sock")
+
+    try:
+        args = parser.parse_args(args)
+    except SystemExit as e:
+        # argparse exits on --help and on invalid arguments
+        return e.code
+    gccargs = args.gccargs.split(" ") if args.gccargs else []
+
+    if args.server:
+        import dbc.server
+        dbc.server.serve(args.socket)
+        return 0
+
+    # enable debug-logging if the user wants to
+    if args.debug:
+        if server:
+            # the debug-logging is enabled for the whole process and printed to it's stdout. It would never reach the client, but
+            # end up in the output of the server for every following request
+            print("--debug is not supported by the compile-server. Run dbc directly", file=out)
+            return 1
+        parse.debug = True
+
+    if args.type not in ["asm", "c", "binary"]:
+        print("Unknown target type", file=out)
+        return 1
+
+    if args.backend not in ["asm", "c"]:
+        print("Unknown backend", file=out)
+        return 1
 
-    args = parser.parse_args(args)
+    if args.profile and (args.type == "c" or args.backend != "asm"):
+        print("--profile is only supported by the asm-backend", file=out)
+        return 1
 
-    # generate the output filename if not explicitly given
-    if not args.outfile:
-        if not "." in args.infile:
-            print("infile needs to have a file-extension")
-            sys.exit(1)
-        fname, _ = os.path.splitext(args.infile)
-        if args.type == "binary":
-            args.outfile = fname
+    useprofile = None
+    if args.use_profile:
+        try:
+            useprofile = profile.load(os.path.join(cwd, args.use_profile))
+        except profile.ProfileError as e:
+            print(e, file=out)
+            return 1
+
+    # make all paths relative to the given working directory
+    infiles = batch.expandinputs(
+        [os.path.join(cwd, f) for f in args.infiles])
+    outfile = os.path.join(cwd, args.outfile) if args.outfile else None
+    sources = [f for f in infiles if os.path.splitext(f)[
+        1] not in linkerinputs]
+    objects = [f for f in infiles if f not in sources]
+
+    if not infiles:
+        print("No input files found", file=out)
+        return 1
+
+    for infile in sources:
+        if not "." in os.path.basename(infile):
+            print("infile needs to have a file-extension", file=out)
+            return 1
+
+    linking = args.type == "binary" and not args.compile and not args.separate
+    if outfile and not linking and len(sources) > 1:
+        print("-o can only be used with multiple input files when linking them together", file=out)
+        return 1
+
+    if args.unroll is not None and args.unroll < 1:
+        print("The unroll-factor must be at least 1", file=out)
+        return 1
+
+    if args.stats_format not in ["text", "json"]:
+        print("Unknown stats format", file=out)
+        return 1
+
+    stats = None
+    if args.time_passes or args.stats:
+        # measuring memory-usage slows down the compiler. Only do it if the timings are needed anyway
+        stats = statistics.Statistics(memory=args.time_passes)
+
+    options = driver.Options(args.backend, args.optimize, args.profile, args.debug_info, args.unroll, args.memoize,
+                             args.omit_frame_pointer)
+    errors = batch.build(sources, objects, options, args.type, args.compile, outfile, gccargs, args.separate, args.jobs,
+                         args.debug, stats, useprofile)
+
+    if stats:
+        if args.stats_format == "json":
+            report = stats.json(args.time_passes, args.stats) + "\n"
         else:
-            args.outfile = fname + "." + args.type
+            report = stats.report(args.time_passes, args.stats)
+        if args.stats_file:
+            with open(os.path.join(cwd, args.stats_file), "w") as f:
+                f.write(report)
+        else:
+            out.write(report)
+
+    # report the errors of all files that could not be compiled
+    for infile, error in errors:
+        print("{}: {}".format(os.path.relpath(infile, cwd), error), file=out)
+    return 1 if errors else 0
+
+
+def profilereport(args, out, cwd):
+    """ The profile-report subcommand: Print a report of a profile written by a programm compiled with --profile"""
+    parser = ArgumentParser(out, prog="dbc profile-report",
+                            description='Show the profile of a programm compiled with --profile')
+    parser.add_argument('profile', type=str, nargs="?", default="dbc.profile",
+                        help="The profile to show. Default: dbc.profile")
+    parser.add_argument("--annotate", action="store_true",
+                        help="Show the source-files with the execution-count of every line")
+    parser.add_argument("--top", type=int, default=20,
+                        help="Number of hottest lines to show. Default: 20")
+    try:
+        args = parser.parse_args(args)
+    except SystemExit as e:
+        return e.code
+    try:
+        entries = profile.load(os.path.join(cwd, args.profile))
+    except profile.ProfileError as e:
+        print(e, file=out)
+        return 1
+    out.write(profile.report(entries, args.annotate, args.top, cwd))
+    return 0
+
 
-    # open the source file
-    with open(args.infile, "r") as f:
+def runprogramm(args, out, cwd):
+    """ The run subcommand: Compile the programm and run it inside this process (see dbc.jit) or run it with an interpreter
+    (see dbc.interpret). Returns the result of main() as exit-status"""
+    parser = ArgumentParser(out, prog="dbc run",
+                            description='Compile a DBASIC programm and run it right away, without building an executable')
+    parser.add_argument('infiles', type=str, nargs="+",
+                        help="The files of the programm. Can also be directories or globs (like for dbc). Object-files (.o) are loaded too")
+    parser.add_argument("--backend", type=str, choices=["asm", "vm", "closures", "tree"], default="asm",
+                        help="How to run the programm. asm: Compile it to machine-code (default). vm: Compile it to bytecode and " +
+                        "interpret that. closures: Compile it to python-closures. tree: Interpret the syntax-tree (slow). " +
+                        "The interpreters need no C-toolchain, but can not call C-functions")
+    parser.add_argument('-O', "--optimize", type=int,
+                        help="Optimization level (see dbc --help). Default: 0")
+    parser.add_argument("--memoize", action="store_true",
+                        help="Cache the results of pure recursive functions (see dbc --help). Only for the asm-backend")
+    parser.add_argument("--omit-frame-pointer", action="store_true",
+                        help="Do not keep a frame-pointer in %%rbp in any function. Only for the asm-backend")
+    try:
+        args = parser.parse_args(args)
+    except SystemExit as e:
+        return e.code
+    infiles = batch.expandinputs([os.path.join(cwd, f) for f in args.infiles])
+    objects = [f for f in infiles if f.endswith(".o")]
+    sources = [f for f in infiles if f not in objects]
+    if not sources:
+        print("No input files found", file=out)
+        return 1
+    if args.backend == "asm":
+        # only import the JIT when it is needed. It maps memory and loads the C-library when it is imported
+        import dbc.jit as jit
+        errors = (jit.JITError,)
 
-        # enable debug-logging if the user wants to
-        if args.debug:
-            parse.debug = True
+        def load():
+            return jit.load(sources, objects, optimize=args.optimize,
+                            memoize=args.memoize, omitframepointer=args.omit_frame_pointer, wholeprogramm=True)
+    else:
+        import dbc.interpret as interpret
+        import dbc.vm as vm
+        import dbc.closures as closures
+        errors = (ExecutionError,)
+        if objects:
+            print("Object-files can only be loaded by the asm-backend", file=out)
+            return 1
+        engine = {"vm": vm.Machine, "closures": closures.ClosureCompiler,
+                  "tree": interpret.Interpreter}[args.backend]
 
+        def load():
+            return interpret.load(sources, optimize=args.optimize, engine=engine, wholeprogramm=True)
+    try:
+        programm = load()
+    except batch.compileerrors + errors as e:
+        print(e, file=out)
+        return 1
+    with programm:
         try:
-            # tokenize the input
-            tokenizer = tokenize.Tokenizer(f.read())
-            if args.debug:
-                print(tokenizer.tokens)
-            # parse tokens into AST
-            syntaxtree = parse.parse(tokenizer)
-            # annotate the tree with variable information and check for variable-relatet semantic errors
-            VariableChecker().check(syntaxtree)
-            # check for type-errors
-            TypeChecker().check(syntaxtree)
-
-            # choose a code-generator based on the users wanted output-format
-            if args.type == "c":
-                generator = generatec.CGenerator()
-            elif args.type == "asm" or args.type == "binary":
-                generator = generateasm.ASMGenerator()
-            else:
-                print("Unknown target type")
-                sys.exit(1)
-
-            # generate code from the ast
-            code = generator.generate(syntaxtree)
-
-            # format the asm-code a little to make it more readable
-            if args.type == "asm":
-                code = format(code)
-
-        except (parse.ParserError, VisitorError, CheckError) as e:
-            # catch errors that may occur during parsing, checking and code-generation
-            print(e)
-            sys.exit(1)
-
-        if args.type == "c" or args.type == "asm":
-            # if the users does not want a binary as output we are done now. Just write the code to a file
-            with open(args.outfile, "w") as of:
-                of.write(code)
-            return
-
-        if args.type == "binary":
-            # if the user wants a binary we use gcc to assemble and link the generated assembly-code
-            cmds = ["gcc", "-o", args.outfile, "-xassembler", "-no-pie", "-"]
-            if args.gccargs:
-                cmds = cmds + args.gccargs.split(" ")
-            subprocess.run(cmds, input=code.encode())
+            return programm.main()
+        except ExecutionError as e:
+            # the interpreters report what would crash a compiled programm
+            print(e, file=out)
+            return 1
@@ -0,0 +1,61 @@
+""" A thin client for the DBASIC compile-server (see dbc.server). It takes the same arguments as dbc, but lets the already running
+    server do the work. This saves the start-up time of the compiler (importing all the modules etc.), which is most of the
+    time needed to compile small programms.
+    To keep the start-up time of the client itself as small as possible it only imports what it absolutely needs.
+    If no server is running the client compiles the files itself.
+"""
+import os
+import sys
+import json
+import socket
+
+
+def socketpath():
+    """ Returns the path of the unix-socket the server listens on. Can be set using the environment-variable DBC_SOCKET"""
+    path = os.environ.get("DBC_SOCKET")
+    if path:
+        return path
+    rundir = os.environ.get("XDG_RUNTIME_DIR")
+    if rundir:
+        return os.path.join(rundir, "dbc.sock")
+    return "/tmp/dbc-{}.sock".format(os.getuid())
+
+
+def request(args, cwd=None, path=None):
+    """ Send a compile-request to the server
+
+    :params args: The command-line arguments for dbc
+    :params cwd: The directory relative paths in args are relative to. Defaults to the current working directory
+    :params path: The path of the server's socket. Defaults to socketpath()
+    :returns: A tuple of the exit-status and the output of the compilation
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(path or socketpath())
+        sock.sendall(json.dumps(
+            {"args": args, "cwd": cwd or os.getcwd()}).encode() + b"\n")
+        response = b""
+        while True:
+            data = sock.recv(65536)
+            if not data:
+                break
+            response += data
+    response = json.loads(response.decode())
+    return response["status"], response["output"]
+
+
+def main(args=None):
+    """ Entrypoint for the dbc-client console application """
+    args = sys.argv[1:] if args is None else args
+    if args and args[0] == "run":
+        # the programm needs the terminal of the client. Compile and run it here
+        import dbc.cli
+        return dbc.cli.main(args)
+    try:
+        status, output = request(args)
+    except (FileNotFoundError, ConnectionRefusedError):
+        # there is no server running. Do the work ourselves
+        import dbc.cli
+        return dbc.cli.main(args)
+    sys.stdout.write(output)
+    if status:
+        sys.exit(status)
@@ -0,0 +1,326 @@
+""" An interpreter that compiles the AST into python-closures (see 'dbc run --backend closures'). It is an engine for dbc.interpret.Programm.
+
+    The ClosureCompiler visits every node of the checked AST exactly once and returns a closure that does what the node does.
+    The closure of an expression takes the frame (the list of the values of the local variables) and returns the value of the expression.
+    The closure of a statement takes the frame and returns the value of a RETURN it executed (or None).
+    All decisions are made while compiling, so running the programm never dispatches on the type of a node:
+    - Local variables are resolved to their position in the frame (the position in FuncDef.localvars), globals to their position in
+      the list of the global variables
+    - Constants are bound to the closures
+    - The closure of an operation is picked for it's operator and for the kinds of it's operands. Local variables and constants are
+      read directly by the closure of the operation, instead of calling closures of their own
+    - Operations are fused into the closures of the assignments, IFs and WHILEs they are the value or the condition of
+    - Blocks that contain no RETURN do not check the results of their statements
+
+    The closures of the operations only differ in the operator and in how they read their operands. So they are created from a few
+    templates (see template()): The code of every combination of template, operator and kinds of operands is compiled once, the first
+    time it is needed. Compiling a programm only binds the positions, constants and closures to these functions.
+
+    Every DBASIC-call is a call of a python-function (and of the closures of the statements it executes), so the depth of the
+    recursion is limited by python's recursion-limit.
+"""
+import functools
+
+import dbc.ast as ast
+from dbc.visit import Visitor
+from dbc.constprop import wrap
+from dbc.interpret import divide, printformat, unescape, INTMIN
+import dbc.interpret as interpret
+
+""" The biggest value of an INT"""
+INTMAX = -INTMIN - 1
+
+""" How the closures read the operands a and b of every kind. A local variable is given by it's position in the frame,
+    a constant by it's value and every other expression by it's closure"""
+operands = {"slot": "f[{}]", "const": "{}", "closure": "{}(f)"}
+
+""" The templates of the closures that compute a binary operation. Name to the code of the function that creates the closure.
+    {exp} is replaced by the expression that computes the operation"""
+templates = {
+    # the value of an expression
+    "value": """
+def create(a, b):
+    return lambda f: {exp}
+""",
+    # the assignment of an expression to a local variable (at position t)
+    "assign": """
+def create(a, b, t):
+    def assign(f):
+        f[t] = {exp}
+    return assign
+""",
+    # an IF without ELSE
+    "if": """
+def create(a, b, then):
+    def run(f):
+        if {exp}:
+            return then(f)
+    return run
+""",
+    # an IF with ELSE
+    "ifelse": """
+def create(a, b, then, otherwise):
+    def run(f):
+        if {exp}:
+            return then(f)
+        return otherwise(f)
+    return run
+""",
+    # a WHILE that contains no RETURN
+    "while": """
+def create(a, b, body):
+    def run(f):
+        while {exp}:
+            body(f)
+    return run
+""",
+    # a WHILE that contains a RETURN
+    "whilereturn": """
+def create(a, b, body):
+    def run(f):
+        while {exp}:
+            result = body(f)
+            if result is not None:
+                return result
+    return run
+""",
+}
+
+
+@functools.lru_cache(maxsize=None)
+def template(name, op, kind1, kind2):
+    """ Returns the function that creates the closures of the given template (see templates) for the operator (see ast.Binary.op)
+    and the kinds of it's operands (see operands)"""
+    left = operands[kind1].format("a")
+    right = operands[kind2].format("b")
+    if op == "/":
+        exp = "divide({}, {})".format(left, right)
+    elif op in ["+", "-", "*"]:
+        # only results that overflowed have to wrap around
+        exp = "v if INTMIN <= (v := {} {} {}) <= INTMAX else wrap(v)".format(
+            left, op, right)
+    else:
+        exp = "{} {} {}".format(left, op, right)
+    namespace = {"INTMIN": INTMIN, "INTMAX": INTMAX,
+                 "wrap": wrap, "divide": divide}
+    exec(templates[name].format(exp=exp), namespace)
+    return namespace["create"]
+
+
+def returns(statements):
+    """ Returns true if the statements (or the blocks nested in them) contain a RETURN"""
+    for statement in statements:
+        t = type(statement)
+        if t == ast.Return:
+            return True
+        if t == ast.If and (returns(statement.statements) or returns(statement.elsestatements or [])):
+            return True
+        if t == ast.While and returns(statement.statements):
+            return True
+    return False
+
+
+class Function:
+    """ A compiled function"""
+
+    def __init__(self, funcdef):
+        """ The initial values of the local variables behind the arguments"""
+        self.padding = [0] * (len(funcdef.localvars) - len(funcdef.args))
+        """ The closure of the body of the function. Takes the frame (the arguments followed by the padding) and returns the result"""
+        self.body = None
+
+
+class ClosureCompiler(Visitor):
+    """ The engine that compiles the (checked) AST into closures when it is created. The visitXXX methods return the closure of the node """
+
+    def __init__(self, syntaxtree, console):
+        super().__init__()
+        self.console = console
+        """ The compiled functions. Dict of name to Function. All exist before the first function is compiled, so the closures of the
+        calls can bind them"""
+        self.functions = {f.name: Function(f) for f in syntaxtree.funcdefs}
+        """ Dict of the name of a global variable to it's position in self.globals"""
+        self.globalslots = {name: i for i, name in enumerate(syntaxtree.globalvars)}
+        """ The values of the global variables"""
+        self.globals = [int(value) for value in syntaxtree.globalvars.values()]
+        """ Dict of the name of a local variable of the compiled function to it's position in the frame"""
+        self.slots = None
+        self.visit(syntaxtree)
+
+    def execute(self, name, args):
+        """ Run the function with the given name and arguments (ints). Returns it's result"""
+        func = self.functions[name]
+        return func.body(list(args) + func.padding)
+
+    def operand(self, node):
+        """ Returns the kind of the operand (see operands) and what it is given by: the position of the variable, the value of the
+        constant or the closure"""
+        if type(node) == ast.Var and node.name in self.slots:
+            return "slot", self.slots[node.name]
+        if type(node) == ast.Const:
+            return "const", int(node.value)
+        return "closure", self.visit(node)
+
+    def binary(self, name, node, *args):
+        """ Returns the closure of the given template (see templates) for the binary operation node.
+        args are the arguments of the template behind the operands"""
+        kind1, val1 = self.operand(node.val1)
+        kind2, val2 = self.operand(node.val2)
+        return template(name, node.op, kind1, kind2)(val1, val2, *args)
+
+    def block(self, statements):
+        """ Returns the closure that executes the statements"""
+        closures = [self.visit(statement) for statement in statements]
+        if len(closures) == 1:
+            return closures[0]
+        if not returns(statements):
+            if len(closures) == 2:
+                first, second = closures
+
+                def run(f):
+                    first(f)
+                    second(f)
+                return run
+
+            def run(f):
+                for statement in closures:
+                    statement(f)
+            return run
+
+        def run(f):
+            for statement in closures:
+                result = statement(f)
+                if result is not None:
+                    return result
+        return run
+
+    def visitProgramm(self, node):
+        for func in node.funcdefs:
+            self.visit(func)
+
+    def visitFuncdef(self, node):
+        self.slots = {name: i for i, name in enumerate(node.localvars)}
+        self.functions[node.name].body = self.block(node.statements)
+
+    def visitUnary(self, node):
+        if type(node.val) == ast.Const:
+            value = wrap(-int(node.val.value))
+            return lambda f: value
+        val = self.visit(node.val)
+        return lambda f: wrap(-val(f))
+
+    def visitBinary(self, node):
+        return self.binary("value", node)
+
+    def visitVar(self, node):
+        if node.name in self.slots:
+            slot = self.slots[node.name]
+            return lambda f: f[slot]
+        globs = self.globals
+        slot = self.globalslots[node.name]
+        return lambda f: globs[slot]
+
+    def visitConst(self, node):
+        value = int(node.value)
+        return lambda f: value
+
+    def visitStr(self, node):
+        value = unescape(node.value)
+        return lambda f: value
+
+    def visitAssign(self, node):
+        if node.name not in self.slots:
+            globs = self.globals
+            slot = self.globalslots[node.name]
+            value = self.visit(node.value)
+
+            def store(f):
+                globs[slot] = value(f)
+            return store
+        slot = self.slots[node.name]
+        if type(node.value) == ast.Binary:
+            return self.binary("assign", node.value, slot)
+        value = self.visit(node.value)
+
+        def assign(f):
+            f[slot] = value(f)
+        return assign
+
+    def visitLocaldef(self, node):
+        return self.visitAssign(node)
+
+    def visitIf(self, node):
+        then = self.block(node.statements)
+        otherwise = node.elsestatements and self.block(node.elsestatements)
+        if type(node.exp) == ast.Binary:
+            if otherwise:
+                return self.binary("ifelse", node.exp, then, otherwise)
+            return self.binary("if", node.exp, then)
+        condition = self.visit(node.exp)
+        if otherwise:
+            return lambda f: then(f) if condition(f) else otherwise(f)
+        return lambda f: then(f) if condition(f) else None
+
+    def visitWhile(self, node):
+        body = self.block(node.statements)
+        name = "whilereturn" if returns(node.statements) else "while"
+        if type(node.exp) == ast.Binary:
+            return self.binary(name, node.exp, body)
+        # any other condition is true, if it is not FALSE
+        return template(name, "!=", "closure", "const")(self.visit(node.exp), 0, body)
+
+    def visitReturn(self, node):
+        if not node.expression:
+            return lambda f: 0
+        return self.visit(node.expression)
+
+    def visitCall(self, node):
+        console = self.console
+        if node.name == "input":
+            call = lambda f: console.input()  # noqa: E731
+        elif node.name == "print":
+            format = printformat(node.args[0].value)
+            args = [self.visit(arg) for arg in node.args[1:]]
+
+            def call(f):
+                console.print(format, [arg(f) for arg in args])
+        else:
+            call = self.call(self.functions[node.name], [
+                             self.visit(arg) for arg in node.args])
+        if not node.isStatement:
+            return call
+
+        # the result of a call that is a statement must not be mistaken for the result of a RETURN
+        def statement(f):
+            call(f)
+        return statement
+
+    def call(self, func, args):
+        """ Returns the closure that calls the Function with the given arguments (closures)"""
+        padding = func.padding
+        # the most frequent numbers of arguments do not need a loop
+        if len(args) == 0:
+            return lambda f: func.body(padding[:])
+        if len(args) == 1:
+            a, = args
+            return lambda f: func.body([a(f)] + padding)
+        if len(args) == 2:
+            a, b = args
+            return lambda f: func.body([a(f), b(f)] + padding)
+        return lambda f: func.body([arg(f) for arg in args] + padding)
+
+
+def load(sources, requiremain=True, optimize=None, console=None):
+    """ Load the given DBASIC-sources into the closure-interpreter. Returns a dbc.interpret.Programm (see dbc.interpret.load())"""
+    return interpret.load(sources, requiremain, optimize, console, ClosureCompiler)
+
+
+def loadsource(source, requiremain=True, optimize=None, console=None):
+    """ Load the given DBASIC source-code into the closure-interpreter. Returns a dbc.interpret.Programm, whose functions can be called
+    with INTs and BOOLs (see dbc.interpret.Programm.call()). With requiremain=False the source can be a library without main()"""
+    return interpret.loadsource(source, requiremain, optimize, console, ClosureCompiler)
+
+
+def run(source, optimize=None, console=None):
+    """ Run the given DBASIC source-code (a complete programm) with the closure-interpreter. Returns the result of main()"""
+    return interpret.run(source, optimize, console, ClosureCompiler)
@@ -0,0 +1,301 @@
+""" Constant folding, interprocedural constant propagation and function specialization (cloning). Is run for the asm-backend with -O1 or higher.
+    - Constant folding: Operations on constants are computed at compile-time (with the 64-bit wrap-around of the generated code).
+      IFs with a constant condition are replaced by the block that is executed, WHILEs whose condition is FALSE are removed.
+    - Interprocedural constant propagation: If every call of a function passes the same constant for an argument (and the function
+      does not assign the argument), the argument is replaced by the constant in the function's body.
+    - Specialization (-O2): Calls that pass constants get their own copy (clone) of the called function, in which the constant arguments
+      are propagated, if that makes the function smaller. The clones of all functions together may not grow the programm by more than
+      clonebudget.
+
+    Propagation and specialization need to know all calls of a function, so they only run if the compilation-unit is the whole programm.
+    The call-graph is built from Programm.funcdefs (see dbc.purity.functioninfos()).
+
+    The clones are named <function>_<number>. DBASIC identifiers can only contain letters, so they never clash with the functions of the programm.
+"""
+import copy
+
+import dbc.ast as ast
+from dbc.visit import Visitor
+from dbc.optimizeloops import ExpressionRewriter, LoopInfo
+
+""" The clones may add at most this fraction of the size (in AST-nodes) of the programm ..."""
+clonefraction = 0.25
+""" ... but at least this many nodes"""
+clonebudget = 200
+
+
+def wrap(value):
+    """ Returns the value as 64-bit signed integer, like the generated code computes it"""
+    return (value + 2**63) % 2**64 - 2**63
+
+
+def compute(op, a, b):
+    """ Returns the result of the binary operation on the (integer) constants a and b, or None if it can not be computed at compile-time"""
+    if op == "+":
+        return wrap(a + b)
+    if op == "-":
+        return wrap(a - b)
+    if op == "*":
+        return wrap(a * b)
+    if op == "/":
+        # division by zero (and the overflow of the smallest number divided by -1) must still fail when the programm runs
+        if b == 0 or (a == -2**63 and b == -1):
+            return None
+        # idiv rounds towards zero
+        quotient = abs(a) // abs(b)
+        return quotient if (a < 0) == (b < 0) else -quotient
+    if op == "&":
+        return a & b
+    if op == "|":
+        return a | b
+    comparisons = {"==": a == b, "!=": a != b, "<": a < b,
+                   ">": a > b, "<=": a <= b, ">=": a >= b}
+    if op in comparisons:
+        return int(comparisons[op])
+    return None
+
+
+class Size(Visitor):
+    """ Counts the AST-nodes of a part of the AST"""
+
+    def __init__(self):
+        self.size = 0
+        super().__init__()
+
+    def visit(self, node):
+        self.size += 1
+        return self.dispatch[type(node)](self, node)
+
+
+def size(node):
+    counter = Size()
+    counter.visit(node)
+    return counter.size
+
+
+class Folder(ExpressionRewriter):
+    """ Folds the constant expressions of a function and removes the blocks that are never executed because of constant conditions"""
+
+    def __init__(self):
+        """ Statistics: The number of folded expressions and statements"""
+        self.folded = 0
+        super().__init__()
+
+    def replace(self, node):
+        t = type(node)
+        if t == ast.Binary:
+            node.val1 = self.expression(node.val1)
+            node.val2 = self.expression(node.val2)
+            if type(node.val1) == ast.Const and type(node.val2) == ast.Const:
+                value = compute(node.op, int(
+                    node.val1.value), int(node.val2.value))
+                if value is not None:
+                    self.folded += 1
+                    return ast.Const(str(value), node.type, node.line)
+            return node
+        if t == ast.Unary:
+            node.val = self.expression(node.val)
+            if type(node.val) == ast.Const and node.op == "-":
+                self.folded += 1
+                return ast.Const(str(wrap(-int(node.val.value))), node.type, node.line)
+            return node
+        return None
+
+    def block(self, statements):
+        """ Fold the given statements. Returns the statements that replace them"""
+        result = []
+        for statement in statements:
+            self.visit(statement)
+            if type(statement) == ast.If:
+                if type(statement.exp) == ast.Const:
+                    # only one of the blocks is ever executed
+                    self.folded += 1
+                    taken = statement.statements if statement.exp.value != "0" else statement.elsestatements
+                    result += self.block(taken or [])
+                    continue
+                statement.statements = self.block(statement.statements)
+                if statement.elsestatements:
+                    statement.elsestatements = self.block(
+                        statement.elsestatements)
+            elif type(statement) == ast.While:
+                if type(statement.exp) == ast.Const and statement.exp.value == "0":
+                    self.folded += 1
+                    continue
+                statement.statements = self.block(statement.statements)
+            result.append(statement)
+        return result
+
+    def visitIf(self, node):
+        # the blocks are handled by block()
+        node.exp = self.expression(node.exp)
+
+    def visitWhile(self, node):
+        node.exp = self.expression(node.exp)
+
+
+class Substitution(ExpressionRewriter):
+    """ Replaces the reads of some variables by constants"""
+
+    def __init__(self, constants):
+        """ Dict of variable-name to ast.Const"""
+        self.constants = constants
+        super().__init__()
+
+    def replace(self, node):
+        if type(node) == ast.Var and node.name in self.constants:
+            const = self.constants[node.name]
+            return ast.Const(const.value, const.type, node.line)
+        return None
+
+
+class CallSites(Visitor):
+    """ Collects all calls of a part of the AST. Dict of function-name to list of ast.Call"""
+
+    def __init__(self):
+        self.calls = dict()
+        super().__init__()
+
+    def visitCall(self, node):
+        self.calls.setdefault(node.name, []).append(node)
+        super().visitCall(node)
+
+
+def callsites(node):
+    sites = CallSites()
+    sites.visit(node)
+    return sites.calls
+
+
+class ConstantPropagator:
+    """ Propagates constant arguments into the called functions (see the module's documentation)"""
+
+    def __init__(self, programm, wholeprogramm, specialize):
+        self.programm = programm
+        """ If false, functions can be called from other compilation-units. Then only constants are folded"""
+        self.wholeprogramm = wholeprogramm
+        """ If true, clone functions for calls with constant arguments"""
+        self.specialize = specialize
+        """ The number of AST-nodes the clones may still add"""
+        self.budget = 0
+        """ Dict of (function-name, constant arguments) to the name of the clone for these arguments (or None if cloning is not worth it)"""
+        self.clones = dict()
+        """ Dict of clone-name to the name of the function it was cloned from"""
+        self.origins = dict()
+        """ The (function-name, argument-name) of the arguments that were already replaced by constants"""
+        self.done = set()
+        """ Statistics: number of folded expressions, propagated arguments and created clones"""
+        self.folded = 0
+        self.propagated = 0
+        self.cloned = 0
+
+    def optimize(self):
+        for func in self.programm.funcdefs:
+            self.fold(func)
+        if self.wholeprogramm:
+            self.budget = max(clonebudget, int(
+                size(self.programm) * clonefraction))
+            # propagating constants into a function makes the calls in it constant. Repeat until nothing changes anymore
+            changed = True
+            while changed:
+                changed = self.propagate()
+                if self.specialize:
+                    changed = self.clone() or changed
+
+    def fold(self, func):
+        folder = Folder()
+        func.statements = folder.block(func.statements)
+        self.folded += folder.folded
+
+    def assigned(self, func):
+        info = LoopInfo()
+        info.visit(func)
+        return info.assigned
+
+    def constantargs(self, func, calls):
+        """ Returns a dict of argument-name to the constant that all the given calls pass for it (except the already propagated ones)"""
+        assigned = self.assigned(func)
+        constants = dict()
+        for index, name in enumerate(func.args):
+            args = [call.args[index] for call in calls]
+            if name in assigned or (func.name, name) in self.done or any(type(a) != ast.Const for a in args):
+                continue
+            if all(a.value == args[0].value for a in args):
+                constants[name] = args[0]
+        return constants
+
+    def substitute(self, func, constants):
+        Substitution(constants).visit(func)
+        self.fold(func)
+        # the arguments are still passed, but nobody reads them anymore
+        for name in constants:
+            self.done.add((func.name, name))
+
+    def propagate(self):
+        """ Propagate the arguments that are the same constant in every call. Returns true if something changed"""
+        calls = callsites(self.programm)
+        changed = False
+        for func in self.programm.funcdefs:
+            # main is called by the c-runtime
+            if func.name == "main" or func.name not in calls:
+                continue
+            constants = self.constantargs(func, calls[func.name])
+            if constants:
+                self.substitute(func, constants)
+                self.propagated += len(constants)
+                changed = True
+        return changed
+
+    def clone(self):
+        """ Create clones for calls with constant arguments, if propagating the arguments makes the function smaller.
+        Returns true if calls were redirected to clones"""
+        changed = False
+        for caller in list(self.programm.funcdefs):
+            for name, calls in callsites(caller).items():
+                func = self.programm.symbols.function(name)
+                if not func or name == "main":
+                    continue
+                for call in calls:
+                    changed = self.redirect(caller, func, call) or changed
+        return changed
+
+    def redirect(self, caller, func, call):
+        """ Let the call of func (in caller) call a clone, if it passes constants. Returns true if the call was redirected"""
+        constants = self.constantargs(func, [call])
+        if not constants:
+            return False
+        key = (func.name, tuple(sorted((k, v.value)
+                                       for k, v in constants.items())))
+        if key not in self.clones:
+            # a recursive call in a clone would create the next clone for the next constant (fib_1(30) calls fib(29)...)
+            if self.origins.get(caller.name) == func.name:
+                return False
+            self.clones[key] = self.newclone(func, constants)
+        if not self.clones[key]:
+            return False
+        call.name = self.clones[key]
+        return True
+
+    def newclone(self, func, constants):
+        """ Create a clone of func with the given constant arguments. Returns it's name, or None if the clone is not worth it"""
+        clone = copy.deepcopy(func)
+        clone.name = "{}_{}".format(func.name, self.cloned+1)
+        self.substitute(clone, constants)
+        grown = size(clone)
+        # only worth it, if the constants allow to fold something. And the programm must not grow too much
+        if grown >= size(func) or grown > self.budget:
+            return None
+        self.budget -= grown
+        self.programm.funcdefs.append(clone)
+        self.programm.symbols.define(clone)
+        self.origins[clone.name] = func.name
+        self.cloned += 1
+        return clone.name
+
+
+def optimize(programm, wholeprogramm=True, specialize=False):
+    """ Fold the constants of the given (checked) programm and propagate constant arguments (if it is the whole programm).
+    If specialize is true, functions are cloned for calls with constant arguments.
+    Returns the number of folded expressions, propagated arguments and created clones"""
+    propagator = ConstantPropagator(programm, wholeprogramm, specialize)
+    propagator.optimize()
+    return propagator.folded, propagator.propagated, propagator.cloned
@@ -0,0 +1,304 @@
+""" Common subexpression elimination and copy propagation. Is run for the asm-backend with -O1 or higher.
+    - Common subexpressions: If an expression is computed again while the variables it uses are unchanged, the second computation is replaced
+      by the value of the first one. If the first computation is the value assigned to a local variable (x = a*b), that variable is reused.
+      Otherwise the value is stored in a new variable, which is computed in front of the statement containing the first computation.
+    - Copy propagation: After x = y (or x = 5), reads of the local variable x are replaced by y (or 5) as long as neither x nor y change.
+      This makes more expressions equal, and the copies often become dead stores that are removed by dbc.deadcode.
+
+    The analysis follows the structure of the AST, which gives the dominators for free: A statement dominates the statements behind it in the
+    same block (and the ones nested in those). Values computed before an IF are available in both blocks and behind the IF, values computed
+    in only one of the blocks are not available behind it. Values computed before a WHILE are available in the loop, if the loop does not
+    change the variables they use.
+
+    Any call of a DBASIC-function could modify global variables. Values that depend on globals do not survive calls.
+
+    The variables created by this stage contain an underscore, so they never clash with the variables of the programm.
+"""
+import dbc.ast as ast
+from dbc.deadcode import terminates
+from dbc.inline import expressioninfo
+from dbc.optimizeloops import ExpressionRewriter, builtins, key, loopinfo
+
+""" Only the results of these operators are reused. Comparisons are not, as the code-generator turns comparisons in conditions into
+    a compare and jump. Loading a stored result would be slower"""
+operators = ["+", "-", "*", "/", "&", "|"]
+
+
+def divides(node):
+    """ Returns true if the expression contains a division"""
+    if type(node) == ast.Binary:
+        return node.op == "/" or divides(node.val1) or divides(node.val2)
+    if type(node) == ast.Unary:
+        return divides(node.val)
+    return False
+
+
+class Fact:
+    """ An available expression: The value of an expression that was computed before and can be reused """
+
+    def __init__(self, node, statement, variables, globals, order):
+        """ The expression, where it was computed first"""
+        self.node = node
+        """ The statement that contains node"""
+        self.statement = statement
+        """ The variables used by the expression"""
+        self.variables = variables
+        """ True if the expression uses global variables. Calls invalidate it"""
+        self.globals = globals
+        """ The local variable that contains the value (the variable node is assigned to, or a new variable created when the value is reused)"""
+        self.holder = None
+        """ Position of node in evaluation-order. Inner expressions come first"""
+        self.order = order
+
+
+class State:
+    """ The available expressions and copies at one point of a function """
+
+    def __init__(self, facts=None, copies=None):
+        """ Dict of expression-key (see dbc.optimizeloops.key()) to Fact"""
+        self.facts = facts or dict()
+        """ Dict of variable-name to (Var or Const that was copied to it, True if the copied Var is global)"""
+        self.copies = copies or dict()
+
+    def copy(self):
+        return State(dict(self.facts), dict(self.copies))
+
+    def kill(self, variables=(), globals=False):
+        """ Forget everything that depends on the given variables (or on global variables, if globals is true)"""
+        variables = set(variables)
+        self.facts = {k: f for k, f in self.facts.items()
+                      if not (f.variables & variables) and f.holder not in variables and not (globals and f.globals)}
+        self.copies = {k: c for k, c in self.copies.items()
+                       if k not in variables and not (type(c[0]) == ast.Var and (c[0].name in variables or (globals and c[1])))}
+
+    def merge(self, other):
+        """ Returns the state behind two blocks, one of which ended with self, the other one with other"""
+        return State({k: f for k, f in self.facts.items() if other.facts.get(k) is f},
+                     {k: c for k, c in self.copies.items() if other.copies.get(k) is c})
+
+
+class Replacer(ExpressionRewriter):
+    """ Second step: Replace the reused expressions by the variables holding their values and insert the definitions of the new variables"""
+
+    def __init__(self, eliminator):
+        self.eliminator = eliminator
+        super().__init__()
+
+    def replace(self, node):
+        name = self.eliminator.replaced.get(id(node))
+        if name:
+            return self.eliminator.var(name, node)
+        return None
+
+    def block(self, statements):
+        result = []
+        for statement in statements:
+            # inner expressions are defined first, as the outer ones use them
+            for _, definition in sorted(self.eliminator.definitions.get(id(statement), []), key=lambda d: d[0]):
+                # the defined value is the first computation itself. Only the expressions inside it can be replaced
+                self.children(definition.value)
+                result.append(definition)
+            self.visit(statement)
+            if type(statement) in [ast.If, ast.While]:
+                statement.statements = self.block(statement.statements)
+            if type(statement) == ast.If and statement.elsestatements:
+                statement.elsestatements = self.block(
+                    statement.elsestatements)
+            result.append(statement)
+        return result
+
+    def children(self, node):
+        if type(node) == ast.Binary:
+            node.val1 = self.expression(node.val1)
+            node.val2 = self.expression(node.val2)
+        elif type(node) == ast.Unary:
+            node.val = self.expression(node.val)
+
+    def visitIf(self, node):
+        # the blocks are handled by block()
+        node.exp = self.expression(node.exp)
+
+    def visitWhile(self, node):
+        node.exp = self.expression(node.exp)
+
+
+class CommonSubexpressionEliminator:
+    """ Eliminates common subexpressions and propagates copies in all functions of a (checked) programm.
+    The first step analyzes a function and propagates the copies. It records which expressions can be replaced. The second step (see Replacer)
+    replaces them. """
+
+    def __init__(self, programm):
+        self.programm = programm
+        """ The function that is currently processed"""
+        self.func = None
+        """ Dict of the ids of the expressions to replace to the name of the variable holding their value"""
+        self.replaced = dict()
+        """ Dict of statement-id to a list of (order, LocalDef). The LocalDefs compute reused values in front of the statement"""
+        self.definitions = dict()
+        """ Counts the analyzed expressions to give them an evaluation-order"""
+        self.order = 0
+        """ Counts the created variables to give them unique names"""
+        self.counter = 0
+        """ Statistics: number of eliminated expressions and propagated copies"""
+        self.eliminated = 0
+        self.propagated = 0
+
+    def eliminate(self):
+        for func in self.programm.funcdefs:
+            self.func = func
+            self.replaced = dict()
+            self.definitions = dict()
+            self.block(func.statements, State())
+            func.statements = Replacer(self).block(func.statements)
+
+    def isglobal(self, name):
+        return name not in self.func.localvars
+
+    def block(self, statements, state):
+        """ Analyze the given statements, starting with the given state. Returns the state behind the statements"""
+        for statement in statements:
+            state = self.statement(statement, state)
+        return state
+
+    def statement(self, node, state):
+        """ Analyze the given statement. Returns the state behind it"""
+        t = type(node)
+        if t in [ast.If, ast.While]:
+            calls = expressioninfo(node.exp).calls
+        elif t == ast.Return:
+            calls = node.expression is not None and expressioninfo(
+                node.expression).calls
+        else:
+            calls = expressioninfo(node).calls
+
+        if t in [ast.Assign, ast.LocalDef]:
+            node.value = self.expression(node.value, state, node, True, calls)
+            state.kill([node.name])
+            if not self.isglobal(node.name):
+                value = node.value
+                if type(value) in [ast.Var, ast.Const]:
+                    state.copies[node.name] = (value, type(
+                        value) == ast.Var and self.isglobal(value.name))
+                else:
+                    fact = state.facts.get(key(value))
+                    if fact and fact.node is value:
+                        # the variable holds the value of the expression from now on. No new variable is needed to reuse it
+                        fact.holder = node.name
+        elif t == ast.Return:
+            if node.expression:
+                node.expression = self.expression(
+                    node.expression, state, node, True, calls)
+        elif t == ast.Call:
+            self.expression(node, state, node, True, calls)
+        elif t == ast.If:
+            node.exp = self.expression(node.exp, state, node, True, calls)
+            thenstate = self.block(node.statements, state.copy())
+            elsestate = self.block(node.elsestatements or [], state.copy())
+            # a block that always returns does not reach the code behind the IF
+            if terminates(node.statements):
+                state = elsestate
+            elif terminates(node.elsestatements):
+                state = thenstate
+            else:
+                state = thenstate.merge(elsestate)
+        elif t == ast.While:
+            # only what the loop does not change is available in the loop (and behind it, as the loop might not run at all)
+            info = loopinfo(node)
+            state = state.copy()
+            state.kill(info.assigned.keys(), info.calls)
+            # the condition is computed again after every iteration. Values computed in it can not be computed in front of the loop
+            node.exp = self.expression(node.exp, state, node, False, calls)
+            self.block(node.statements, state.copy())
+        return state
+
+    def expression(self, node, state, statement, generate, calls):
+        """ Analyze the given expression of the given statement. Returns the expression (or the copy that replaces it).
+        Reuses the values available in state and makes the computed values available, if generate is true.
+        calls is true if the statement contains calls. Then only values that can not be changed by calls can be computed in front of the statement"""
+        t = type(node)
+        if t == ast.Var:
+            if node.name not in state.copies:
+                return node
+            self.propagated += 1
+            copy = state.copies[node.name][0]
+            if type(copy) == ast.Var:
+                new = ast.Var(copy.name, node.line)
+            else:
+                new = ast.Const(copy.value, copy.type, node.line)
+            new.type = node.type
+            return new
+        if t == ast.Call:
+            node.args = [self.expression(arg, state, statement, generate, calls)
+                         for arg in node.args]
+            if node.name not in builtins:
+                state.kill(globals=True)
+            return node
+        if t == ast.Binary and node.op not in operators:
+            node.val1 = self.expression(
+                node.val1, state, statement, generate, calls)
+            node.val2 = self.expression(
+                node.val2, state, statement, generate, calls)
+            return node
+        if t not in [ast.Binary, ast.Unary]:
+            return node
+
+        fact = state.facts.get(self.key(node, state))
+        if fact:
+            # the value was computed before. Store it in a variable (if nobody holds it yet) and use that variable instead
+            if not fact.holder:
+                fact.holder = self.newvar(fact.node)
+                self.replaced[id(fact.node)] = fact.holder
+                self.definitions.setdefault(id(fact.statement), []).append(
+                    (fact.order, ast.LocalDef(fact.holder, fact.node, fact.node.type, fact.statement.line)))
+            self.replaced[id(node)] = fact.holder
+            self.eliminated += 1
+            return node
+
+        if t == ast.Binary:
+            node.val1 = self.expression(
+                node.val1, state, statement, generate, calls)
+            node.val2 = self.expression(
+                node.val2, state, statement, generate, calls)
+        else:
+            node.val = self.expression(
+                node.val, state, statement, generate, calls)
+        self.order += 1
+        info = expressioninfo(node)
+        variables = set(info.variables)
+        globals = any(self.isglobal(v) for v in variables)
+        # a failing division must not happen before the output of a print in the same statement
+        if generate and not info.calls and not (calls and (globals or divides(node))):
+            state.facts[key(node)] = Fact(
+                node, statement, variables, globals, self.order)
+        return node
+
+    def key(self, node, state):
+        """ Returns the key (see dbc.optimizeloops.key()) of the expression, as it will be after propagating the copies"""
+        if type(node) == ast.Var and node.name in state.copies:
+            return key(state.copies[node.name][0])
+        if type(node) == ast.Binary:
+            return "({}{}{})".format(self.key(node.val1, state), node.op, self.key(node.val2, state))
+        if type(node) == ast.Unary:
+            return "({}{})".format(node.op, self.key(node.val, state))
+        return key(node)
+
+    def newvar(self, node):
+        """ Create a new local variable for the value of the given expression and return it's name"""
+        self.counter += 1
+        name = "_cse{}".format(self.counter)
+        self.func.localvars[name] = node
+        self.func.localvartypes[name] = node.type
+        return name
+
+    def var(self, name, node):
+        var = ast.Var(name, node.line)
+        var.type = node.type
+        return var
+
+
+def eliminate(programm):
+    """ Eliminate the common subexpressions and propagate the copies in the given (checked) programm.
+    Returns the number of eliminated expressions and propagated copies"""
+    eliminator = CommonSubexpressionEliminator(programm)
+    eliminator.eliminate()
+    return eliminator.eliminated, eliminator.propagated
@@ -0,0 +1,183 @@
+""" Removes code that can never be executed or whose results are never used. Is run for the asm-backend with -O1 or higher.
+    - Unreachable statements: Statements behind a RETURN (or behind an IF whose blocks all end with a RETURN). The checker requires
+      every function to end with a RETURN, so functions often contain a final RETURN that can never be reached.
+    - Dead stores: Assignments to local variables whose value is never read afterwards (found by a liveness-analysis).
+      Assignments whose value contains calls are kept, as the called functions could have side-effects.
+    - Unused variables: Local variables that are not used anymore do not get a slot in the stackframe.
+    - Unused functions: If the programm consists of a single file, functions that can not be reached from main are removed.
+"""
+import dbc.ast as ast
+from dbc.visit import Visitor
+from dbc.inline import expressioninfo
+
+
+class References(Visitor):
+    """ Collects the names of all variables that are read or assigned and the names of all called functions"""
+
+    def __init__(self):
+        self.variables = set()
+        self.calls = set()
+        super().__init__()
+
+    def visitVar(self, node):
+        self.variables.add(node.name)
+
+    def visitAssign(self, node):
+        self.variables.add(node.name)
+        super().visitAssign(node)
+
+    def visitLocaldef(self, node):
+        self.visitAssign(node)
+
+    def visitCall(self, node):
+        self.calls.add(node.name)
+        super().visitCall(node)
+
+
+def references(node):
+    refs = References()
+    refs.visit(node)
+    return refs
+
+
+def terminates(statements):
+    """ Returns true if the execution of the given statements never continues behind them"""
+    if not statements:
+        return False
+    last = statements[-1]
+    if type(last) == ast.Return:
+        return True
+    return type(last) == ast.If and terminates(last.statements) and terminates(last.elsestatements)
+
+
+def used(node):
+    """ Returns the set of variables read by the given expression (or None)"""
+    return set(expressioninfo(node).variables) if node else set()
+
+
+class DeadCodeEliminator:
+    """ Removes the dead code of a (checked) programm """
+
+    def __init__(self, programm, wholeprogramm):
+        self.programm = programm
+        """ If true, the programm is not linked to other files, so functions that are not called from main can be removed"""
+        self.wholeprogramm = wholeprogramm
+        """ The function that is currently processed"""
+        self.func = None
+        """ Statistics: number of removed statements, variables and functions"""
+        self.statements = 0
+        self.variables = 0
+        self.functions = 0
+
+    def eliminate(self):
+        for func in self.programm.funcdefs:
+            self.func = func
+            func.statements = self.reachable(func.statements)
+            _, func.statements = self.live(func.statements, set(), True)
+            self.unusedvariables(func)
+        if self.wholeprogramm:
+            self.unusedfunctions()
+
+    def reachable(self, statements):
+        """ Returns the given statements without the ones that can never be reached """
+        result = []
+        for statement in statements:
+            if type(statement) == ast.If:
+                statement.statements = self.reachable(statement.statements)
+                if statement.elsestatements:
+                    statement.elsestatements = self.reachable(
+                        statement.elsestatements)
+            elif type(statement) == ast.While:
+                statement.statements = self.reachable(statement.statements)
+            result.append(statement)
+            if terminates([statement]):
+                self.statements += len(statements) - len(result)
+                break
+        return result
+
+    def islocal(self, name):
+        return name in self.func.localvars
+
+    def live(self, statements, live, remove):
+        """ Liveness-analysis. Computes the local variables whose value is read before they are assigned again, when starting to
+        execute the given statements. live are the variables that are live behind the statements.
+        If remove is true, the dead stores are removed. Returns the live variables and the (remaining) statements"""
+        kept = []
+        for statement in reversed(statements):
+            t = type(statement)
+            if t in [ast.Assign, ast.LocalDef]:
+                info = expressioninfo(statement.value)
+                if self.islocal(statement.name) and statement.name not in live and not info.calls:
+                    # nobody reads the assigned value. The statement does not change which variables are live
+                    if remove:
+                        self.statements += 1
+                        continue
+                else:
+                    live = (live - {statement.name}) | set(info.variables)
+            elif t == ast.Return:
+                # nothing behind a RETURN is executed
+                live = used(statement.expression)
+            elif t == ast.Call:
+                live = live | used(statement)
+            elif t == ast.If:
+                thenlive, statement.statements = self.live(
+                    statement.statements, live, remove)
+                elselive, elsestatements = self.live(
+                    statement.elsestatements or [], live, remove)
+                if statement.elsestatements:
+                    statement.elsestatements = elsestatements
+                live = used(statement.exp) | thenlive | elselive
+            elif t == ast.While:
+                # the variables used by the loop are live at it's end too. Repeat until nothing changes anymore
+                looplive = used(statement.exp) | live
+                while True:
+                    bodylive, _ = self.live(
+                        statement.statements, looplive, False)
+                    new = looplive | bodylive
+                    if new == looplive:
+                        break
+                    looplive = new
+                if remove:
+                    _, statement.statements = self.live(
+                        statement.statements, looplive, True)
+                live = looplive
+            kept.append(statement)
+        kept.reverse()
+        return live, kept
+
+    def unusedvariables(self, func):
+        """ Remove the local variables that are not used anymore. Arguments are always kept, as the caller passes them"""
+        refs = set()
+        for statement in func.statements:
+            refs |= references(statement).variables
+        for name in list(func.localvars.keys()):
+            if name not in refs and name not in func.args:
+                del func.localvars[name]
+                del func.localvartypes[name]
+                self.variables += 1
+
+    def unusedfunctions(self):
+        """ Remove the functions that can not be reached from main"""
+        symbols = self.programm.symbols
+        reached = set()
+        pending = ["main"]
+        while pending:
+            name = pending.pop()
+            if name in reached or not symbols.function(name):
+                continue
+            reached.add(name)
+            pending += references(symbols.function(name)).calls
+        for func in self.programm.funcdefs:
+            if func.name not in reached:
+                symbols.remove(func.name)
+                self.functions += 1
+        self.programm.funcdefs = [
+            f for f in self.programm.funcdefs if f.name in reached]
+
+
+def eliminate(programm, wholeprogramm=True):
+    """ Remove the dead code of the given (checked) programm. If wholeprogramm is false, the programm is linked to other files, which could
+    call any of it's functions. Returns the number of removed statements, local variables and functions"""
+    eliminator = DeadCodeEliminator(programm, wholeprogramm)
+    eliminator.eliminate()
+    return eliminator.statements, eliminator.variables, eliminator.functions
@@ -0,0 +1,341 @@
+""" The driver ties the single stages of the compiler together (tokenize -> parse -> check -> generate -> assemble -> link).
+    It is used by the console application (see dbc.cli), but can also be used directly to compile DBASIC code from python.
+"""
+import hashlib
+from collections import OrderedDict
+
+import dbc.tokenize as tokenize
+import dbc.parse as parse
+import dbc.generateasm as generateasm
+import dbc.generatec as generatec
+import dbc.runtime as runtime
+import dbc.stats as statistics
+import dbc.profile as profiling
+import dbc.inline as inline
+import dbc.optimizeloops as optimizeloops
+import dbc.deadcode as deadcode
+import dbc.cse as cse
+import dbc.purity as purity
+import dbc.constprop as constprop
+from dbc.formatasm import format
+from dbc.checkvariables import VariableChecker
+from dbc.checktypes import TypeChecker
+from dbc.checksemantics import SemanticChecker
+from dbc.errors import LinkError
+
+
+""" The semantic checks. Name to a function that returns the checkers to run (in order) for the given requiremain and externals (see check()).
+    The fused SemanticChecker produces exactly the same annotations as the VariableChecker and TypeChecker, but only traverses the AST once"""
+checkpipelines = OrderedDict([
+    ("fused", lambda requiremain, externals: [
+     SemanticChecker(requiremain, externals)]),
+    ("separate", lambda requiremain, externals: [
+     VariableChecker(requiremain), TypeChecker(externals)]),
+])
+
+
+class Options:
+    """ The options that change the code generated for a source-file (and therefore the object-file built from it).
+    One Options object is passed through all stages of the compilation (see compileunit(), compileobject() and batch.build())"""
+
+    def __init__(self, backend="asm", optimize=None, profile=False, debuginfo=False, unroll=None, memoize=False, omitframepointer=False):
+        """ The kind of code to generate. Can be 'asm' or 'c'"""
+        self.backend = backend
+        """ The optimization-level. For the asm-backend, level 1 and higher optimize the AST (see optimizeast()) and the generated code.
+            The c-code is optimized by gcc (level 2 if None)"""
+        self.optimize = optimize
+        """ Instrument the generated code for profiling (only supported by the asm-backend)"""
+        self.profile = profile
+        """ Emit debug-information (line-numbers and call-frame-information) into the generated code"""
+        self.debuginfo = debuginfo
+        """ The unroll-factor for counted loops (see optimizeast())"""
+        self.unroll = unroll
+        """ Memoize the results of pure recursive functions (see dbc.purity)"""
+        self.memoize = memoize
+        """ Do not set up %rbp as frame-pointer in the functions of the asm-backend (ignored with debuginfo)"""
+        self.omitframepointer = omitframepointer
+
+    def replace(self, **changes):
+        """ Returns a copy of these options with the given attributes changed"""
+        options = Options(**vars(self))
+        for name, value in changes.items():
+            if not hasattr(options, name):
+                raise ValueError("Unknown option: "+name)
+            setattr(options, name, value)
+        return options
+
+    def key(self):
+        """ Returns a list of strings that identifies these options. Part of the cache-keys of the generated code and the object-files"""
+        parts = [self.backend, str(self.optimize)]
+        if self.debuginfo:
+            parts += ["debuginfo"]
+        if self.profile:
+            parts += ["profile"]
+        if self.unroll is not None:
+            parts += ["unroll", str(self.unroll)]
+        if self.memoize:
+            parts += ["memoize"]
+        if self.omitframepointer:
+            parts += ["omitframepointer"]
+        return parts
+
+    def __repr__(self):
+        return "Options({})".format(", ".join("{}={!r}".format(k, v) for k, v in vars(self).items()))
+
+
+def parsesource(source, debug=False, stats=statistics.nostats):
+    """ Tokenize and parse the given source-code
+
+    :params source: The DBASIC source code as string
+    :params debug: If true, print the list of found tokens
+    :params stats: A dbc.stats.Statistics object that records the time needed for every stage
+    :returns: The (not yet checked) AST of the source
+    """
+    with stats.measure("tokenize"):
+        tokenizer = tokenize.Tokenizer(source)
+    stats.count("tokens", len(tokenizer.tokens))
+    if debug:
+        print(tokenizer.tokens)
+    with stats.measure("parse"):
+        syntaxtree = parse.parse(tokenizer)
+    if stats.enabled:
+        stats.count("ast-nodes", statistics.countnodes(syntaxtree))
+        stats.count("functions", len(syntaxtree.funcdefs))
+    return syntaxtree
+
+
+def check(syntaxtree, requiremain=True, externals=None, stats=statistics.nostats, pipeline="fused"):
+    """ Run all semantic checks on the given AST and annotate it
+
+    :params syntaxtree: The AST to check
+    :params requiremain: If false, the programm does not need to define a main-function (e.g. because it is linked to another programm)
+    :params externals: A dict of function-name to ast.FuncDef of functions that are defined in other compilation-units
+    :params stats: See parsesource()
+    :params pipeline: The checkers to run (a key of checkpipelines)
+    :returns: The checked and annotated AST
+    """
+    for checker in checkpipelines[pipeline](requiremain, externals):
+        with stats.measure(type(checker).__name__):
+            checker.check(syntaxtree)
+    return syntaxtree
+
+
+def generate(syntaxtree, options=Options(), wholeprogramm=True, externals=None, stats=statistics.nostats, filename=None):
+    """ Generate code for the given (checked) AST
+
+    :params syntaxtree: The AST to generate code for
+    :params options: The Options to generate the code with. options.backend is the kind of code to generate
+    :params wholeprogramm: If false, the generated code is linked together with other compilation-units
+    :params externals: See check()
+    :params stats: See parsesource()
+    :params filename: The name of the source-file. Is recorded in the profile and the debug-information
+    :returns: The generated code as string
+    """
+    target = options.backend
+    if options.profile and target != "asm":
+        raise ValueError("Profiling is only supported for asm")
+    memoized = []
+    if options.memoize:
+        with stats.measure("purity"):
+            memoized = purity.memoizable(syntaxtree)
+        stats.count("memoized-functions", len(memoized))
+    # choose a code-generator based on the wanted output-format
+    if target == "c":
+        generator = generatec.CGenerator(wholeprogramm, externals, memoized)
+    elif target == "asm":
+        generator = generateasm.ASMGenerator(options.profile, filename, options.debuginfo, options.optimize, memoized,
+                                             options.omitframepointer)
+    else:
+        raise ValueError("Unknown target type: "+target)
+    with stats.measure(type(generator).__name__):
+        code = generator.generate(syntaxtree)
+    if target == "asm" and stats.enabled:
+        stats.count("instructions", statistics.countinstructions(code))
+        stats.count("register-spills", generator.regs.spills)
+        stats.count("register-reloads", generator.regs.reloads)
+        stats.count("frame-bytes-before", generator.framebefore)
+        stats.count("frame-bytes-after", generator.frameafter)
+    return code
+
+
+def gcc(args, code=None):
+    """ Run gcc with the given args and code as stdin. Raises LinkError if gcc fails """
+    runtime.gcc(args, code)
+
+
+def objectargs(outfile, backend="asm", optimize=None, debuginfo=False):
+    """ Returns the gcc-arguments needed to turn the code generated for the given backend (read from stdin) into an object-file
+
+    :params outfile: The object-file to create
+    :params backend: 'asm' to assemble the output of the ASMGenerator, 'c' to compile the output of the CGenerator
+    :params optimize: The optimization-level for the c-backend. Defaults to 2
+    :params debuginfo: Let gcc generate debug-information for the c-code. (The asm-code contains it's own, see generate())
+    """
+    if backend == "c":
+        # DBASIC-INTs wrap around on overflow (like the asm-backend and the interpreters compute them). In C signed overflow is undefined
+        # and gcc optimizes assuming it never happens (e.g. folds 'x + 1 > x' to true). -fwrapv makes it wrap
+        return ["-c", "-o", outfile, "-O"+str(2 if optimize is None else optimize), "-fwrapv"] + (["-g"] if debuginfo else []) + ["-xc", "-"]
+    return ["-c", "-o", outfile, "-xassembler", "-"]
+
+
+def linkargs(objects, outfile, gccargs=[], profile=False):
+    """ Returns the gcc-arguments needed to link the given object-files (and the DBASIC runtime) into an executable.
+    Files ending in .asm (as generated by dbc -t asm) are assembled first.
+    If profile is true, the profiling-runtime is linked too (needed by objects compiled with profile=True)"""
+    inputs = []
+    for obj in objects:
+        # gcc does not know the .asm extension. Tell it the language explicitly
+        if obj.endswith(".asm"):
+            inputs += ["-xassembler", obj, "-xnone"]
+        else:
+            inputs.append(obj)
+    if profile:
+        inputs.append(runtime.profileobject())
+    return ["-o", outfile, "-no-pie"] + inputs + [runtime.runtimeobject()] + gccargs
+
+
+def assemble(code, outfile):
+    """ Assemble the given assembler-code into an object-file """
+    gcc(objectargs(outfile, "asm"), code)
+
+
+def compilec(code, outfile, optimize=2):
+    """ Compile the given c-code into an object-file using the given optimization-level """
+    gcc(objectargs(outfile, "c", optimize), code)
+
+
+def link(objects, outfile, gccargs=[], profile=False):
+    """ Link the given object-files (and the DBASIC runtime) into an executable. See linkargs() """
+    gcc(linkargs(objects, outfile, gccargs, profile))
+
+
+def signature(funcdef):
+    """ Returns a string describing the signature of the given function. (Name, type of arguments and return-type)"""
+    return "{}({}){}".format(funcdef.name, ",".join(funcdef.argtypes), funcdef.returntype or "")
+
+
+def compileunit(source, options=Options(), requiremain=True, externals=None, syntaxtree=None, debug=False, stats=statistics.nostats,
+                filename=None, profiledata=None, pipeline="fused"):
+    """ Run the whole frontend (parse and check) and the code-generator for the given source-code
+
+    :params source: The DBASIC source code
+    :params options: The Options to compile with (see generate()). For the asm-backend, optimization-level 1 and higher optimize the AST
+                     (see optimizeast()) and the generated code. (The c-code is optimized by gcc)
+    :params requiremain: See check()
+    :params externals: See check()
+    :params syntaxtree: The already parsed (not checked) AST of source. Saves parsing the code again.
+    :params debug: See parsesource()
+    :params stats: See parsesource()
+    :params filename: See generate()
+    :params profiledata: The profile-entries (see dbc.profile.load()) of this source-file. If given, the hot parts of the programm are optimized
+    :params pipeline: See check()
+    :returns: The generated code
+    """
+    syntaxtree = syntaxtree or parsesource(source, debug, stats)
+    check(syntaxtree, requiremain, externals, stats, pipeline)
+    if profiledata:
+        optimizeprofile(syntaxtree, profiledata, stats)
+    if options.backend == "asm" and options.optimize:
+        # the profile-entries of instrumented code have to match the loops of the source. Do not duplicate them
+        optimizeast(syntaxtree, options.optimize, stats, 0 if options.profile else options.unroll, requiremain)
+    # a single source-file is the whole programm. Otherwise the functions have to be visible to the other objects
+    code = generate(syntaxtree, options, requiremain, externals, stats, filename)
+    # format the asm-code a little to make it more readable
+    if options.backend == "asm":
+        with stats.measure("format"):
+            code = format(code)
+    return code
+
+
+def optimizeprofile(syntaxtree, profiledata, stats=statistics.nostats):
+    """ Annotate the (checked) AST with the counts of the given profile-entries and run the optimizations that depend on them.
+    The code-generators use the annotations too (e.g. to lay out IF/ELSE-blocks)"""
+    with stats.measure("profile"):
+        stats.count("profiled-nodes",
+                    profiling.annotate(syntaxtree, profiledata))
+    with stats.measure("inline"):
+        stats.count("inlined-calls", inline.inline(syntaxtree))
+
+
+def optimizeast(syntaxtree, optimize, stats=statistics.nostats, unroll=None, wholeprogramm=True):
+    """ Run the optimizations of the given level on the (checked) AST.
+    Counted loops are unrolled unroll times. If unroll is None, level 2 and higher unroll by optimizeloops.unrollfactor.
+    If wholeprogramm is true, the AST is the whole programm: Constant arguments are propagated into the called functions (level 2 and higher
+    also clones functions for constant arguments) and functions that are not called from main are removed"""
+    if unroll is None:
+        unroll = optimizeloops.unrollfactor if optimize >= 2 else 0
+    # folding first, so the later stages see the simplified expressions
+    with stats.measure("constprop"):
+        folded, arguments, cloned = constprop.optimize(
+            syntaxtree, wholeprogramm, optimize >= 2)
+    stats.count("folded-expressions", folded)
+    stats.count("propagated-arguments", arguments)
+    stats.count("cloned-functions", cloned)
+    with stats.measure("cse"):
+        eliminated, propagated = cse.eliminate(syntaxtree)
+    stats.count("eliminated-expressions", eliminated)
+    stats.count("propagated-copies", propagated)
+    # the propagated copies often become dead stores
+    with stats.measure("deadcode"):
+        statements, variables, functions = deadcode.eliminate(
+            syntaxtree, wholeprogramm)
+    stats.count("removed-statements", statements)
+    stats.count("removed-variables", variables)
+    stats.count("removed-functions", functions)
+    with stats.measure("optimizeloops"):
+        hoisted, reduced, unrolled = optimizeloops.optimize(
+            syntaxtree, unroll)
+    stats.count("hoisted-expressions", hoisted)
+    stats.count("reduced-multiplications", reduced)
+    stats.count("unrolled-loops", unrolled)
+
+
+def timepasses(source, options=Options(), memory=True, pipeline="fused"):
+    """ Compile the given source-code and measure every stage of the compiler (tokenize, parse, checks and code-generation).
+
+    :params source: The DBASIC source code
+    :params options: The Options to compile with (See compileunit())
+    :params memory: Also measure the peak memory-usage of every stage (slows down the compilation)
+    :params pipeline: The semantic checks to run (See check())
+    :returns: A dbc.stats.Statistics object containing the measurements
+    """
+    stats = statistics.Statistics(memory=memory)
+    compileunit(source, options, stats=stats, pipeline=pipeline)
+    return stats
+
+
+def objectkey(source, requiremain=True, externals=None, options=Options(), filename=None, profiledata=None):
+    """ Returns the key under which the object-file for the given source is cached. For the parameters see compileobject() """
+    externals = externals or dict()
+    # the object depends on the source, the used compiler, the options and the signatures of functions in other units
+    h = hashlib.sha256()
+    parts = [runtime.fingerprint(), str(requiremain), source] + options.key()
+    # instrumented objects and objects with debug-information also contain the name of their source-file
+    if options.profile or options.debuginfo:
+        parts += ["file", filename or ""]
+    if profiledata:
+        parts += ["useprofile", profiling.digest(profiledata)]
+    for part in parts + sorted(signature(f) for f in externals.values()):
+        h.update(part.encode())
+        h.update(b"\0")
+    return "obj-" + h.hexdigest()[:32]
+
+
+def compileobject(source, requiremain=True, externals=None, syntaxtree=None, options=Options(), filename=None, profiledata=None):
+    """ Compile the given source-code into an object-file. Compiled objects are cached, so unchanged sources are never compiled twice.
+
+    :params source: The DBASIC source code
+    :params requiremain: See check()
+    :params externals: See check()
+    :params syntaxtree: The already parsed (not checked) AST of source. Saves parsing the code again if the object is not cached.
+    :params options: The Options to compile with. For options.backend 'asm' the output of the ASMGenerator is assembled, for 'c' the output
+                     of the CGenerator is compiled using gcc
+    :params filename: See generate()
+    :params profiledata: See compileunit()
+    :returns: The path of the (cached) object-file
+    """
+    def build(path):
+        code = compileunit(source, options, requiremain, externals, syntaxtree, filename=filename, profiledata=profiledata)
+        gcc(objectargs(path, options.backend, options.optimize, options.debuginfo), code)
+
+    return runtime.cachedfile(objectkey(source, requiremain, externals, options, filename, profiledata), ".o", build)
@@ -10,3 +10,17 @@ class CheckError(Exception):
         self.fullmessage = "Semantic error on line {}: {}".format(
             node.line if node else 0, msg)
         super().__init__(self.fullmessage)
+
+
+class LinkError(Exception):
+    """ Is raised if gcc fails to assemble or link the generated code (or the runtime) """
+
+    def __init__(self, msg):
+        super().__init__(msg)
+
+
+class ExecutionError(Exception):
+    """ Is raised if a programm that is run by one of the interpreters (see dbc.interpret) fails, e.g. because it divides by zero """
+
+    def __init__(self, msg):
+        super().__init__(msg)
@@ -1,12 +1,51 @@
-from textwrap import dedent
+import os.path
 from collections import Counter
 
 import dbc.ast as ast
+import dbc.purity as purity
+import dbc.stackslots as stackslots
 from dbc.visit import Visitor, VisitorError
 
 """ if this is true, the generated code contains debug-information about register-allocation"""
 debug = False
 
+""" The conditional jumps for the comparison operators (see ASMGenerator.condition())"""
+jumps = {"==": "je", "!=": "jne", "<": "jl",
+         ">": "jg", "<=": "jle", ">=": "jge"}
+""" The negation of every comparison operator"""
+negations = {"==": "!=", "!=": "==", "<": ">=",
+             ">": "<=", "<=": ">", ">=": "<"}
+
+
+def isimmediate(value):
+    """ Returns true if the given constant can be used as immediate operand (instructions only take sign-extended 32-bit immediates)"""
+    return -2**31 <= int(value) < 2**31
+
+
+""" Registers that a called function may overwrite (System V ABI). Values in them do not survive calls"""
+callersaved = ["rax", "rcx", "rdx", "rsi", "rdi", "r8", "r9", "r10", "r11"]
+""" Registers that a called function has to preserve (System V ABI). A function that uses them saves them in it's prologue and restores
+    them before it returns. Values in them survive calls"""
+calleesaved = ["rbx", "r12", "r13", "r14", "r15"]
+""" Caller-saved registers that functions which do not call other functions (leaf-functions) can keep their variables in. All except %rax,
+    which holds the return-value. The ones that are chosen last for temporary values come first"""
+leafregisters = ["r11", "r10", "r9", "r8", "rdi", "rsi", "rdx", "rcx"]
+""" The registers to pass function-arguments in (ordered). The remaining arguments are passed on the stack"""
+argorder = ["rdi", "rsi", "rdx", "rcx", "r8", "r9"]
+""" The number of bytes below %rsp that signal-handlers and interrupts never overwrite (System V ABI). Leaf-functions can keep their
+    variables there without allocating a stack-frame"""
+redzone = 128
+""" Local variables inside loops are weighted with this factor (per nesting-level) when choosing the variables that are kept in registers"""
+loopweight = 8
+
+""" Placeholder for the code restoring the callee-saved registers and removing the stack-frame at every RETURN. Which registers a function
+    needs to restore is only known after it's code has been generated (see ASMGenerator.visitFuncdef())"""
+epiloguemarker = "#epilogue\n"
+
+""" The nodes that are statements. With debug-information, every statement gets a line-marker"""
+statementtypes = (ast.Assign, ast.LocalDef, ast.If,
+                  ast.While, ast.Return, ast.Call)
+
 
 class RegisterAllocator:
     """ This class is responsible for register allocation. It tracks which registers are currently in use and offers methods to
@@ -21,20 +60,36 @@ class RegisterAllocator:
         5. the statement calls free(reg)
         !!! allocate() and free() may emit assembler instructions which have to be added to the output-code on the appropriate location!!!
 
+        The values of borrowed registers are saved in spill-slots of the stack-frame (not pushed), so %rsp never changes inside a function and
+        stays aligned for calls. The code-generator sets spill to a function that returns the operand of the spill-slot with the given number.
+        Registers are always freed in the reverse order they were allocated, so the spill-slots are used like a stack. Every free() undoes
+        exactly the allocate() it belongs to, even if the same register is allocated again in between (like the argument-register of a call
+        in the argument of another call).
     """
 
     def __init__(self):
-        """ list of possible x86-64 registers"""
-        self.registerlist = ["rax", "rbx", "rcx", "rdx",
-                             "rsi", "rdi"] + ["r"+str(i) for i in range(8, 16)]
+        """ list of possible x86-64 registers. The caller-saved ones come first, the callee-saved ones need to be saved by the function"""
+        self.registerlist = callersaved + calleesaved
         """ registers to pass function-arguments in (ordered)"""
-        self.argorder = ["rdi", "rsi", "rdx", "rcx", "r8", "r9"]
+        self.argorder = argorder
         """ the set of registers currently in use """
         self.inuse = set()
-        """ Keeps track which register has been saved to the stack how often """
-        self.borrowed = Counter()
+        """ the set of registers used since the start of the current function"""
+        self.used = set()
+        """ Keeps track in which spill-slots a register has been saved. Dict of register to a list with an entry for every allocation
+        that was not freed yet: the number of the slot, or None if the register was not in use"""
+        self.borrowed = dict()
         """ All expressions should place their result in THIS register """
         self.target = None
+        """ The number of instructions emitted to save and restore registers (see --stats)"""
+        self.spills = 0
+        self.reloads = 0
+        """ Returns the operand of the spill-slot with the given number"""
+        self.spill = None
+        """ The number of spill-slots currently in use"""
+        self.depth = 0
+        """ The maximum number of spill-slots in use since the start of the current function"""
+        self.maxdepth = 0
 
     def allocate(self, reg):
         """ Make the register reg available for use. If reg is already in use, it's value is saved to the stack.
@@ -43,32 +98,48 @@ class RegisterAllocator:
             DOES NOT mark a register as in-use.
         """
         self.target = reg
+        self.used.add(reg)
         if reg in self.inuse:
-            # the register is already in use. Make it available by pushing it's content to the stack
-            self.borrowed[reg] += 1
+            # the register is already in use. Make it available by saving it's content to a spill-slot
+            slot = self.temporary()
+            self.borrowed.setdefault(reg, []).append(slot)
             self.inuse.remove(reg)
-            return "push %{}\n".format(reg) if not debug else "push %{}#borrowed\n".format(reg)
+            self.spills += 1
+            return "mov %{}, {}\n".format(reg, self.spill(slot)) if not debug else "mov %{}, {}#borrowed\n".format(reg, self.spill(slot))
         else:
+            self.borrowed.setdefault(reg, []).append(None)
             return "" if not debug else "#prepared: "+reg+"\n"
 
     def mark_used(self, reg):
         """ Marks register reg as in-use"""
         self.inuse.add(reg)
+        self.used.add(reg)
 
     def free(self, reg):
         """ Reg is not longer needed. In-use is set to false. If reg's contents were saved to the stack in prepare(), it is restored.
             Returns code that HAS TO be added to the statements code.
         """
-        borrowcount = self.borrowed[reg]
-        if borrowcount == 0:
+        slot = self.borrowed[reg].pop() if self.borrowed.get(reg) else None
+        if slot is None:
             # register is not longer needed
             self.inuse.discard(reg)
             return "" if not debug else "#unused: "+reg+"\n"
         else:
-            # register value has been saved to the stack. restore it
-            self.borrowed[reg] = borrowcount - 1
+            # register value has been saved to a spill-slot. restore it
+            self.release(1)
             self.inuse.add(reg)
-            return "pop %{}\n".format(reg) if not debug else "pop %{}#returned\n".format(reg)
+            self.reloads += 1
+            return "mov {}, %{}\n".format(self.spill(slot), reg) if not debug else "mov {}, %{}#returned\n".format(self.spill(slot), reg)
+
+    def temporary(self):
+        """ Reserve the next spill-slot (e.g. to keep a temporary value in memory) and return it's number"""
+        self.depth += 1
+        self.maxdepth = max(self.maxdepth, self.depth)
+        return self.depth - 1
+
+    def release(self, count):
+        """ Release the last count reserved spill-slots"""
+        self.depth -= count
 
     def choose(self, exclude=[]):
         """ returns a register. If a free register is available, it is returned. Otherwise some arbitary in-use register is returned.
@@ -83,9 +154,128 @@ class RegisterAllocator:
 
     def low(self, reg):
         """ Returns the register-name for the low-byte of the given register"""
+        if reg[1].isdigit():
+            # r8 - r15
+            return reg + "b"
         return reg.replace("r", "").replace("x", "") + "l"
 
 
+class FunctionInfo(Visitor):
+    """ Collects the information about a function that is needed to choose the registers for it's variables and the kind of it's stack-frame:
+    How often the local variables are read and written (accesses inside loops count loopweight times as much for every loop they are nested in,
+    with a profile (see --use-profile) every access counts as often as it was executed), if the function calls other functions or divides, how many registers it's expressions need and how much space the calls need for the
+    arguments that are passed on the stack"""
+
+    def __init__(self, localvars, count=None):
+        """ Dict of variable-name to it's weighted number of accesses"""
+        self.uses = Counter()
+        """ The local variables of the function. Accesses to globals are not counted"""
+        self.localvars = localvars
+        """ The weight of the code that runs once per call of the function: 1, or the number of calls measured by the profile"""
+        self.entry = 1 if count is None else count
+        """ True if the weights are the execution-counts of a profile"""
+        self.profiled = count is not None
+        """ The current weight of an access"""
+        self.weight = self.entry
+        """ True if the function calls other functions (including the builtins)"""
+        self.calls = False
+        """ True if the function contains divisions (which need spill-slots, see ASMGenerator.division())"""
+        self.divisions = False
+        """ The maximum number of registers any expression of the function needs (see registers())"""
+        self.registers = 0
+        """ The size of the outgoing-argument area: the bytes needed for the arguments (after the sixth) of the call with the most arguments"""
+        self.outgoing = 0
+        super().__init__()
+
+    def expression(self, exp):
+        self.registers = max(self.registers, registers(exp))
+        self.visit(exp)
+
+    def visitVar(self, node):
+        if node.name in self.localvars:
+            self.uses[node.name] += self.weight
+
+    def visitBinary(self, node):
+        if node.op == "/":
+            self.divisions = True
+        super().visitBinary(node)
+
+    def visitCall(self, node):
+        self.calls = True
+        self.outgoing = max(self.outgoing, 8*(len(node.args)-len(argorder)))
+        super().visitCall(node)
+
+    def visitAssign(self, node):
+        if node.name in self.localvars:
+            self.uses[node.name] += self.weight
+        self.expression(node.value)
+
+    def visitLocaldef(self, node):
+        self.visitAssign(node)
+
+    def visitIf(self, node):
+        self.expression(node.exp)
+        weight = self.weight
+        profiled = self.profiled and node.count is not None
+        if profiled:
+            self.weight = node.taken
+        for statement in node.statements:
+            self.visit(statement)
+        if profiled:
+            self.weight = node.count - node.taken
+        for statement in node.elsestatements or []:
+            self.visit(statement)
+        self.weight = weight
+
+    def visitWhile(self, node):
+        weight = self.weight
+        if self.profiled and node.count is not None:
+            # the condition is checked once more every time the loop is entered
+            self.weight = node.count + (node.entries or 0)
+            self.expression(node.exp)
+            self.weight = node.count
+        else:
+            self.weight *= loopweight
+            self.expression(node.exp)
+        for statement in node.statements:
+            self.visit(statement)
+        self.weight = weight
+
+    def visitReturn(self, node):
+        if node.expression:
+            self.expression(node.expression)
+
+
+def functioninfo(node):
+    info = FunctionInfo(node.localvars, node.count)
+    for statement in node.statements:
+        info.visit(statement)
+    return info
+
+
+def registers(exp):
+    """ Returns the number of registers needed to evaluate the expression (without saving registers on the stack).
+    The value of the first operand of a binary operation is kept while the second is computed"""
+    t = type(exp)
+    if t == ast.Binary:
+        return max(registers(exp.val1), registers(exp.val2) + 1)
+    if t == ast.Unary:
+        return registers(exp.val)
+    return 1
+
+
+def hascalls(exp):
+    """ Returns true if evaluating the expression calls a function (which overwrites the caller-saved registers)"""
+    t = type(exp)
+    if t == ast.Call:
+        return True
+    if t == ast.Binary:
+        return hascalls(exp.val1) or hascalls(exp.val2)
+    if t == ast.Unary:
+        return hascalls(exp.val)
+    return False
+
+
 class ASMGenerator(Visitor):
     """ A code-generator that takes an annotated AST as input and outputs linux x86-64 assembly code.
     As all Generators this one extends Visitor to traverse the AST.
@@ -93,9 +283,26 @@ class ASMGenerator(Visitor):
     Generated code for a node is independent of the nodes context (happends always the same way no matter what nodes are before or after it)(excluding register allocation)
 
     The generated code (mostly) honors the SystemV x86-64 calling convention and can therefore interact with c-functions (like from glibc).
+
+    If profile is true, the generated code is instrumented (see --profile). Every function, call-site, WHILE and IF gets counters in a
+    table in the .data section. The table registers itself at the profiling-runtime (see dbc.runtime.profileruntime()), which writes
+    the counters to a file when the programm exits.
+
+    Functions address their stack-frame relative to the frame-pointer %rbp. Without debug-information, leaf-functions (with -O1) and all functions
+    (with omitframepointer, see --omit-frame-pointer) do not set up %rbp and address their frame relative to %rsp instead. Leaf-functions with
+    small frames do not even allocate a frame, their variables live in the red-zone below %rsp.
+    The layout of every frame is fixed when the function is entered: The local variables, the spill-slots (see RegisterAllocator), the saved
+    callee-saved registers and at the bottom the outgoing-argument area, for the arguments of calls that are passed on the stack. The frame is padded,
+    so %rsp is 16-byte aligned at every call (as the ABI requires) and never changes inside the function.
+
+    If debuginfo is true (see -g), the generated code contains .loc directives for every statement (gas turns them into DWARF line-information)
+    and CFI directives for every function, so debuggers and profilers (gdb, perf) can map addresses back to DBASIC source-lines.
+
+    The functions listed in memoize (see --memoize and dbc.purity) are memoized: The exported symbol of such a function is a wrapper,
+    that looks up the arguments in the function's table in the .bss section and only calls the actual function (<name>.body) on a miss.
     """
 
-    def __init__(self):
+    def __init__(self, profile=False, filename=None, debuginfo=False, optimize=0, memoize=None, omitframepointer=False):
         """ count the generated labels to always generate unique ones"""
         self.labelcounter = 0
         """ constants of this programm. Obtained fromm annotated AST"""
@@ -106,10 +313,57 @@ class ASMGenerator(Visitor):
         self.localvars = None
         """ map from variable name to %ebp offset. Needed to locate local variables on the stack """
         self.localvaroffsets = dict()
+        """ map from variable name to the callee-saved register the variable is kept in (instead of the stack). Only with optimizations"""
+        self.varregs = dict()
+        """ If true, instrument the generated code with profiling-counters"""
+        self.profile = profile
+        """ The name of the compiled source-file. Is stored in the profile and the debug-information, so the source-lines can be shown"""
+        self.filename = filename or "<stdin>"
+        """ The entries of the profiling-table. List of (kind, function, line, ordinal, target) tuples. The index is the entry's position in the table"""
+        self.probes = []
+        """ Counts the probes of every kind in the current function. Used to number probes that are on the same line"""
+        self.ordinals = Counter()
+        """ The function that is currently generated"""
+        self.funcname = None
+        """ %rbp offset of the stack-slot holding the timestamp of the function-entry (only when profiling)"""
+        self.entrytime = None
+        """ The profiling-entry of the current function"""
+        self.funcprobe = None
+        """ Code of rarely executed blocks of the current function. Is placed behind the function, so it does not disturb the hot path (see --use-profile)"""
+        self.coldcode = ""
+        """ If true, emit debug-information"""
+        self.debuginfo = debuginfo
+        """ The optimization-level. With 1 or more, loops are rotated, comparisons are fused with jumps, constants are used as immediate operands
+        and the most used local variables are kept in callee-saved registers"""
+        self.optimize = optimize or 0
+        """ The functions to memoize. Dict of function-name to the number of it's table"""
+        self.memoize = {name: i for i, name in enumerate(memoize or [])}
+        """ The symbol-table of the programm. Obtained fromm annotated AST"""
+        self.symbols = None
+        """ If true, no function sets up a frame-pointer (unless debuginfo is true)"""
+        self.omitframepointer = omitframepointer
+        """ How the stack-frame of the current function is addressed. See framekind()"""
+        self.frame = "rbp"
+        """ The size of the local variables in the stack-frame of the current function"""
+        self.framesize = 0
+        """ The size of the outgoing-argument area of the current function (see FunctionInfo.outgoing)"""
+        self.outgoing = 0
+        """ The bytes of all stack-frames needed for local variables, if every variable had it's own slot and with shared slots (see --stats)"""
+        self.framebefore = 0
+        self.frameafter = 0
 
         self.regs = RegisterAllocator()
+        self.regs.spill = self.spillslot
         super().__init__()
 
+    def visit(self, node):
+        # calls the method directly from the dispatch-table (see dbc.visit.Visitor), visit() is called for every node
+        code = self.dispatch[type(node)](self, node)
+        # with debug-information, mark where the code of every statement starts
+        if self.debuginfo and type(node) in statementtypes and (type(node) != ast.Call or node.isStatement):
+            return ".loc 1 {}\n".format(node.line) + code
+        return code
+
     def generate(self, node):
         """ Main generate method.
 
@@ -118,30 +372,37 @@ class ASMGenerator(Visitor):
         """
         # obtain globals and constants from annotated AST
         self.constants = node.constants
-        self.globalvars = node.globalvars
+        self.symbols = node.symbols
+        self.globalvars = self.symbols.globalvars
         return self.visitProgramm(node)
 
     def visitProgramm(self, node):
         # write the assembly header
-        code = dedent("""\
-        .file	"test.c"
-            .text
-            .globl	main
-            .type	main, @function
-
-
-        """)
+        code = ".file \"{}\"\n".format(
+            self.escape(os.path.basename(self.filename)))
+        if self.debuginfo:
+            # the .loc directives refer to the source-file by number
+            code += ".file 1 \"{}\"\n".format(self.escape(self.filename))
+        code += "    .text\n\n\n"
         # generate code for all functions of the programm recursively
         for func in node.funcdefs:
             code += self.visit(func)
 
-        # append code for the builtin functions
-        code += self.builtinFunctions()
+        # the builtin functions are not part of the generated code. They live in the runtime-object (see dbc.runtime) that is linked to every programm
 
         # start and fill the section containing global variables
         code += ".data\n"
         code += self.globalVariables(node)
 
+        if self.profile:
+            code += self.profileTable()
+
+        if self.memoize:
+            code += self.memoTables()
+
+        # mark the stack as non-executable. Otherwise the linker would assume the programm needs an executable stack
+        code += ".section .note.GNU-stack,\"\",@progbits\n"
+
         # sanity check. if there are registers in-use after compilation, there is a bug in this code
         if len(self.regs.inuse) != 0:
             print("WARNING: Some registers still in use after completed compilation!")
@@ -149,136 +410,397 @@ class ASMGenerator(Visitor):
         return code
 
     def visitFuncdef(self, node):
-        # calculate %ebp offsets for all local variables and the total size of this functions stackframe
-        # assumes that all variables are 8 bytes long
         self.localvars = node.localvars
-        for i, k in enumerate(self.localvars.keys()):
-            self.localvaroffsets[k] = (i+1)*8
-        stacksize = len(self.localvars)*8
+        self.funcname = node.name
+        self.ordinals = Counter()
+        info = functioninfo(node)
+        # with optimizations, the most used variables live in registers. They need no memory-accesses
+        self.varregs = self.promote(node, info) if self.optimize else dict()
+        # the remaining callee-saved registers can be used for temporary values, but are only chosen if all caller-saved ones are in use
+        self.regs.registerlist = [reg for reg in callersaved + calleesaved
+                                  if reg not in self.varregs.values()]
+        self.regs.used = set(self.varregs.values())
 
-        # generate function prologue. Store old %ebp, setup %ebp and reserve space for local variables
-        code = node.name + ":\n"
-        code += "push %rbp\n"
-        code += "mov %rsp, %rbp\n"
-        code += "sub ${}, %rsp\n".format(stacksize)
-
-        # move the arguments from the registers they were passed in to their local variable on the stack
-        for i, arg in enumerate(node.args):
-            code += "mov %{}, -{}(%rbp)\n".format(
-                self.regs.argorder[i], self.localvaroffsets[arg])
+        # calculate the offsets for all local variables (that are not kept in registers)
+        # assumes that all variables are 8 bytes long
+        variables = [k for k in self.localvars.keys() if k not in self.varregs]
+        if self.optimize:
+            # variables that are never live at the same time share a slot
+            slots, count = stackslots.color(node, variables)
+        else:
+            slots, count = {k: i for i, k in enumerate(variables)}, len(variables)
+        self.localvaroffsets = {k: (slot+1)*8 for k, slot in slots.items()}
+        stacksize = count*8
+        self.framebefore += len(variables)*8
+        self.frameafter += stacksize
+        if self.profile:
+            # reserve a slot for the entry-timestamp. Use 16 bytes to not change the alignment of the stack
+            self.entrytime = stacksize+8
+            stacksize += 16
+            # count the call. This happens before the body, so the function's entry comes first in the profiling-table
+            self.funcprobe = self.probe("func", node.line, node.name)
+        self.framesize = stacksize
+        self.outgoing = info.outgoing
+        self.frame = self.framekind(info, stacksize)
 
         # generate code for all statements of the functions
+        self.coldcode = ""
+        self.regs.maxdepth = 0
+        body = ""
         for statement in node.statements:
-            code += self.visit(statement)
+            body += self.visit(statement)
+        # place the rarely executed blocks (see visitIf) behind the function. Functions always end with a RETURN (or an IF whose blocks all end with one, see dbc.deadcode),
+        # so they are never executed by accident
+        body += self.coldcode
+        # sanity check. Signal-handlers may overwrite everything below the red-zone
+        if self.frame == "redzone" and stacksize + self.regs.maxdepth*8 > redzone:
+            raise VisitorError(
+                "Function {} uses the red-zone, but it's frame does not fit into it".format(node.name))
+
+        # now it is known which callee-saved registers the function uses. They are saved in the stack-frame and restored at every RETURN
+        saved = [reg for reg in calleesaved if reg in self.regs.used]
+        code, epilogue = self.prologue(node, saved)
+        body = body.replace(epiloguemarker, epilogue)
+
+        # move the arguments from the registers they were passed in to their local variable (on the stack or in a register)
+        for i, arg in enumerate(node.args[:len(argorder)]):
+            if self.varregs.get(arg) != argorder[i]:
+                code += "mov %{}, {}\n".format(argorder[i], self.location(arg))
+        # the remaining arguments were passed on the stack, above the return-address. Memory can only be copied via a register
+        for i, arg in enumerate(node.args[len(argorder):]):
+            code += "mov {}, %rax\n".format(self.incoming(i, len(saved)))
+            code += "mov %rax, {}\n".format(self.location(arg))
+
+        if self.profile:
+            # remember when the function was entered. rdtsc overwrites %rdx, so the arguments need to be saved first
+            code += "incq {}\n".format(self.counter(self.funcprobe))
+            code += "rdtsc\n"
+            code += "shl $32, %rdx\n"
+            code += "or %rdx, %rax\n"
+            code += "mov %rax, {}\n".format(self.slot(self.entrytime))
+
+        code += body
+        if self.debuginfo:
+            code += ".cfi_endproc\n"
+        # tell the linker (and tools like perf) how big the function is
+        code += ".size {0}, .-{0}\n".format(self.label(node))
 
         return code+"\n\n"
 
+    def label(self, node):
+        """ Returns the label of the code of the given function"""
+        if node.name in self.memoize:
+            return node.name + ".body"
+        return node.name
+
+    def prologue(self, node, saved):
+        """ Generate the code that sets up the stack-frame of the function and saves the given callee-saved registers.
+        Returns the code and the epilogue, that restores the registers and removes the frame before a RETURN"""
+        label = self.label(node)
+        if node.name in self.memoize:
+            # the exported symbol is the wrapper that looks up the results. The function itself is only visible in this file
+            code = self.memoWrapper(node)
+        else:
+            # export the function, so it can be called from other object-files
+            code = ".globl {}\n".format(node.name)
+        code += ".type {}, @function\n".format(label)
+        code += label + ":\n"
+
+        if self.frame != "rbp":
+            # without frame-pointer the registers are pushed. The frame is allocated below them and addressed relative to %rsp
+            epilogue = ""
+            for reg in saved:
+                code += "push %{}\n".format(reg)
+                epilogue = "pop %{}\n".format(reg) + epilogue
+            if self.frame == "rsp":
+                size = self.allocation(len(saved))
+                if size:
+                    code += "sub ${}, %rsp\n".format(size)
+                    epilogue = "add ${}, %rsp\n".format(size) + epilogue
+            return code, epilogue
+
+        if self.debuginfo:
+            # describe how to find the return-address and the caller's %rbp (the 'canonical frame address') at every point of the function
+            code += ".cfi_startproc\n"
+            code += ".loc 1 {}\n".format(node.line)
+        # generate function prologue. Store old %ebp, setup %ebp and reserve space for the frame
+        code += "push %rbp\n"
+        if self.debuginfo:
+            code += ".cfi_def_cfa_offset 16\n"
+            code += ".cfi_offset %rbp, -16\n"
+        code += "mov %rsp, %rbp\n"
+        if self.debuginfo:
+            # from here on, the frame is addressed relative to %rbp
+            code += ".cfi_def_cfa_register %rbp\n"
+        size = self.allocation(len(saved))
+        if size:
+            code += "sub ${}, %rsp\n".format(size)
+        # the callee-saved registers are saved in the stack-frame below the local variables and spill-slots
+        epilogue = ""
+        for i, reg in enumerate(saved):
+            offset = self.framesize + self.regs.maxdepth*8 + (i+1)*8
+            code += "mov %{}, -{}(%rbp)\n".format(reg, offset)
+            if self.debuginfo:
+                # the canonical frame address is 16 bytes above %rbp
+                code += ".cfi_offset %{}, -{}\n".format(reg, offset+16)
+            epilogue += "mov -{}(%rbp), %{}\n".format(offset, reg)
+        # dealocate the stack-frame with 'leave'
+        return code, epilogue + "leave\n"
+
+    def allocation(self, saved):
+        """ Returns the number of bytes the prologue subtracts from %rsp, if the given number of callee-saved registers is saved.
+        Contains the local variables, the spill-slots, the outgoing-argument area and padding that keeps %rsp 16-byte aligned for calls:
+        The return-address and the pushes (of %rbp or the callee-saved registers) already moved %rsp by 8 bytes each"""
+        size = self.framesize + self.regs.maxdepth*8 + self.outgoing
+        if self.frame == "rbp":
+            # the saved registers are stored in the frame, only %rbp is pushed
+            size += saved*8
+            pushed = 1
+        else:
+            pushed = saved
+        return size + (8 + pushed*8 + size) % 16
+
+    def incoming(self, index, saved):
+        """ Returns the operand to access the argument (after the sixth) with the given index (starting at 0), that was passed on the stack.
+        The given number of callee-saved registers is saved by the prologue"""
+        if self.frame == "rbp":
+            # above the saved %rbp and the return-address
+            return "{}(%rbp)".format(16 + index*8)
+        # above the frame, the pushed registers and the return-address
+        size = self.allocation(saved) if self.frame == "rsp" else 0
+        return "{}(%rsp)".format(size + saved*8 + 8 + index*8)
+
+    def framekind(self, info, stacksize):
+        """ Returns how the stack-frame of the current function is addressed:
+        - rbp: %rbp points to the frame (frame-pointer). Always used with debug-information
+        - rsp: The frame is addressed relative to %rsp
+        - redzone: The frame is not allocated at all, the variables live below %rsp. Only for leaf-functions whose variables and spill-slots fit
+          into the red-zone
+        """
+        leaf = not info.calls
+        if self.debuginfo or not (self.omitframepointer or (self.optimize and leaf)):
+            return "rbp"
+        # spill-slots are only needed for divisions (three of them) and if there are not enough registers for an expression
+        spills = 24 if info.divisions else 0
+        if leaf and info.registers <= len(self.regs.registerlist) and stacksize + spills <= redzone:
+            return "redzone"
+        return "rsp"
+
+    def promote(self, node, info):
+        """ Choose the local variables of the function that are kept in registers. Leaf-functions can use caller-saved registers that are not needed
+        for the arguments and the expressions. Every variable in a callee-saved register costs a save and a restore of the register per call, so only variables
+        that are accessed more often than that are kept in one.
+        Returns a dict of variable-name to register"""
+        # the arguments are written once when the function is entered
+        incoming = dict()
+        for arg, reg in zip(node.args, self.regs.argorder):
+            info.uses[arg] += info.entry
+            incoming[arg] = reg
+        free = []
+        if not info.calls:
+            # leave enough registers for evaluating the expressions
+            free = leafregisters[:max(0, len(callersaved) - info.registers)]
+        saved = list(calleesaved)
+        varregs = dict()
+        for name, count in info.uses.most_common():
+            if incoming.get(name) in free:
+                # in leaf-functions, the arguments can stay in the registers they are passed in
+                reg = incoming[name]
+            else:
+                # an argument can not be moved to the register of another argument, that is moved later
+                reg = next((r for r in free if name not in incoming or r not in incoming.values()), None)
+            if reg:
+                free.remove(reg)
+            elif saved and count > 2 * info.entry:
+                reg = saved.pop(0)
+            else:
+                continue
+            varregs[name] = reg
+        return varregs
+
+    def location(self, name):
+        """ Returns the operand to access the given local variable"""
+        if name in self.varregs:
+            return "%" + self.varregs[name]
+        # local variables are located on the stack relative to %ebp
+        return self.slot(self.localvaroffsets[name])
+
+    def slot(self, offset):
+        """ Returns the operand to access the stack-slot at the given offset of the stack-frame (see framekind())"""
+        if self.frame == "rsp":
+            # the frame starts above the outgoing-argument area. The slots are numbered from it's end
+            return "{}(%rsp)".format(self.outgoing + self.framesize - offset)
+        if self.frame == "redzone":
+            return "-{}(%rsp)".format(offset)
+        return "-{}(%rbp)".format(offset)
+
+    def spillslot(self, number):
+        """ Returns the operand to access the spill-slot with the given number. The spill-slots follow the local variables"""
+        if self.frame == "rsp":
+            # the slots with higher numbers are closer to the pushed registers
+            return "{}(%rsp)".format(self.outgoing + self.framesize + number*8)
+        return self.slot(self.framesize + (number+1)*8)
+
     def visitCall(self, node):
         target = self.regs.target
-        # take note of all registers that were in use at this point
-        callersaved = list(self.regs.inuse)
+        # take note of all registers that were in use at this point. Only the caller-saved ones need to be saved, the called function preserves the others.
+        # The argument-registers are saved when they are allocated for the arguments
+        arguments = argorder[:len(node.args)]
+        spilled = [reg for reg in callersaved if reg in self.regs.inuse and reg not in arguments]
         code = ""
 
         # allocate the parameter-registers and place parameters in them
-        for i, arg in enumerate(node.args):
-            # save previous content of the register to the stack. Also the following expression will place it's result in self.regs.argorder[i]
-            code += self.regs.allocate(self.regs.argorder[i])
+        for i, arg in enumerate(node.args[:len(argorder)]):
+            # save previous content of the register to a spill-slot. Also the following expression will place it's result in argorder[i]
+            code += self.regs.allocate(argorder[i])
             # generate the code to compute the parameter
             code += self.visit(arg)
             # mark the resgiter as in-use to save it from beeing overwritten
-            self.regs.mark_used(self.regs.argorder[i])
+            self.regs.mark_used(argorder[i])
 
-        # save all in-use registers (except argument-registers) to the stack (caller-saved)
-        for reg in callersaved:
+        # the remaining arguments are passed on the stack. They are computed into registers first, as calls in the following arguments would
+        # overwrite the outgoing-argument area
+        stackargs = []
+        for arg in node.args[len(argorder):]:
+            reg = self.regs.choose(exclude=arguments)
+            code += self.regs.allocate(reg)
+            code += self.visit(arg)
+            self.regs.mark_used(reg)
+            stackargs.append(reg)
+        # the register of an argument may have been borrowed for a later one. Freeing the later one restores it
+        for i in range(len(stackargs)-1, -1, -1):
+            code += "mov %{}, {}(%rsp)\n".format(stackargs[i], i*8)
+            code += self.regs.free(stackargs[i])
+
+        # save the in-use caller-saved registers (except argument-registers) to spill-slots
+        for reg in spilled:
             # allcate() will save the contants and mark the registers as free to use
             code += self.regs.allocate(reg)
 
+        # count how often this call-site is executed. inc does not modify any register
+        if self.profile:
+            code += "incq {}\n".format(self.counter(
+                self.probe("call", node.line, node.name)))
+
         # perform the function call
         code += "call {}\n".format(node.name)
 
         # If the calls return value is needed and the target-register is not rax, move the result to the target register
-        if not node.isStatement and target != None:
-            self.regs.mark_used(target)
-            if target != "rax":
-                code += "mov %rax, %{}\n".format(target)
+        result = not node.isStatement and target != None
+        if result and target != "rax":
+            code += "mov %rax, %{}\n".format(target)
 
         # restore the registers that were saved before call()
-        for reg in reversed(callersaved):
+        for reg in reversed(spilled):
             # free() will restore the contents saved by allocate()
             code += self.regs.free(reg)
 
         # free all argument-registers. Restores their values if they were in use before call()
-        for i in range(len(node.args), 0, -1):
-            code += self.regs.free(self.regs.argorder[i-1])
+        for reg in reversed(arguments):
+            code += self.regs.free(reg)
+
+        # the target was not in use before the call (so nothing restored it), but may be one of the argument-registers freed above
+        if result:
+            self.regs.mark_used(target)
 
         return code
 
     def visitBinary(self, exp):
         # store whoch register the parent-expression expects the result in
         reg1 = self.regs.target
+        result = reg1
+        code = ""
+        holder = self.holder(exp.val2)
+        if holder:
+            # value1 would need to be saved around the calls in value2. Compute it in a callee-saved register instead, that survives the calls
+            reg1 = holder
+            code += self.regs.allocate(reg1)
         # generate code to obtain value1 of the binary operator
         # will inherit self.regs.target, so the results of val1 will already be in the correct register
-        code = self.visit(exp.val1)
-        # choose and allocate a register for val2
-        reg2 = self.regs.choose(exclude=[reg1])
-        code += self.regs.allocate(reg2)
-        # generate code to obtain value2 of the binary operator
-        # result will be in the previously allocated register
-        code += self.visit(exp.val2)
+        code += self.visit(exp.val1)
+        operand = self.operand(exp.val2)
+        if operand and exp.op != "/":
+            # with optimizations, constants and variables in registers are used directly as operand. This saves a register and an instruction
+            reg2 = None
+        else:
+            # choose and allocate a register for val2
+            reg2 = self.regs.choose(exclude=[reg1])
+            code += self.regs.allocate(reg2)
+            # generate code to obtain value2 of the binary operator
+            # result will be in the previously allocated register
+            code += self.visit(exp.val2)
+            operand = "%"+reg2
 
         # generate the code to compute the waned result from value1 and value2
         if exp.op == "+":
-            code += "add %{1}, %{0}\n"
+            code += "add {1}, %{0}\n"
         elif exp.op == "-":
-            code += "sub %{1}, %{0}\n"
+            code += "sub {1}, %{0}\n"
+        elif exp.op == "*":
+            code += "imul {1}, %{0}\n"
+        elif exp.op == "/":
+            code += self.division(reg1, reg2)
         elif exp.op == "|":
-            code += "or %{1}, %{0}\n"
+            code += "or {1}, %{0}\n"
         elif exp.op == "&":
-            code += "and %{1}, %{0}\n"
+            code += "and {1}, %{0}\n"
         # the comparison operators need to use setXX because following statements will expect a value in %rax (0 if false, something else if true)
         # setting flags in the flag-register is not always enough
         elif exp.op == "==":
-            code += "cmp %{1}, %{0}\n"
+            code += "cmp {1}, %{0}\n"
             code += "mov $0, %{0}\n"
             code += "sete %{2}\n"
         elif exp.op == "!=":
-            code += "cmp %{1}, %{0}\n"
+            code += "cmp {1}, %{0}\n"
             code += "mov $0, %{0}\n"
             code += "setne %{2}\n"
         elif exp.op == "<":
-            code += "cmp %{1}, %{0}\n"
+            code += "cmp {1}, %{0}\n"
             code += "mov $0, %{0}\n"
             code += "setl %{2}\n"
         elif exp.op == ">":
-            code += "cmp %{1}, %{0}\n"
+            code += "cmp {1}, %{0}\n"
             code += "mov $0, %{0}\n"
             code += "setg %{2}\n"
         elif exp.op == "<=":
-            code += "cmp %{1}, %{0}\n"
+            code += "cmp {1}, %{0}\n"
             code += "mov $0, %{0}\n"
             code += "setle %{2}\n"
         elif exp.op == ">=":
-            code += "cmp %{1}, %{0}\n"
+            code += "cmp {1}, %{0}\n"
             code += "mov $0, %{0}\n"
             code += "setge %{2}\n"
         else:
             raise VisitorError(
                 "Unsupported binary operation: "+exp.op)
         # fill the chosen registers into the code-template
-        code = code.format(reg1, reg2, self.regs.low(reg1))
+        code = code.format(reg1, operand, self.regs.low(reg1))
         # free reg2, as it is not needed anymore
-        code += self.regs.free(reg2)
+        if reg2:
+            code += self.regs.free(reg2)
+        if holder:
+            # move the result to the register the parent-expression expects it in
+            code += "mov %{}, %{}\n".format(reg1, result)
+            code += self.regs.free(reg1)
+            self.regs.mark_used(result)
 
         return code
 
+    def visitUnary(self, node):
+        # compute the value into the target register and negate it there
+        reg = self.regs.target
+        code = self.visit(node.val)
+        code += "neg %{}\n".format(reg)
+        return code
+
     def visitVar(self, node):
         # mark the target-register as in-use, as it now contains a value
         reg = self.regs.target
         self.regs.mark_used(reg)
         # check if the value of a global or a local variable is needed
         if node.name in self.localvars:
-            # local variables are located on the stack relative to %ebp
-            return "mov -{}(%rbp), %{}\n".format(self.localvaroffsets[node.name], reg)
+            # local variables are located on the stack relative to %ebp (or in a register)
+            return "mov {}, %{}\n".format(self.location(node.name), reg)
         else:
             # global variables are referenced via an assembler label with their name
             return "mov {}, %{}\n".format(node.name, reg)
@@ -298,9 +820,8 @@ class ASMGenerator(Visitor):
         code += self.visit(node.value)
         # check if we assign to a global or local variable
         if node.name in self.localvars:
-            # local variables are located on the stack relative to %ebp
-            code += "mov %{}, -{}(%rbp)\n".format(reg,
-                                                  self.localvaroffsets[node.name])
+            # local variables are located on the stack relative to %ebp (or in a register)
+            code += "mov %{}, {}\n".format(reg, self.location(node.name))
         else:
              # global variables are referenced via an assembler label with their name
             code += "mov %{}, {}\n".format(reg, node.name)
@@ -310,21 +831,41 @@ class ASMGenerator(Visitor):
         return code
 
     def visitIf(self, node):
-        # choose and allocate a register for the condition-result
-        reg = self.regs.choose()
-        code = self.regs.allocate(reg)
         # generate labels to jump to
         endif = self.getlabel("endif")
         endelse = self.getlabel("endelse")
-        # generate the code for the condition
-        code += self.visit(node.exp)
-        # at this point the register is not longer needed
-        code += self.regs.free(reg)
-        # the codition-expression will leave it's result in %rax
-        # 0 means false, anything else means true
-        # jump (skip the if block) if 0
-        code += "test %{},%{}\n".format(reg, reg)
-        code += "jz "+endif+"\n"
+        code = ""
+        if self.profile:
+            # count how often the condition is evaluated (first counter) and how often it is true (second counter)
+            entry = self.probe("if", node.line)
+            code += "incq {}\n".format(self.counter(entry))
+
+        # the profile says the condition is mostly false. Let the false-path fall through and move the if-block out of the way
+        if node.taken is not None and node.taken*2 < node.count:
+            iflabel = self.getlabel("if")
+            # jump to the if-block if the condition is true
+            code += self.condition(node.exp, iflabel, True)
+            ifblock = iflabel+":\n"
+            if self.profile:
+                ifblock += "incq {}\n".format(self.counter(entry, 1))
+            for statement in node.statements:
+                ifblock += self.visit(statement)
+            if node.elsestatements:
+                # place the if-block behind the else-block
+                for statement in node.elsestatements:
+                    code += self.visit(statement)
+                code += "jmp "+endif+"\n"
+                code += ifblock
+            else:
+                # place the if-block behind the function and jump back afterwards
+                self.coldcode += ifblock + "jmp "+endif+"\n"
+            code += endif+":\n"
+            return code
+
+        # jump (skip the if block) if the condition is false
+        code += self.condition(node.exp, endif, False)
+        if self.profile:
+            code += "incq {}\n".format(self.counter(entry, 1))
         # generate code for the if-block
         for statement in node.statements:
             code += self.visit(statement)
@@ -337,26 +878,39 @@ class ASMGenerator(Visitor):
             # if there is an else block, generate code for it
             for statement in node.elsestatements:
                 code += self.visit(statement)
-                code += endelse+":\n"
+            code += endelse+":\n"
         return code
 
     def visitWhile(self, node):
-        # choose and allocate a register for the condition-result
-        reg = self.regs.choose()
-        code = self.regs.allocate(reg)
-        self.regs.target = reg
         # generate labels to jump to
         startlabel = self.getlabel("whilestart")
         endlabel = self.getlabel("whileend")
+        code = ""
+        if self.profile:
+            # count the iterations (first counter) and how often the loop is entered (second counter)
+            entry = self.probe("loop", node.line)
+            code += "incq {}\n".format(self.counter(entry, 1))
+
+        if self.optimize:
+            # rotate the loop: the condition is checked at the bottom of the loop. Every iteration then only needs a single (conditional) jump
+            # instead of a conditional jump to leave the loop and an unconditional jump back to it's start
+            condlabel = self.getlabel("whilecond")
+            code += "jmp "+condlabel+"\n"
+            code += startlabel+":\n"
+            if self.profile:
+                code += "incq {}\n".format(self.counter(entry))
+            for statement in node.statements:
+                code += self.visit(statement)
+            code += condlabel+":\n"
+            code += self.condition(node.exp, startlabel, True)
+            return code
+
         # place the start-label
         code += startlabel+":\n"
-        # generate the code for the condition
-        code += self.visit(node.exp)
-        # at this point the register is not longer needed
-        code += self.regs.free(reg)
-        # if condition returned 0 via %rax, skip to endlabel
-        code += "test %{},%{}\n".format(reg, reg)
-        code += "jz "+endlabel+"\n"
+        # if condition is false, skip to endlabel
+        code += self.condition(node.exp, endlabel, False)
+        if self.profile:
+            code += "incq {}\n".format(self.counter(entry))
         # generate code for block
         for statement in node.statements:
             code += self.visit(statement)
@@ -375,8 +929,25 @@ class ASMGenerator(Visitor):
             code += self.visit(node.expression)
         # mark rax as available
         self.regs.free("rax")
-        # dealocate local variables with 'leave', return via 'ret'
-        code += "leave\nret\n"
+        if self.profile:
+            # add the cycles spent in this function to it's counter. The return-value in %rax is kept in %rcx meanwhile
+            code += "mov %rax, %rcx\n"
+            code += "rdtsc\n"
+            code += "shl $32, %rdx\n"
+            code += "or %rdx, %rax\n"
+            code += "sub {}, %rax\n".format(self.slot(self.entrytime))
+            code += "add %rax, {}\n".format(self.counter(self.funcprobe, 1))
+            code += "mov %rcx, %rax\n"
+        # restore the callee-saved registers and dealocate the stack-frame (see visitFuncdef), return via 'ret'
+        if self.debuginfo:
+            # code following the return (e.g. the rest of the function after a RETURN in an IF) still has the full frame
+            code += ".cfi_remember_state\n"
+            code += epiloguemarker
+            code += ".cfi_def_cfa %rsp, 8\n"
+            code += "ret\n"
+            code += ".cfi_restore_state\n"
+            return code
+        code += epiloguemarker + "ret\n"
         return code
 
     def visitStr(self, node):
@@ -398,6 +969,68 @@ class ASMGenerator(Visitor):
 
     # ---- Start of x64 specific helper functions
 
+    def condition(self, exp, label, jumpif):
+        """ Generate the code to evaluate the (BOOL) expression exp and jump to label if it's result equals jumpif.
+        With optimizations, comparisons are directly followed by the matching conditional jump, instead of turning the flags into 0/1 first."""
+        if self.optimize and type(exp) == ast.Binary and exp.op in jumps:
+            operand = self.operand(exp.val2)
+            if operand and type(exp.val1) == ast.Var and exp.val1.name in self.varregs:
+                # both operands are directly available
+                code = "cmp {}, %{}\n".format(
+                    operand, self.varregs[exp.val1.name])
+                jump = jumps[exp.op] if jumpif else jumps[negations[exp.op]]
+                return code + "{} {}\n".format(jump, label)
+            # evaluate both operands like visitBinary() does
+            reg1 = self.holder(exp.val2) or self.regs.choose()
+            code = self.regs.allocate(reg1)
+            code += self.visit(exp.val1)
+            if operand:
+                # constants (and variables in registers) can be compared directly
+                code += "cmp {}, %{}\n".format(operand, reg1)
+            else:
+                reg2 = self.regs.choose(exclude=[reg1])
+                code += self.regs.allocate(reg2)
+                code += self.visit(exp.val2)
+                code += "cmp %{}, %{}\n".format(reg2, reg1)
+                # mov does not modify the flags
+                code += self.regs.free(reg2)
+            code += self.regs.free(reg1)
+            jump = jumps[exp.op] if jumpif else jumps[negations[exp.op]]
+            return code + "{} {}\n".format(jump, label)
+
+        # choose and allocate a register for the condition-result
+        reg = self.regs.choose()
+        code = self.regs.allocate(reg)
+        # generate the code for the condition
+        code += self.visit(exp)
+        # at this point the register is not longer needed
+        code += self.regs.free(reg)
+        # 0 means false, anything else means true
+        code += "test %{},%{}\n".format(reg, reg)
+        code += ("jnz " if jumpif else "jz ") + label + "\n"
+        return code
+
+    def operand(self, exp):
+        """ Returns the operand to use exp directly in an instruction (with optimizations), if it is an immediate constant or a variable
+        kept in a register. Otherwise returns None"""
+        if not self.optimize:
+            return None
+        if type(exp) == ast.Const and isimmediate(exp.value):
+            return "$"+str(exp.value)
+        if type(exp) == ast.Var and exp.name in self.varregs:
+            return "%"+self.varregs[exp.name]
+        return None
+
+    def holder(self, exp):
+        """ Returns a free callee-saved register to keep a value in while exp is evaluated, if exp contains calls (with optimizations).
+        Otherwise returns None: The value stays in a caller-saved register, which is saved on the stack if exp contains calls"""
+        if not self.optimize or not hascalls(exp):
+            return None
+        for reg in self.regs.registerlist:
+            if reg in calleesaved and reg not in self.regs.inuse:
+                return reg
+        return None
+
     def getlabel(self, pfx, glob=False):
         """ Return the next unique label
 
@@ -411,21 +1044,165 @@ class ASMGenerator(Visitor):
             l = ".L"+l
         return l
 
-    def generateSyscall(self, call, *args):
-        """ generate the code needed to perform a syscall """
-        # the registers for passing arguments
-        regs = ["rdi", "rsi", "rdx", "r10", "r8", "r9"]
-        # choose syscall via number in %eax
-        code = "mov ${}, %eax\n".format(call)
-        i = 0
-        # place arguments in registers
-        for arg in args:
-            code += "mov {}, %{}\n".format(arg, regs[i])
-            i += 1
-        # perform syscall
-        code += "syscall\n"
+    def division(self, reg1, reg2):
+        """ Generate the code to divide reg1 by reg2 (result in reg1).
+        idiv always divides %rdx:%rax and places the result in %rax (and the remainder in %rdx). Any of them may currently be in use
+        (or even be reg1 or reg2), so their values are saved in spill-slots and restored afterwards.
+        The returned code is a template for str.format() (see visitBinary)"""
+        rdx = self.spillslot(self.regs.temporary())
+        rax = self.spillslot(self.regs.temporary())
+        divisor = self.spillslot(self.regs.temporary())
+        self.regs.release(3)
+        code = "mov %rdx, {}\n".format(rdx)
+        code += "mov %rax, {}\n".format(rax)
+        # the divisor is placed in memory, so it can not be overwritten when setting up %rax and %rdx
+        code += "mov {{1}}, {}\n".format(divisor)
+        code += "mov %{0}, %rax\n"
+        # sign-extend %rax into %rdx
+        code += "cqo\n"
+        code += "idivq {}\n".format(divisor)
+        code += "mov %rax, {}\n".format(divisor)
+        # restore %rax and %rdx (unless they are the target of the division, they are overwritten anyway)
+        if reg1 != "rax":
+            code += "mov {}, %rax\n".format(rax)
+        if reg1 != "rdx":
+            code += "mov {}, %rdx\n".format(rdx)
+        code += "mov {}, %{{0}}\n".format(divisor)
         return code
 
+    def probe(self, kind, line, target=None):
+        """ Add an entry to the profiling-table and return it's index
+
+        :params kind: What is counted. One of func, call, loop, if
+        :params line: The source-line of the counted node
+        :params target: The name of the called function (for func and call)
+        """
+        ordinal = self.ordinals[kind]
+        self.ordinals[kind] += 1
+        self.probes.append(
+            (kind, self.funcname, line, ordinal, target or "-"))
+        return len(self.probes)-1
+
+    def counter(self, entry, which=0):
+        """ Returns the address of one of the two counters of the given profiling-entry"""
+        # the table starts with a header of three quads. Every entry consists of two counters and a pointer to it's description
+        return ".Lprofile+{}".format(24 + entry*24 + which*8)
+
+    def memoWrapper(self, node):
+        """ Generate the exported wrapper of a memoized function. The layout of a table-entry is: valid-flag, arguments, result.
+        The wrapper uses the frame-pointer-based frame of a normal function: The arguments are kept in the stack-frame (the call overwrites the
+        argument-registers) together with the address of the table-entry"""
+        index = self.memoize[node.name]
+        args = len(node.args)
+        entrysize = (args + 2) * 8
+        entryslot = (args + 1) * 8
+        # keep the stack 16-byte aligned for the call of the function
+        stacksize = (entryslot + 15) // 16 * 16
+        code = ".globl {}\n".format(node.name)
+        code += ".type {}, @function\n".format(node.name)
+        code += node.name + ":\n"
+        if self.debuginfo:
+            code += ".cfi_startproc\n"
+            code += ".loc 1 {}\n".format(node.line)
+        code += "push %rbp\n"
+        if self.debuginfo:
+            code += ".cfi_def_cfa_offset 16\n"
+            code += ".cfi_offset %rbp, -16\n"
+        code += "mov %rsp, %rbp\n"
+        if self.debuginfo:
+            code += ".cfi_def_cfa_register %rbp\n"
+        code += "sub ${}, %rsp\n".format(stacksize)
+        for i in range(args):
+            code += "mov %{}, -{}(%rbp)\n".format(self.regs.argorder[i], (i+1)*8)
+
+        # hash the arguments. The upper bits of the product with the (odd) multiplier are the index of the entry
+        code += "mov %{}, %rax\n".format(self.regs.argorder[0])
+        for i in range(1, args):
+            code += "imul $31, %rax\n"
+            code += "add %{}, %rax\n".format(self.regs.argorder[i])
+        code += "movabs ${}, %rcx\n".format(purity.memomultiplier - 2**64)
+        code += "imul %rcx, %rax\n"
+        code += "shr ${}, %rax\n".format(64 - purity.memobits)
+        code += "imul ${}, %rax\n".format(entrysize)
+        code += "lea .Lmemo{}(%rax), %rax\n".format(index)
+        code += "mov %rax, -{}(%rbp)\n".format(entryslot)
+
+        # a valid entry with the same arguments contains the result
+        miss = self.getlabel("memomiss")
+        code += "cmpq $0, (%rax)\n"
+        code += "je {}\n".format(miss)
+        for i in range(args):
+            code += "cmp %{}, {}(%rax)\n".format(self.regs.argorder[i], (i+1)*8)
+            code += "jne {}\n".format(miss)
+        code += "mov {}(%rax), %rax\n".format((args+1)*8)
+        if self.debuginfo:
+            code += ".cfi_remember_state\n"
+            code += "leave\n"
+            code += ".cfi_def_cfa %rsp, 8\n"
+            code += "ret\n"
+            code += ".cfi_restore_state\n"
+        else:
+            code += "leave\nret\n"
+
+        # the argument-registers are unchanged. Compute the result and store it in the entry
+        code += miss + ":\n"
+        code += "call {}.body\n".format(node.name)
+        code += "mov -{}(%rbp), %rcx\n".format(entryslot)
+        for i in range(args):
+            code += "mov -{}(%rbp), %rdx\n".format((i+1)*8)
+            code += "mov %rdx, {}(%rcx)\n".format((i+1)*8)
+        code += "mov %rax, {}(%rcx)\n".format((args+1)*8)
+        code += "movq $1, (%rcx)\n"
+        code += "leave\n"
+        if self.debuginfo:
+            code += ".cfi_def_cfa %rsp, 8\n"
+        code += "ret\n"
+        if self.debuginfo:
+            code += ".cfi_endproc\n"
+        code += ".size {0}, .-{0}\n\n".format(node.name)
+        return code
+
+    def memoTables(self):
+        """ Generate the (zero-initialized) tables of the memoized functions in the .bss section"""
+        code = ".bss\n"
+        for name, index in self.memoize.items():
+            func = self.symbols.function(name)
+            code += ".align 16\n"
+            code += ".Lmemo{}:\n".format(index)
+            code += ".zero {}\n".format(purity.memoentries * (len(func.args) + 2) * 8)
+        return code + "\n"
+
+    def profileTable(self):
+        """ Generate the profiling-table and the code that registers it at the profiling-runtime when the programm starts.
+        The layout of the table is known to the profiling-runtime (see dbc.runtime.profileruntime())"""
+        code = ".align 8\n"
+        code += ".Lprofile:\n"
+        # pointer to the next table. Is set by the runtime
+        code += ".quad 0\n"
+        code += ".quad .Lprofilefile\n"
+        code += ".quad {}\n".format(len(self.probes))
+        for i in range(len(self.probes)):
+            code += ".quad 0, 0, .Lprofiledesc{}\n".format(i)
+        code += ".Lprofilefile:\n.string \"{}\"\n".format(
+            self.escape(self.filename))
+        # the entries describe themselfs, so the runtime does not need to know anything about them
+        for i, probe in enumerate(self.probes):
+            code += ".Lprofiledesc{}:\n.string \"{}\"\n".format(
+                i, "\\t".join(str(p) for p in probe))
+        # the constructor is called before main() and registers the table
+        code += ".section .init_array,\"aw\"\n"
+        code += ".align 8\n"
+        code += ".quad .Lprofileinit\n"
+        code += ".text\n"
+        code += ".Lprofileinit:\n"
+        code += "mov $.Lprofile, %rdi\n"
+        code += "jmp dbc_profile_register\n"
+        return code
+
+    def escape(self, string):
+        """ Escape the given string for use in a .string or .file directive"""
+        return string.replace("\\", "\\\\").replace("\"", "\\\"")
+
     def globalVariables(self, programm):
         """ Generate the code defining all global variables and their default values"""
         code = ""
@@ -433,23 +1210,7 @@ class ASMGenerator(Visitor):
         for k, v in programm.constants.items():
             code += "{}:\n.string \"{}\"\n\n".format(v, k)
 
-        for k, v in programm.globalvars.items():
+        for k, v in self.globalvars.items():
             code += "{}:\n.quad {}\n\n".format(k, v)
 
-        code += "inputbuf:\n.skip 128\n\n"
         return code
-
-    def builtinFunctions(self):
-        """ generate code for some builtin functions """
-        input = "\n\ninput:\n"
-        input += self.generateSyscall(0, "$0", "$inputbuf", "$127")
-        input += "mov $inputbuf, %rdi\n"
-        input += "call atoi\n"
-        input += "ret\n\n\n"
-        print = "\n\nprint:\n"
-        print += "mov $0, %rax\n"
-        print += "call printf\n"
-        print += "movq stdout(%rip), %rdi\n"
-        print += "call fflush\n"
-        print += "ret\n\n"
-        return input+print
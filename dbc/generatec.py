@@ -1,9 +1,8 @@
-import dbc.ast as ast
-
-
 from textwrap import dedent
 
 import dbc.ast as ast
+import dbc.purity as purity
+from dbc.constprop import wrap
 from dbc.visit import Visitor, VisitorError
 
 
@@ -18,9 +17,21 @@ class CGenerator(Visitor):
     The code-generator can rely on the AST beeing correct.
     """
 
-    def __init__(self):
+    def __init__(self, wholeprogramm=True, externals=None, memoize=None):
+        """ If true, the AST is the complete programm. All functions except main are then declared static, which gives the c-compiler more freedom to optimize them.
+        Must be false if the generated code is linked together with other compilation-units that call it's functions."""
+        self.wholeprogramm = wholeprogramm
+        """ Definitions (ast.FuncDef) of functions that are defined in other compilation-units. Prototypes are generated for them"""
+        self.externals = externals or dict()
+        """ The names of the functions to memoize (see --memoize). Calls look up the arguments in a table first (see memoWrapper())"""
+        self.memoize = set(memoize or [])
         self.localvars = dict()
+        """ The code that has to run before the current statement, because it computes operands into temporaries (see ordered())"""
+        self.prelude = ""
+        """ The number of temporaries declared in the current function"""
+        self.temporaries = 0
         self.globalvars = dict()
+        self.globalvartypes = dict()
         super().__init__()
 
     def generate(self, node):
@@ -33,7 +44,8 @@ class CGenerator(Visitor):
         return self.visitProgramm(node)
 
     def visitProgramm(self, node):
-        self.globalvars = node.globalvars
+        self.globalvars = node.symbols.globalvars
+        self.globalvartypes = node.symbols.globalvartypes
 
         # make some default-includes
         # inputbuffer is some buffer for the builtin input() function
@@ -42,15 +54,24 @@ class CGenerator(Visitor):
                 # include <string.h>
                 # include <stdlib.h>
                 # include <stdarg.h>
-                char inputbuffer[60];
+                # include <stdint.h>
+                static char inputbuffer[60];
                 """)
-        # declare all globals
+        # declare all globals. They are only visible inside of this programm
         for k, v in self.globalvars.items():
-            code += "int {} = {};\n".format(k, v)
+            code += "static {} {} = {};\n".format(
+                self.ctype(self.globalvartypes[k]), k, v)
 
         # add code for builtin functions
         code += self.builtinFunctions()
 
+        # declare all functions before they are defined, so they can be called in any order
+        for func in list(self.externals.values()) + node.funcdefs:
+            code += self.prototype(func) + ";\n"
+            if func.name in self.memoize:
+                code += self.prototype(func, func.name+"_body") + ";\n"
+        code += "\n"
+
         # generate code for the childnodes of ast.Programm and append it
         for func in node.funcdefs:
             code += self.visit(func)
@@ -59,33 +80,61 @@ class CGenerator(Visitor):
 
     def visitFuncdef(self, node):
         # generate function-code
-        code = "int " + node.name + "("
-        code += ",".join([("int "+x) for x in node.args])
-        code += "){\n"
+        if node.name in self.memoize:
+            code = self.memoWrapper(node)
+            code += self.prototype(node, node.name+"_body")
+        else:
+            code = self.prototype(node)
+        code += "{\n"
+        self.localvars = node.localvartypes
+        self.temporaries = 0
+        # DBASIC variables are visible in the whole function (and not only in the block they are declared in). Declare them all at the top.
+        for name, vartype in node.localvartypes.items():
+            if name not in node.args:
+                code += "{} {};\n".format(self.ctype(vartype), name)
         for statement in node.statements:
             code += self.visit(statement)
         code += "}\n\n"
         return code
 
+    def visitUnary(self, node):
+        return "("+node.op+self.visit(node.val)+")"
+
     def visitBinary(self, exp):
         # generate binary expressions. They are always enclosed in () to make clear how the compiler interpreded the original expression
         # in regards to operator priority
-        return "("+self.visit(exp.val1)+exp.op+self.visit(exp.val2)+")"
+        op = exp.op
+        # For BOOLs & and | are logical operations. Use the logical operators of c, they are easier to optimize.
+        # As && and || do not evaluate their right operand if the left one already decides the result, this is only allowed if
+        # the right operand does not have side-effects (does not contain function-calls).
+        if exp.type == "BOOL" and op in ["&", "|"] and not self.hascalls(exp.val2):
+            op = op+op
+        val1, val2 = self.ordered([exp.val1, exp.val2])
+        return "("+val1+op+val2+")"
 
     def visitVar(self, node):
         # just print the name of the referenced variable
         return str(node.name)
 
     def visitConst(self, node):
-        # just print the value of the constant
-        return str(node.value)
+        # a plain literal would be an int (32bits). Operations on constants (and constants passed to print()) need 64bits
+        if node.type == "BOOL":
+            return "((_Bool){})".format(node.value)
+        value = wrap(int(node.value))
+        # the literal 9223372036854775808 is too big for int64_t, so -9223372036854775808 is not a valid constant
+        if value == -2**63:
+            return "INT64_MIN"
+        return "INT64_C({})".format(value)
 
     def visitAssign(self, node):
-        return "{} = {};\n".format(node.name, self.visit(node.value))
+        value = self.visit(node.value)
+        return self.takeprelude() + "{} = {};\n".format(node.name, value)
 
     def visitIf(self, st):
         # pretty literal translation from ast to C
-        code = "if ({}) {{\n".format(self.visit(st.exp))
+        condition = self.visit(st.exp)
+        code = self.takeprelude()
+        code += "if ({}) {{\n".format(condition)
         for statement in st.statements:
             code += self.visit(statement)
         code += "}"
@@ -98,7 +147,14 @@ class CGenerator(Visitor):
         return code
 
     def visitWhile(self, st):
-        code = "while ({}) {{\n".format(self.visit(st.exp))
+        condition = self.visit(st.exp)
+        prelude = self.takeprelude()
+        if prelude:
+            # the temporaries of the condition have to be computed before every check of the condition
+            code = "while (1) {{\n{}if (!({})) break;\n".format(
+                prelude, condition)
+        else:
+            code = "while ({}) {{\n".format(condition)
         for statement in st.statements:
             code += self.visit(statement)
         code += "}\n"
@@ -106,19 +162,15 @@ class CGenerator(Visitor):
 
     def visitReturn(self, node):
         if node.expression:
-            return "return {};\n".format(self.visit(node.expression))
+            value = self.visit(node.expression)
+            return self.takeprelude() + "return {};\n".format(value)
         else:
-            return "return\n"
+            return "return;\n"
 
     def visitCall(self, node):
-        code = node.name + "("
-        for arg in node.args:
-            code += self.visit(arg)
-            code += ","
-        code = code.rstrip(",")
-        code += ")"
+        code = node.name + "(" + ",".join(self.ordered(node.args)) + ")"
         if node.isStatement:
-            code += ";\n"
+            code = self.takeprelude() + code + ";\n"
         return code
 
     def visitStr(self, node):
@@ -129,12 +181,115 @@ class CGenerator(Visitor):
         return ""
 
     def visitLocaldef(self, node):
-        return "int {} = {};\n".format(node.name, self.visit(node.value))
+        # the variable itself has already been declared at the start of the function
+        return self.visitAssign(node)
+
+    def ctype(self, vartype):
+        """ Returns the c-type used for the given DBASIC type. DBASIC INTs are 64bits wide (like in the assembler-code) """
+        if vartype == "INT":
+            return "int64_t"
+        elif vartype == "BOOL":
+            return "_Bool"
+        return "void"
+
+    def prototype(self, node, name=None):
+        """ Returns the declaration of the given function (without body or ';'). name overrides the name of the function.
+        Renamed functions are only visible in this file"""
+        code = ""
+        if (self.wholeprogramm or name) and node.name != "main":
+            code += "static "
+        # c requires main to return an int. The DBASIC main also returns INT, but c's int is only 32bit wide.
+        if node.name == "main":
+            code += "int main("
+        else:
+            code += self.ctype(node.returntype) + " " + (name or node.name) + "("
+        code += ",".join([(self.ctype(node.argtypes[i])+" "+x)
+                          for i, x in enumerate(node.args)]) or "void"
+        code += ")"
+        return code
+
+    def memoWrapper(self, node):
+        """ Returns the table and the wrapper of a memoized function. The wrapper looks up the arguments in the table and only calls
+        the actual function (<name>_body) if they are not found. See dbc.purity for the layout of the table"""
+        args = ", ".join(node.args)
+        code = "static struct {{ int64_t valid; int64_t args[{}]; int64_t result; }} {}_memo[{}];\n".format(
+            len(node.args), node.name, purity.memoentries)
+        code += self.prototype(node) + "{\n"
+        code += "uint64_t hash = (uint64_t){};\n".format(node.args[0])
+        for arg in node.args[1:]:
+            code += "hash = hash * 31 + (uint64_t){};\n".format(arg)
+        code += "uint64_t index = (hash * {}ull) >> {};\n".format(
+            purity.memomultiplier, 64 - purity.memobits)
+        code += "if ({}_memo[index].valid".format(node.name)
+        for i, arg in enumerate(node.args):
+            code += " && {}_memo[index].args[{}] == {}".format(node.name, i, arg)
+        code += ")\n"
+        code += "return {}_memo[index].result;\n".format(node.name)
+        code += "{} result = {}_body({});\n".format(
+            self.ctype(node.returntype), node.name, args)
+        code += "{}_memo[index].valid = 1;\n".format(node.name)
+        for i, arg in enumerate(node.args):
+            code += "{}_memo[index].args[{}] = {};\n".format(node.name, i, arg)
+        code += "{}_memo[index].result = result;\n".format(node.name)
+        code += "return result;\n"
+        code += "}\n\n"
+        return code
+
+    def ordered(self, nodes):
+        """ Returns the code of the given expressions (the operands of an operation or the arguments of a call).
+        C does not specify in which order they are evaluated, but DBASIC evaluates them from left to right. This matters if they contain
+        calls, which can print or change global variables. Expressions that are followed by one containing a call (or by one reading a
+        global variable, if they contain a call themselves) are computed into temporaries (declared in self.prelude) first """
+        codes = []
+        for i, node in enumerate(nodes):
+            code = self.visit(node)
+            later = nodes[i+1:]
+            if not self.issimple(node) and any(self.hascalls(n) or (self.hascalls(node) and self.readsglobals(n)) for n in later):
+                self.temporaries += 1
+                name = "tmp_{}".format(self.temporaries)
+                self.prelude += "int64_t {} = {};\n".format(name, code)
+                code = name
+            codes.append(code)
+        return codes
+
+    def takeprelude(self):
+        """ Returns the code that computes the temporaries of the current statement (see ordered()) and resets it """
+        prelude = self.prelude
+        self.prelude = ""
+        return prelude
+
+    def issimple(self, node):
+        """ Returns true if the value of the given expression can not be changed by a call: Constants and local variables """
+        if isinstance(node, ast.Var):
+            return node.name in self.localvars
+        return isinstance(node, (ast.Const, ast.Str))
+
+    def readsglobals(self, node):
+        """ Returns true if the given expression reads a global variable """
+        if isinstance(node, ast.Var):
+            return node.name not in self.localvars
+        if isinstance(node, ast.Binary):
+            return self.readsglobals(node.val1) or self.readsglobals(node.val2)
+        if isinstance(node, ast.Unary):
+            return self.readsglobals(node.val)
+        if isinstance(node, ast.Call):
+            return any(self.readsglobals(arg) for arg in node.args)
+        return False
+
+    def hascalls(self, node):
+        """ Returns true if the given expression contains a function-call """
+        if isinstance(node, ast.Call):
+            return True
+        if isinstance(node, ast.Binary):
+            return self.hascalls(node.val1) or self.hascalls(node.val2)
+        if isinstance(node, ast.Unary):
+            return self.hascalls(node.val)
+        return False
 
     def builtinFunctions(self):
         # include some builtin functions in the code
         print = dedent("""\
-        void print(const char *format, ...){
+        static void print(const char *format, ...){
             va_list args;
             va_start(args, format);
             vprintf(format, args);
@@ -143,7 +298,7 @@ class CGenerator(Visitor):
         }
         """)
         input = dedent("""\
-        int input(void){
+        static int64_t input(void){
             fgets(inputbuffer,60,stdin);
             if(inputbuffer[strlen(inputbuffer) - 1] == '\\n'){
                 inputbuffer[strlen(inputbuffer) - 1] = '\\0';
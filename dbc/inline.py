@@ -0,0 +1,215 @@
+""" Inlines hot function-calls. Uses the call-counts from a profile (see dbc.profile.annotate()), so only calls that are actually executed
+    often are inlined and the size of the programm does not grow for nothing.
+
+    Only 'expression-functions' can be inlined. That are functions whose body consists of a single RETURN of an expression
+    that does not call other functions. The call is replaced by a copy of the returned expression, in which the parameters
+    are replaced by the arguments of the call.
+
+    The inliner works on the checked (and annotated) AST, so the inlined expressions already have their types.
+"""
+import copy
+
+import dbc.ast as ast
+from dbc.visit import Visitor
+
+""" A call-site is hot, if it is executed at least this often """
+hotcount = 1000
+""" ... and at least this fraction of the hottest call-site of the programm """
+hotfraction = 0.01
+""" Functions whose expression has more nodes than this are not inlined """
+maxsize = 40
+
+
+class ExpressionInfo(Visitor):
+    """ Collects information about an expression: the names of the used variables, if it contains calls and it's number of nodes"""
+
+    def __init__(self):
+        self.variables = []
+        self.calls = False
+        self.size = 0
+        super().__init__()
+
+    def visit(self, node):
+        self.size += 1
+        return self.dispatch[type(node)](self, node)
+
+    def visitVar(self, node):
+        self.variables.append(node.name)
+
+    def visitCall(self, node):
+        self.calls = True
+        super().visitCall(node)
+
+
+def expressioninfo(node):
+    info = ExpressionInfo()
+    info.visit(node)
+    return info
+
+
+class Substitution(Visitor):
+    """ Returns a copy of an expression in which some variables are replaced by other expressions"""
+
+    def __init__(self, replacements):
+        """ Dict of variable-name to the expression to replace the variable with"""
+        self.replacements = replacements
+        super().__init__()
+
+    def visitUnary(self, node):
+        node = copy.copy(node)
+        node.val = self.visit(node.val)
+        return node
+
+    def visitBinary(self, node):
+        node = copy.copy(node)
+        node.val1 = self.visit(node.val1)
+        node.val2 = self.visit(node.val2)
+        return node
+
+    def visitVar(self, node):
+        if node.name in self.replacements:
+            return copy.deepcopy(self.replacements[node.name])
+        return copy.copy(node)
+
+    def visitConst(self, node):
+        return copy.copy(node)
+
+    def visitStr(self, node):
+        return copy.copy(node)
+
+    def visitCall(self, node):
+        node = copy.copy(node)
+        node.args = [self.visit(arg) for arg in node.args]
+        return node
+
+
+class Inliner(Visitor):
+    """ Replaces hot calls of expression-functions with the expression they return.
+    Every visitXXX method for expressions returns the (possibly replaced) expression"""
+
+    def __init__(self):
+        """ The functions that can be inlined. Dict of function-name to ast.FuncDef"""
+        self.candidates = dict()
+        """ Calls that are executed less often are not inlined"""
+        self.threshold = None
+        """ The function that is currently processed"""
+        self.currentfunc = None
+        """ The number of inlined calls """
+        self.inlined = 0
+        super().__init__()
+
+    def inline(self, programm):
+        """ Inline the hot calls in the given (checked and annotated) programm. Returns the number of inlined calls"""
+        for func in programm.funcdefs:
+            if len(func.statements) != 1 or type(func.statements[0]) != ast.Return or not func.statements[0].expression:
+                continue
+            info = expressioninfo(func.statements[0].expression)
+            if not info.calls and info.size <= maxsize:
+                self.candidates[func.name] = func
+        counts = callcounts(programm)
+        if not self.candidates or not counts:
+            return 0
+        self.threshold = max(hotcount, max(counts)*hotfraction)
+        self.visitProgramm(programm)
+        return self.inlined
+
+    def visitProgramm(self, node):
+        for func in node.funcdefs:
+            self.visit(func)
+
+    def visitFuncdef(self, node):
+        self.currentfunc = node
+        for statement in node.statements:
+            self.visit(statement)
+
+    def inlinable(self, node):
+        """ Returns true if the given call can (and should) be inlined"""
+        func = self.candidates.get(node.name)
+        # calls whose result is discarded are statements and can not be replaced by an expression
+        if not func or node.isStatement or node.count is None or node.count < self.threshold or func == self.currentfunc:
+            return False
+        info = expressioninfo(func.statements[0].expression)
+        for var in info.variables:
+            # the global variables used by the function must not be hidden by local variables of the caller
+            if var not in func.args and var in self.currentfunc.localvars:
+                return False
+        for name, arg in zip(func.args, node.args):
+            # arguments are evaluated once when calling. They must not be evaluated multiple times (or not at all), if they are expensive or have side-effects
+            arginfo = expressioninfo(arg)
+            if type(arg) not in [ast.Var, ast.Const] and (arginfo.calls or info.variables.count(name) != 1):
+                return False
+        return True
+
+    def visitCall(self, node):
+        node.args = [self.visit(arg) for arg in node.args]
+        if not self.inlinable(node):
+            return node
+        self.inlined += 1
+        func = self.candidates[node.name]
+        return Substitution(dict(zip(func.args, node.args))).visit(func.statements[0].expression)
+
+    def visitUnary(self, node):
+        node.val = self.visit(node.val)
+        return node
+
+    def visitBinary(self, node):
+        node.val1 = self.visit(node.val1)
+        node.val2 = self.visit(node.val2)
+        return node
+
+    def visitVar(self, node):
+        return node
+
+    def visitConst(self, node):
+        return node
+
+    def visitStr(self, node):
+        return node
+
+    def visitAssign(self, node):
+        node.value = self.visit(node.value)
+
+    def visitLocaldef(self, node):
+        node.value = self.visit(node.value)
+
+    def visitReturn(self, node):
+        if node.expression:
+            node.expression = self.visit(node.expression)
+
+    def visitIf(self, node):
+        node.exp = self.visit(node.exp)
+        for statement in node.statements:
+            self.visit(statement)
+        if node.elsestatements:
+            for statement in node.elsestatements:
+                self.visit(statement)
+
+    def visitWhile(self, node):
+        node.exp = self.visit(node.exp)
+        for statement in node.statements:
+            self.visit(statement)
+
+
+class CallCounts(Visitor):
+    """ Collects the (profiled) execution-counts of all calls """
+
+    def __init__(self):
+        self.counts = []
+        super().__init__()
+
+    def visitCall(self, node):
+        if node.count is not None:
+            self.counts.append(node.count)
+        super().visitCall(node)
+
+
+def callcounts(programm):
+    """ Returns the profiled counts of all calls in the programm"""
+    counter = CallCounts()
+    counter.visit(programm)
+    return counter.counts
+
+
+def inline(programm):
+    """ Inline the hot calls of the given (checked and profile-annotated) programm. Returns the number of inlined calls"""
+    return Inliner().inline(programm)
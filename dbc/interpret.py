@@ -0,0 +1,406 @@
+""" Runs DBASIC programms with an interpreter, without generating any machine-code and without a C-toolchain (see 'dbc run --backend').
+
+    This module contains everything the interpreters share: The frontend, the semantics of the operations and the builtin functions
+    and the python-interface of a loaded programm (Programm). The interpreter itself is an engine that runs the functions of the programm.
+    The engine in this module (Interpreter) simply walks the checked AST. It is easy to follow, but slow. It is the reference
+    the faster engines (the bytecode-interpreter of dbc.vm and the closures of dbc.closures) are compared against
+    (see benchmarks/interpreters.py).
+
+    The interpreters compute exactly what the generated code computes:
+    - INTs are 64-bit signed integers. Results that do not fit wrap around
+    - Divisions round towards zero. A division by zero (or of the smallest INT by -1) raises an ExecutionError (instead of crashing)
+    - print() formats like printf: The conversions d, i, u, o, x, X, c, s and %% with flags, width, precision and length-modifiers
+      are supported. Like printf, %d prints only the lower 32 bits of a value, unless it has a length-modifier (%ld)
+    - input() reads a line and converts it like atoi() (see the C-backend)
+    Output goes to sys.stdout (and input comes from sys.stdin), unless the programm is given another Console.
+    Interpreted programms can not call C-functions.
+"""
+import re
+import sys
+import operator
+import functools
+
+import dbc.ast as ast
+import dbc.driver as driver
+from dbc.visit import Visitor
+from dbc.constprop import wrap
+from dbc.errors import ExecutionError
+
+""" The smallest value of an INT"""
+INTMIN = -2**63
+
+""" The functions every programm can call without defining them"""
+builtins = ["print", "input"]
+
+
+def divide(a, b):
+    """ Divide like the idiv-instruction: The quotient is rounded towards zero.
+    The cases that make idiv crash the compiled programm raise an ExecutionError"""
+    if b == 0:
+        raise ExecutionError("Division by zero")
+    if a == INTMIN and b == -1:
+        raise ExecutionError("Division overflow")
+    quotient = abs(a) // abs(b)
+    return quotient if (a < 0) == (b < 0) else -quotient
+
+
+""" The binary operations. Operator (see ast.Binary.op) to a function that computes the result of two values.
+    Comparisons return a bool. As bools are ints in python, they work as BOOL-values everywhere"""
+operations = {
+    "+": lambda a, b: wrap(a + b),
+    "-": lambda a, b: wrap(a - b),
+    "*": lambda a, b: wrap(a * b),
+    "/": divide,
+    "&": operator.and_,
+    "|": operator.or_,
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    ">": operator.gt,
+    "<=": operator.le,
+    ">=": operator.ge,
+}
+
+
+def unescape(value):
+    """ Returns the value of a string-constant (ast.Str.value), with it's escape-sequences (like \\n) replaced, like gcc does it"""
+    return value.encode("latin-1", "backslashreplace").decode("unicode_escape")
+
+
+""" Matches a conversion-specification of printf: flags, width, precision, length-modifier and conversion"""
+conversionre = re.compile(
+    r"%([-+ #0]*)([0-9]*)(\.[0-9]*)?(hh|h|ll|l|j|z|t|q)?([diouxXcs%])")
+
+""" The size (in bits) of the integer printf reads for a length-modifier. Without one it reads an int, all others read 64 bits"""
+lengthbits = {None: 32, "hh": 8, "h": 16}
+
+
+def signed(bits):
+    """ Returns a function that converts a value into a signed integer of the given size (printf only reads the lower bits of the register)"""
+    if bits == 64:
+        return int
+    half = 2**(bits-1)
+    return lambda value: (value + half) % (2*half) - half
+
+
+def unsigned(bits):
+    """ Returns a function that converts a value into an unsigned integer of the given size"""
+    mask = 2**bits - 1
+    return lambda value: value & mask
+
+
+def octal(bits):
+    """ Returns a function that converts a value into the octal number %#o prints (python would prefix it with 0o)"""
+    mask = 2**bits - 1
+    return lambda value: "0{:o}".format(value & mask) if value & mask else "0"
+
+
+def character(value):
+    return chr(value & 255)
+
+
+def text(value):
+    if type(value) != str:
+        raise ExecutionError("%s needs a string as argument")
+    return value
+
+
+class Format:
+    """ The format-string of a print(), translated into a format-string for python's %-operator and the conversions the arguments need """
+
+    def __init__(self, string):
+        """ The format-string for the %-operator"""
+        self.format = ""
+        """ For every argument a function that converts it into what the %-operator needs"""
+        self.conversions = []
+        pos = 0
+        for match in conversionre.finditer(string):
+            # the %-operator must not see a % outside of the conversions
+            self.format += string[pos:match.start()].replace("%", "%%")
+            pos = match.end()
+            flags, width, precision, length, conversion = match.groups()
+            precision = precision or ""
+            bits = lengthbits.get(length, 64)
+            if conversion == "%":
+                self.format += "%%"
+                continue
+            elif conversion in "di":
+                self.conversions.append(signed(bits))
+                conversion = "d"
+            elif conversion == "o" and "#" in flags:
+                self.conversions.append(octal(bits))
+                flags = flags.replace("#", "").replace("0", "")
+                conversion = "s"
+            elif conversion in "uoxX":
+                self.conversions.append(unsigned(bits))
+                # there is no sign to print for unsigned conversions
+                flags = flags.replace("+", "").replace(" ", "")
+                conversion = "d" if conversion == "u" else conversion
+            elif conversion == "c":
+                self.conversions.append(character)
+            else:
+                self.conversions.append(text)
+            self.format += "%" + flags + width + precision + conversion
+        self.format += string[pos:].replace("%", "%%")
+
+    def apply(self, args):
+        """ Returns the output of print() for the given values of the arguments (behind the format-string)"""
+        if len(args) < len(self.conversions):
+            raise ExecutionError("The format-string of print() needs {} arguments. Found: {}".format(
+                len(self.conversions), len(args)))
+        try:
+            return self.format % tuple([convert(arg) for convert, arg in zip(self.conversions, args)])
+        except TypeError:
+            raise ExecutionError(
+                "The arguments of print() do not match it's format-string")
+
+
+@functools.lru_cache(maxsize=None)
+def printformat(value):
+    """ Returns the Format for the string-constant (ast.Str.value) used as format-string of a print()"""
+    return Format(unescape(value))
+
+
+""" Matches the number atoi() converts: whitespace, an optional sign and digits"""
+numberre = re.compile(r"[ \t\n\v\f\r]*([-+]?[0-9]+)")
+
+
+def atoi(string):
+    """ Converts the string like the atoi() of the C-library: The number at it's start (0 if there is none).
+    atoi() clamps the number to 64 bits (like strtol()) and returns the lower 32 bits of it"""
+    match = numberre.match(string)
+    if not match:
+        return 0
+    value = min(max(int(match.group(1)), INTMIN), -INTMIN-1)
+    return (value + 2**31) % 2**32 - 2**31
+
+
+class Console:
+    """ The streams print() writes to and input() reads from.
+    Default to sys.stdout and sys.stdin, which are looked up on every use (so replacing them, e.g. to capture the output, works)"""
+
+    def __init__(self, stdout=None, stdin=None):
+        self.stdout = stdout
+        self.stdin = stdin
+
+    def print(self, format, args):
+        """ Print the values of the arguments with the given Format"""
+        out = self.stdout or sys.stdout
+        out.write(format.apply(args))
+        # the runtime flushes after every print() too
+        out.flush()
+
+    def input(self):
+        """ Read a line and return the number at it's start"""
+        return atoi((self.stdin or sys.stdin).readline())
+
+
+class Return:
+    """ Is returned by the statements of the Interpreter, if they executed a RETURN"""
+
+    def __init__(self, value):
+        """ The value returned by the function"""
+        self.value = value
+
+
+class Interpreter(Visitor):
+    """ The simplest engine: Runs the functions by walking their AST. The visitXXX methods of the expressions return their value,
+    the ones of the statements return a Return if the statement returned from the function.
+    The values of the local variables of the running function are kept in a dict"""
+
+    def __init__(self, syntaxtree, console):
+        super().__init__()
+        self.console = console
+        """ The FuncDefs of the programm. Dict of name to FuncDef"""
+        self.functions = {f.name: f for f in syntaxtree.funcdefs}
+        """ The values of the global variables. Dict of name to value"""
+        self.globals = {name: int(value)
+                        for name, value in syntaxtree.globalvars.items()}
+        """ The values of the local variables of the running function. Dict of name to value"""
+        self.locals = None
+
+    def execute(self, name, args):
+        """ Run the function with the given name and arguments (ints). Returns it's result (or 0 if it does not return anything)"""
+        func = self.functions[name]
+        saved = self.locals
+        # variables that are read before they are assigned are 0
+        self.locals = dict.fromkeys(func.localvars, 0)
+        self.locals.update(zip(func.args, args))
+        try:
+            result = self.block(func.statements)
+        finally:
+            self.locals = saved
+        return result.value if result else 0
+
+    def block(self, statements):
+        """ Execute the statements. Returns a Return if one of them returned"""
+        for statement in statements:
+            result = self.visit(statement)
+            if result:
+                return result
+        return None
+
+    def visitUnary(self, node):
+        return wrap(-self.visit(node.val))
+
+    def visitBinary(self, node):
+        return operations[node.op](self.visit(node.val1), self.visit(node.val2))
+
+    def visitVar(self, node):
+        if node.name in self.locals:
+            return self.locals[node.name]
+        return self.globals[node.name]
+
+    def visitConst(self, node):
+        return int(node.value)
+
+    def visitStr(self, node):
+        return unescape(node.value)
+
+    def visitAssign(self, node):
+        value = self.visit(node.value)
+        if node.name in self.locals:
+            self.locals[node.name] = value
+        else:
+            self.globals[node.name] = value
+
+    def visitLocaldef(self, node):
+        self.locals[node.name] = self.visit(node.value)
+
+    def visitIf(self, node):
+        if self.visit(node.exp):
+            return self.block(node.statements)
+        if node.elsestatements:
+            return self.block(node.elsestatements)
+        return None
+
+    def visitWhile(self, node):
+        while self.visit(node.exp):
+            result = self.block(node.statements)
+            if result:
+                return result
+        return None
+
+    def visitReturn(self, node):
+        return Return(self.visit(node.expression) if node.expression else 0)
+
+    def visitCall(self, node):
+        args = [self.visit(arg) for arg in node.args]
+        if node.name == "print":
+            self.console.print(printformat(node.args[0].value), args[1:])
+            return None
+        if node.name == "input":
+            result = self.console.input()
+        else:
+            result = self.execute(node.name, args)
+        # a call that is a statement must not be mistaken for a RETURN
+        return None if node.isStatement else result
+
+
+class Externals(Visitor):
+    """ Finds the calls of functions that are neither defined by the programm nor builtins (C-functions)"""
+
+    def __init__(self, functions):
+        super().__init__()
+        self.functions = functions
+        """ The names of the called functions that are not defined"""
+        self.names = []
+
+    def visitCall(self, node):
+        if node.name not in self.functions and node.name not in builtins and node.name not in self.names:
+            self.names.append(node.name)
+        super().visitCall(node)
+
+
+def frontend(sources, requiremain=True, optimize=None, wholeprogramm=False):
+    """ Parse and check the given source-codes as one programm and optimize it's AST with the given level (see driver.optimizeast()).
+    If wholeprogramm is true, only main is called, so functions that are not called from main are removed and constant arguments are
+    propagated into the called functions. Returns the checked AST"""
+    trees = [driver.parsesource(source) for source in sources]
+    syntaxtree = ast.Programm([f for tree in trees for f in tree.funcdefs],
+                              [g for tree in trees for g in tree.globaldefs], 0)
+    driver.check(syntaxtree, requiremain or wholeprogramm)
+    externals = Externals({f.name for f in syntaxtree.funcdefs})
+    externals.visit(syntaxtree)
+    if externals.names:
+        raise ExecutionError("Function {} is not defined (interpreted programms can not call C-functions)".format(
+            externals.names[0]))
+    if optimize:
+        driver.optimizeast(syntaxtree, optimize, wholeprogramm=wholeprogramm)
+    return syntaxtree
+
+
+class Programm:
+    """ A programm loaded by an interpreter (see load()). The functions of the programm can be called with call()
+    (exactly like the ones of a dbc.jit.Programm)"""
+
+    def __init__(self, syntaxtree, engine, wholeprogramm=False):
+        """ The FuncDefs of the functions that can be called. Dict of name to FuncDef. If the programm was optimized as a whole
+        (see frontend()), only main"""
+        self.functions = {f.name: f for f in syntaxtree.funcdefs if f.name == "main" or not wholeprogramm}
+        """ The engine that runs the functions. Has a method execute(name, args)"""
+        self.engine = engine
+
+    def call(self, name, *args):
+        """ Call the DBASIC-function with the given name and arguments (INTs and BOOLs). Returns it's result (an int, a bool or None)"""
+        func = self.functions.get(name)
+        if not func:
+            raise ExecutionError("Function {} is not defined".format(name))
+        if len(args) != len(func.args):
+            raise ExecutionError("Function {} expects {} args. Found: {}".format(
+                name, len(func.args), len(args)))
+        for i, arg in enumerate(args):
+            if type(arg) != (bool if func.argtypes[i] == "BOOL" else int) or arg != wrap(arg):
+                raise ExecutionError("Argument number {} for function {} needs to be of type {}".format(
+                    i, name, func.argtypes[i]))
+        try:
+            result = self.engine.execute(name, [int(a) for a in args])
+        except RecursionError:
+            raise ExecutionError("Maximum recursion depth exceeded")
+        if func.returntype == "BOOL":
+            return bool(result)
+        return int(result) if func.returntype else None
+
+    def main(self):
+        """ Run the programm. Returns the result of main()"""
+        return self.call("main")
+
+    def close(self):
+        # there is nothing to release. Exists so programms of all backends can be used alike
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def load(sources, requiremain=True, optimize=None, console=None, engine=Interpreter, wholeprogramm=False):
+    """ Load the given DBASIC-sources (as one programm) into an interpreter.
+
+    :params sources: A list of source-files
+    :params requiremain: If false, the programm needs no main-function
+    :params optimize: The optimization-level for the AST (see driver.optimizeast())
+    :params console: The Console print() and input() use. Default: sys.stdout and sys.stdin
+    :params engine: The class of the engine that runs the programm. Is created with the checked AST and the console
+    :params wholeprogramm: If true, only main() can be called. The programm is then optimized as a whole (see frontend())
+    :returns: A Programm
+    """
+    texts = []
+    for path in sources:
+        with open(path, "r") as f:
+            texts.append(f.read())
+    syntaxtree = frontend(texts, requiremain, optimize, wholeprogramm)
+    return Programm(syntaxtree, engine(syntaxtree, console or Console()), wholeprogramm)
+
+
+def loadsource(source, requiremain=True, optimize=None, console=None, engine=Interpreter, wholeprogramm=False):
+    """ Load the given DBASIC source-code into an interpreter. Takes the same arguments as load(). Returns a Programm"""
+    syntaxtree = frontend([source], requiremain, optimize, wholeprogramm)
+    return Programm(syntaxtree, engine(syntaxtree, console or Console()), wholeprogramm)
+
+
+def run(source, optimize=None, console=None, engine=Interpreter):
+    """ Run the given DBASIC source-code (a complete programm) with an interpreter. Returns the result of main()"""
+    return loadsource(source, True, optimize, console, engine, True).main()
@@ -0,0 +1,381 @@
+""" Runs DBASIC programms inside the python-process, without linking an executable (see 'dbc run').
+
+    The programm is compiled into an object-file by the asm-backend (which is cached like every object, see driver.compileobject()).
+    The object-files of the programm and the runtime (see dbc.runtime) are then loaded by a minimal in-process linker:
+    Their sections are copied into memory that is mapped executable, their symbols are resolved and their relocations applied.
+    Symbols that none of the objects defines (printf, atoi, fflush and all C-functions the programm calls) are looked up in the
+    running process, which already contains the C-library. Finally main() (or any other function) is called via ctypes.
+
+    The generated code addresses it's data with 32-bit absolute addresses (like every non-PIE executable). So the memory is mapped
+    into the lower 2GB of the address-space (MAP_32BIT). The functions of the C-library are too far away to be reached by the 32-bit
+    displacements of the calls, so calls to them are redirected through stubs that jump to the full 64-bit address (like a PLT).
+
+    Output of print() goes through the stdout of the C-library (to file-descriptor 1), not through sys.stdout.
+    The programm runs in the python-process: A crash of the programm crashes python too.
+"""
+import os.path
+import ctypes
+import struct
+
+import dbc.driver as driver
+import dbc.runtime as runtime
+from dbc.batch import signatures
+from dbc.constprop import wrap
+
+
+class JITError(Exception):
+    """ Is raised if an object-file can not be loaded into memory """
+
+    def __init__(self, msg):
+        super().__init__(msg)
+
+
+""" ELF constants (see elf.h) """
+SHT_SYMTAB = 2
+SHT_RELA = 4
+SHT_NOBITS = 8
+SHF_WRITE = 1
+SHF_ALLOC = 2
+SHF_EXECINSTR = 4
+SHN_UNDEF = 0
+SHN_ABS = 0xfff1
+STB_LOCAL = 0
+R_X86_64_64 = 1
+R_X86_64_PC32 = 2
+R_X86_64_PLT32 = 4
+R_X86_64_32 = 10
+R_X86_64_32S = 11
+
+""" mmap/mprotect constants (see sys/mman.h)"""
+PROT_READ = 1
+PROT_WRITE = 2
+PROT_EXEC = 4
+MAP_PRIVATE = 0x02
+MAP_ANONYMOUS = 0x20
+MAP_32BIT = 0x40
+
+pagesize = 4096
+""" The code of a stub: jmp *0(%rip), followed by the 64-bit address to jump to"""
+stubcode = b"\xff\x25\x00\x00\x00\x00"
+stubsize = 16
+
+""" The C-library of the process. Used to map memory and to look up the symbols the objects do not define"""
+libc = ctypes.CDLL(None, use_errno=True)
+libc.mmap.restype = ctypes.c_void_p
+libc.mmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t,
+                      ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_long]
+libc.mprotect.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int]
+libc.munmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+
+
+class Section:
+    """ A section of an object-file """
+
+    def __init__(self, name, type, flags, offset, size, link, info, align):
+        self.name = name
+        self.type = type
+        self.flags = flags
+        """ The position of the section's content in the file"""
+        self.offset = offset
+        self.size = size
+        """ For symbol-tables: The section containing the names. For relocations: The symbol-table"""
+        self.link = link
+        """ For relocations: The section the relocations apply to"""
+        self.info = info
+        self.align = max(align, 1)
+        """ The address the section is loaded at (or None if it is not loaded)"""
+        self.address = None
+
+
+class Symbol:
+    """ A symbol of an object-file """
+
+    def __init__(self, name, bind, type, section, value):
+        self.name = name
+        """ STB_LOCAL symbols are only visible in their object-file"""
+        self.bind = bind
+        self.type = type
+        """ The index of the section the symbol is defined in (or SHN_UNDEF if it is defined somewhere else)"""
+        self.section = section
+        """ The offset of the symbol in it's section"""
+        self.value = value
+
+
+class ObjectFile:
+    """ A relocatable ELF-object (x86-64) as generated by gcc -c """
+
+    def __init__(self, data, path="<memory>"):
+        self.data = data
+        self.path = path
+        if data[:4] != b"\x7fELF" or data[4] != 2 or data[5] != 1 or struct.unpack_from("<H", data, 16)[0] != 1:
+            raise JITError(
+                "{} is not a relocatable 64-bit ELF-object".format(path))
+        shoff, = struct.unpack_from("<Q", data, 0x28)
+        shentsize, shnum, shstrndx = struct.unpack_from("<HHH", data, 0x3A)
+        headers = [struct.unpack_from("<IIQQQQIIQQ", data, shoff + i*shentsize)
+                   for i in range(shnum)]
+        names = headers[shstrndx][4]
+        """ The sections of the object, in the order of the file"""
+        self.sections = [Section(self.string(names, h[0]), h[1], h[2], h[4], h[5], h[6], h[7], h[8])
+                         for h in headers]
+        """ The symbols of the object, in the order of the symbol-table (relocations refer to them by index)"""
+        self.symbols = []
+        for section in self.sections:
+            if section.type == SHT_SYMTAB:
+                strings = self.sections[section.link].offset
+                for offset in range(section.offset, section.offset + section.size, 24):
+                    name, info, _, shndx, value, _ = struct.unpack_from(
+                        "<IBBHQQ", data, offset)
+                    self.symbols.append(
+                        Symbol(self.string(strings, name), info >> 4, info & 0xf, shndx, value))
+
+    def string(self, table, offset):
+        """ Returns the null-terminated string at offset in the string-table starting at table"""
+        start = table + offset
+        return self.data[start:self.data.index(b"\0", start)].decode()
+
+    def relocations(self, section):
+        """ Yields the (offset, type, symbol, addend) of all relocations of the given section of the relocation-table"""
+        for offset in range(section.offset, section.offset + section.size, 24):
+            place, info, addend = struct.unpack_from("<QQq", self.data, offset)
+            yield place, info & 0xffffffff, self.symbols[info >> 32], addend
+
+
+def loadable(section):
+    return section.flags & SHF_ALLOC and section.size > 0
+
+
+def align(value, alignment):
+    return (value + alignment - 1) // alignment * alignment
+
+
+class Image:
+    """ The object-files of a programm, linked and loaded into executable memory. Call close() (or use a with-statement) to unmap it"""
+
+    def __init__(self, objects):
+        """ The loaded ObjectFiles"""
+        self.objects = objects
+        """ The global symbols defined by the objects. Dict of name to address"""
+        self.symbols = dict()
+        """ The stubs for the symbols that are defined by the process. Dict of name to address of the stub"""
+        self.stubs = dict()
+        """ The start and size of the mapped memory"""
+        self.memory = None
+        self.size = 0
+        try:
+            self.load()
+        except Exception:
+            self.close()
+            raise
+
+    def load(self):
+        sections = [s for o in self.objects for s in o.sections if loadable(s)]
+        undefined = sorted(set(sym.name for o in self.objects for sym in o.symbols
+                               if sym.section == SHN_UNDEF and sym.name))
+        # the executable sections and the stubs come first, so they can be made read-only without touching the data
+        code = [s for s in sections if s.flags & SHF_EXECINSTR]
+        data = [s for s in sections if not s.flags & SHF_EXECINSTR]
+        offset = 0
+        for section in code:
+            offset = align(offset, section.align)
+            section.address = offset
+            offset += section.size
+        stubs = align(offset, stubsize)
+        codesize = align(stubs + len(undefined)*stubsize, pagesize)
+        offset = codesize
+        for section in data:
+            offset = align(offset, section.align)
+            section.address = offset
+            offset += section.size
+        self.size = max(align(offset, pagesize), pagesize)
+
+        self.memory = libc.mmap(None, self.size, PROT_READ | PROT_WRITE,
+                                MAP_PRIVATE | MAP_ANONYMOUS | MAP_32BIT, -1, 0)
+        if self.memory in (None, ctypes.c_void_p(-1).value):
+            raise JITError("Could not map memory: " +
+                           os.strerror(ctypes.get_errno()))
+        # copy the contents of the sections. The mapped memory is zero-filled, which is the content of .bss
+        for section in sections:
+            section.address += self.memory
+        for obj in self.objects:
+            for section in obj.sections:
+                if loadable(section) and section.type != SHT_NOBITS:
+                    ctypes.memmove(section.address, obj.data[section.offset:section.offset+section.size],
+                                   section.size)
+
+        # global symbols defined by one object can be used by all others
+        for obj in self.objects:
+            for sym in obj.symbols:
+                if sym.bind != STB_LOCAL and sym.section != SHN_UNDEF:
+                    self.symbols[sym.name] = self.address(obj, sym)
+        for i, name in enumerate(n for n in undefined if n not in self.symbols):
+            stub = self.memory + stubs + i*stubsize
+            target = struct.pack("<Q", self.external(name))
+            ctypes.memmove(stub, stubcode + target, len(stubcode) + 8)
+            self.stubs[name] = stub
+
+        for obj in self.objects:
+            for section in obj.sections:
+                if section.type == SHT_RELA and loadable(obj.sections[section.info]):
+                    self.relocate(obj, section, obj.sections[section.info])
+
+        if libc.mprotect(self.memory, codesize, PROT_READ | PROT_EXEC) != 0:
+            raise JITError("Could not make the code executable: " +
+                           os.strerror(ctypes.get_errno()))
+
+    def address(self, obj, sym):
+        """ Returns the address of the given symbol (defined in obj)"""
+        if sym.section == SHN_ABS:
+            return sym.value
+        if sym.section == SHN_UNDEF:
+            return self.symbols.get(sym.name) or self.external(sym.name)
+        section = obj.sections[sym.section]
+        if section.address is None:
+            raise JITError("{}: Symbol {} is in section {}, which is not loaded".format(
+                obj.path, sym.name, section.name))
+        return section.address + sym.value
+
+    def external(self, name):
+        """ Returns the address of the symbol with the given name in the running process"""
+        try:
+            return ctypes.cast(getattr(libc, name), ctypes.c_void_p).value
+        except AttributeError:
+            raise JITError("Undefined reference to " + name) from None
+
+    def relocate(self, obj, relocations, section):
+        """ Apply the relocations to the loaded section """
+        for offset, type, sym, addend in obj.relocations(relocations):
+            place = section.address + offset
+            if type in [R_X86_64_PC32, R_X86_64_PLT32] and sym.section == SHN_UNDEF and sym.name not in self.symbols:
+                # the process' symbols are too far away for a 32-bit displacement. Use the stub
+                target = self.stubs[sym.name]
+            else:
+                target = self.address(obj, sym)
+            if type == R_X86_64_64:
+                value, fmt = target + addend, "<Q"
+            elif type in [R_X86_64_PC32, R_X86_64_PLT32]:
+                value, fmt = target + addend - place, "<i"
+            elif type == R_X86_64_32:
+                value, fmt = target + addend, "<I"
+            elif type == R_X86_64_32S:
+                value, fmt = target + addend, "<i"
+            else:
+                raise JITError("{}: Unsupported relocation-type {} in section {}".format(
+                    obj.path, type, section.name))
+            try:
+                ctypes.memmove(place, struct.pack(fmt, value), struct.calcsize(fmt))
+            except struct.error:
+                raise JITError("{}: Relocation against {} does not fit".format(
+                    obj.path, sym.name or section.name)) from None
+
+    def function(self, name, args=0):
+        """ Returns a python-callable for the function with the given name, that takes args INT-arguments and returns an INT"""
+        if name not in self.symbols:
+            raise JITError("Function {} is not defined".format(name))
+        prototype = ctypes.CFUNCTYPE(ctypes.c_int64, *[ctypes.c_int64]*args)
+        return prototype(self.symbols[name])
+
+    def close(self):
+        """ Unmap the memory of the image. The functions of it can not be called anymore"""
+        if self.memory:
+            libc.munmap(self.memory, self.size)
+            self.memory = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Programm:
+    """ A loaded DBASIC programm (see load()). The functions of the programm can be called with call() """
+
+    def __init__(self, image, functions):
+        """ The Image containing the code"""
+        self.image = image
+        """ The signatures (ast.FuncDef) of the functions defined by the DBASIC-sources. Dict of name to FuncDef"""
+        self.functions = functions
+
+    def call(self, name, *args):
+        """ Call the DBASIC-function with the given name and arguments (INTs and BOOLs). Returns it's result (an int, a bool or None)"""
+        func = self.functions.get(name)
+        if not func:
+            raise JITError("Function {} is not defined".format(name))
+        if len(args) != len(func.args):
+            raise JITError("Function {} expects {} args. Found: {}".format(
+                name, len(func.args), len(args)))
+        for i, arg in enumerate(args):
+            if type(arg) != (bool if func.argtypes[i] == "BOOL" else int) or arg != wrap(arg):
+                raise JITError("Argument number {} for function {} needs to be of type {}".format(
+                    i, name, func.argtypes[i]))
+        result = self.image.function(name, len(args))(*[int(a) for a in args])
+        if func.returntype == "BOOL":
+            return result != 0
+        return result if func.returntype else None
+
+    def main(self):
+        """ Run the programm. Returns the result of main()"""
+        return self.call("main")
+
+    def close(self):
+        self.image.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def loadobjects(paths):
+    """ Load the given object-files (and the runtime) into memory. Returns an Image"""
+    objects = []
+    for path in paths + [runtime.runtimeobject()]:
+        with open(path, "rb") as f:
+            objects.append(ObjectFile(f.read(), path))
+    return Image(objects)
+
+
+def load(sources, objects=[], requiremain=True, optimize=None, memoize=False, omitframepointer=False, wholeprogramm=False):
+    """ Compile the given DBASIC-sources with the asm-backend and load them (together with the given object-files) into memory.
+
+    :params sources: A list of source-files. If multiple files are given, they are linked together (like 'dbc a.basic b.basic')
+    :params objects: Additional object-files (.o) to load
+    :params requiremain: If false, the programm needs no main-function
+    :params optimize: See driver.compileobject()
+    :params memoize: See driver.compileobject()
+    :params omitframepointer: See driver.compileobject()
+    :params wholeprogramm: If true, only main() can be called. A single source-file (without objects) is then optimized as the whole
+        programm: functions that are not called from main are removed and constant arguments are propagated into the called functions
+    :returns: A Programm. Close it when it is not needed anymore
+    """
+    units = [signatures(path) for path in sources]
+    for path, (_, _, error) in zip(sources, units):
+        if error:
+            raise JITError("{}: {}".format(path, error))
+    functions = {f.name: f for _, funcs, _ in units for f in funcs}
+    if (requiremain or wholeprogramm) and "main" not in functions:
+        raise JITError("Every programm needs to have a function called 'main'")
+    # a single source-file is the whole programm (see batch.build()). Otherwise every function can be called by call(), so the sources
+    # are compiled like with -c: As the whole programm, functions that are not called from main would be removed and their arguments
+    # replaced by the constants main passes
+    wholeprogramm = wholeprogramm and len(sources) + len(objects) == 1
+    options = driver.Options(optimize=optimize, memoize=memoize, omitframepointer=omitframepointer)
+    paths = []
+    for path, (source, funcs, _) in zip(sources, units):
+        externals = {k: v for k, v in functions.items() if v not in funcs}
+        paths.append(driver.compileobject(source, wholeprogramm, externals, options=options, filename=path))
+    if wholeprogramm:
+        functions = {"main": functions["main"]}
+    return Programm(loadobjects(paths + list(objects)), functions)
+
+
+def run(source, optimize=None, memoize=False, omitframepointer=False):
+    """ Compile and run the given DBASIC source-code (a complete programm). Returns the result of main()"""
+    syntaxtree = driver.parsesource(source)
+    functions = {f.name: f for f in syntaxtree.funcdefs}
+    options = driver.Options(optimize=optimize, memoize=memoize, omitframepointer=omitframepointer)
+    path = driver.compileobject(source, syntaxtree=syntaxtree, options=options)
+    with Programm(loadobjects([path]), functions) as programm:
+        return programm.main()
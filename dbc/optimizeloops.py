@@ -0,0 +1,399 @@
+""" Optimizes WHILE-loops on the (checked) AST. Is run for the asm-backend with -O1 or higher.
+    - Loop-invariant code motion: Expressions whose value does not change while the loop runs (and loads of global variables that are not
+      modified in the loop) are computed once before the loop and stored in a new local variable.
+    - Strength reduction of induction variables: If a variable is only changed by x = x + c in the loop, multiplications x * k are replaced
+      by a new variable that is initialized before the loop and increased by c * k whenever x changes.
+    - Unrolling of counted loops (-O2 or --unroll): Loops of the form WHILE i < n DO ... i = i + c END (with an invariant n) are replaced
+      by a loop that runs the body multiple times per check of the condition, followed by the original loop, which runs the remaining iterations.
+    The rotation of loops into bottom-tested loops happens in the code-generator (see ASMGenerator.visitWhile()).
+
+    The variables created by this stage contain an underscore. DBASIC identifiers can only contain letters, so they never clash with the
+    variables of the programm.
+"""
+import copy
+
+import dbc.ast as ast
+from dbc.visit import Visitor
+
+""" Calls to these functions do not modify global variables"""
+builtins = ["print", "input"]
+""" The default unroll-factor for -O2"""
+unrollfactor = 4
+""" Loops whose unrolled body would have more AST-nodes than this are not unrolled"""
+maxunrollsize = 160
+""" With a profile (see --use-profile), loops that ran less than this fraction of the iterations of the hottest loop are not unrolled"""
+coldloop = 0.01
+
+
+class LoopInfo(Visitor):
+    """ Collects the variables that are assigned in a loop (or any other part of the AST) and if it calls functions that might modify globals"""
+
+    def __init__(self):
+        """ Dict of variable-name to the number of assignments to it"""
+        self.assigned = dict()
+        """ True if the code calls other functions"""
+        self.calls = False
+        """ The number of loops in the code (including the code itself, if it is a loop)"""
+        self.loops = 0
+        """ The number of AST-nodes of the code"""
+        self.size = 0
+        super().__init__()
+
+    def visit(self, node):
+        self.size += 1
+        return self.dispatch[type(node)](self, node)
+
+    def visitWhile(self, node):
+        self.loops += 1
+        super().visitWhile(node)
+
+    def visitAssign(self, node):
+        self.assigned[node.name] = self.assigned.get(node.name, 0) + 1
+        super().visitAssign(node)
+
+    def visitLocaldef(self, node):
+        self.visitAssign(node)
+
+    def visitCall(self, node):
+        if node.name not in builtins:
+            self.calls = True
+        super().visitCall(node)
+
+
+class LoopCounts(Visitor):
+    """ Collects the iterations of the loops of a programm, as measured by a profile (see dbc.profile.annotate())"""
+
+    def __init__(self):
+        """ The iterations of every loop that has a profile"""
+        self.counts = []
+        super().__init__()
+
+    def visitWhile(self, node):
+        if node.count is not None:
+            self.counts.append(node.count)
+        super().visitWhile(node)
+
+
+def loopinfo(node):
+    info = LoopInfo()
+    info.visit(node)
+    return info
+
+
+def invariant(node, info, globalvars):
+    """ Returns true if the value of the expression does not change while the code described by info (see loopinfo()) runs
+    and it can be computed before that code"""
+    if type(node) == ast.Const:
+        return True
+    if type(node) == ast.Var:
+        if node.name in info.assigned:
+            return False
+        # called functions could modify global variables
+        return node.name not in globalvars or not info.calls
+    if type(node) == ast.Unary:
+        return invariant(node.val, info, globalvars)
+    if type(node) == ast.Binary:
+        # a division could fail (division by zero). It must not be executed if the loop itself would not execute it
+        return node.op != "/" and invariant(node.val1, info, globalvars) and invariant(node.val2, info, globalvars)
+    return False
+
+
+def key(node):
+    """ Returns a string that is equal for structurally equal expressions"""
+    if type(node) == ast.Binary:
+        return "({}{}{})".format(key(node.val1), node.op, key(node.val2))
+    if type(node) == ast.Unary:
+        return "({}{})".format(node.op, key(node.val))
+    if type(node) == ast.Var:
+        return node.name
+    if type(node) == ast.Const:
+        return "#" + str(node.value)
+    return None
+
+
+class ExpressionRewriter(Visitor):
+    """ Base-class for visitors that replace expressions in a part of the AST. Subclasses override replace(), which returns
+    the (possibly new) expression for the given one. Statements are visited recursively"""
+
+    def replace(self, node):
+        return None
+
+    def expression(self, node):
+        new = self.replace(node)
+        if new is not None:
+            return new
+        if type(node) == ast.Binary:
+            node.val1 = self.expression(node.val1)
+            node.val2 = self.expression(node.val2)
+        elif type(node) == ast.Unary:
+            node.val = self.expression(node.val)
+        elif type(node) == ast.Call:
+            node.args = [self.expression(arg) for arg in node.args]
+        return node
+
+    def visitAssign(self, node):
+        node.value = self.expression(node.value)
+
+    def visitLocaldef(self, node):
+        node.value = self.expression(node.value)
+
+    def visitReturn(self, node):
+        if node.expression:
+            node.expression = self.expression(node.expression)
+
+    def visitCall(self, node):
+        node.args = [self.expression(arg) for arg in node.args]
+
+    def visitIf(self, node):
+        node.exp = self.expression(node.exp)
+        for statement in node.statements:
+            self.visit(statement)
+        if node.elsestatements:
+            for statement in node.elsestatements:
+                self.visit(statement)
+
+    def visitWhile(self, node):
+        node.exp = self.expression(node.exp)
+        for statement in node.statements:
+            self.visit(statement)
+
+
+class Hoister(ExpressionRewriter):
+    """ Replaces the loop-invariant expressions of a loop by variables, that are computed before the loop"""
+
+    def __init__(self, optimizer, info, globalvars):
+        self.optimizer = optimizer
+        self.info = info
+        self.globalvars = globalvars
+        """ Dict of expression-key (see key()) to the variable holding it's value. Equal expressions share a variable"""
+        self.hoisted = dict()
+        """ The definitions of the new variables. Are placed in front of the loop"""
+        self.definitions = []
+        super().__init__()
+
+    def replace(self, node):
+        # only hoist things that actually need computation (or a load from memory)
+        worth = type(node) in [ast.Binary, ast.Unary] or (
+            type(node) == ast.Var and node.name in self.globalvars)
+        if not worth or not invariant(node, self.info, self.globalvars):
+            return None
+        k = key(node)
+        if k not in self.hoisted:
+            self.hoisted[k] = self.optimizer.newvar(node, "licm")
+            self.definitions.append(ast.LocalDef(
+                self.hoisted[k], node, node.type, node.line))
+        return self.optimizer.var(self.hoisted[k], node)
+
+
+class StrengthReducer(ExpressionRewriter):
+    """ Replaces multiplications of an induction-variable with a constant by a variable that is updated together with the induction-variable"""
+
+    def __init__(self, optimizer, variable, step):
+        self.optimizer = optimizer
+        """ The induction-variable and the constant it is changed by every time"""
+        self.variable = variable
+        self.step = step
+        """ Dict of factor to the variable containing variable*factor"""
+        self.reduced = dict()
+        """ The definitions of the new variables. Are placed in front of the loop"""
+        self.definitions = []
+        """ The updates of the new variables. Are placed behind the update of the induction-variable"""
+        self.updates = []
+        super().__init__()
+
+    def replace(self, node):
+        if type(node) != ast.Binary or node.op != "*":
+            return None
+        if type(node.val1) == ast.Var and node.val1.name == self.variable and type(node.val2) == ast.Const:
+            factor = int(node.val2.value)
+        elif type(node.val2) == ast.Var and node.val2.name == self.variable and type(node.val1) == ast.Const:
+            factor = int(node.val1.value)
+        else:
+            return None
+        if factor not in self.reduced:
+            value = copy.deepcopy(node)
+            name = self.optimizer.newvar(value, "iv")
+            self.reduced[factor] = name
+            self.definitions.append(ast.LocalDef(
+                name, value, "INT", node.line))
+            update = ast.Binary("+", self.optimizer.var(name, node),
+                                self.optimizer.const(self.step*factor, node), node.line)
+            update.type = "INT"
+            self.updates.append(ast.Assign(name, update, node.line))
+        return self.optimizer.var(self.reduced[factor], node)
+
+
+class LoopOptimizer:
+    """ Applies the loop-optimizations to all loops of a programm """
+
+    def __init__(self, programm, unroll=0):
+        self.programm = programm
+        """ The unroll-factor for counted loops. 0 or 1 disable unrolling"""
+        self.unroll = unroll
+        """ The function that is currently optimized"""
+        self.func = None
+        """ Counts the created variables to give them unique names"""
+        self.counter = 0
+        """ The iterations of the hottest loop of the programm in the profile (or None without profile)"""
+        counts = LoopCounts()
+        counts.visit(programm)
+        self.hottest = max(counts.counts, default=None)
+        """ Statistics: number of hoisted expressions, reduced multiplications and unrolled loops"""
+        self.hoisted = 0
+        self.reduced = 0
+        self.unrolled = 0
+
+    def optimize(self):
+        for func in self.programm.funcdefs:
+            self.func = func
+            func.statements = self.block(func.statements)
+
+    def block(self, statements):
+        """ Optimize the loops in the given list of statements. Returns the new list of statements"""
+        result = []
+        for statement in statements:
+            if type(statement) == ast.While:
+                result += self.loop(statement)
+                continue
+            if type(statement) == ast.If:
+                statement.statements = self.block(statement.statements)
+                if statement.elsestatements:
+                    statement.elsestatements = self.block(
+                        statement.elsestatements)
+            result.append(statement)
+        return result
+
+    def loop(self, node):
+        """ Optimize the given loop (and the loops nested in it). Returns the statements that replace the loop"""
+        # hoist invariant expressions first. Afterwards, the nested loops can hoist what is invariant only for them
+        hoister = Hoister(self, loopinfo(node), self.programm.globalvars)
+        hoister.visit(node)
+        self.hoisted += len(hoister.definitions)
+        before = hoister.definitions
+
+        for variable, step, index in self.inductionvariables(node):
+            reducer = StrengthReducer(self, variable, step)
+            reducer.visit(node)
+            if reducer.definitions:
+                self.reduced += len(reducer.definitions)
+                before += reducer.definitions
+                node.statements[index+1:index+1] = reducer.updates
+
+        node.statements = self.block(node.statements)
+        # unroll last, so the unrolled copies of the body already profit from the other optimizations
+        return before + self.unrollloop(node)
+
+    def countedloop(self, node):
+        """ Returns (counter, bound, step) if the given loop is a counted loop: It's condition is i < n (or i <= n) with an invariant n
+        and the local INT variable i is increased exactly once per iteration by a positive constant. Otherwise None"""
+        exp = node.exp
+        if type(exp) != ast.Binary or exp.op not in ["<", "<="] or type(exp.val1) != ast.Var:
+            return None
+        counter = exp.val1.name
+        info = loopinfo(node)
+        if not invariant(exp.val2, info, self.programm.globalvars):
+            return None
+        for variable, step, _ in self.inductionvariables(node):
+            if variable == counter and step > 0:
+                return counter, exp.val2, step
+        return None
+
+    def unrollloop(self, node):
+        """ Unroll the given loop, if it is a counted loop that is worth unrolling. Returns the statements that replace the loop.
+            WHILE i < n DO body END
+        becomes
+            WHILE i < n - (factor-1)*step DO body body ... END
+            WHILE i < n DO body END
+        Every copy of the body increases i by step. The condition of the first loop makes sure that i < n holds at the start of every copy,
+        so the copies behave exactly like the iterations of the original loop. The second loop runs the remaining iterations.
+        Like the original loop, the unrolled loop assumes that i does not overflow."""
+        factor = self.unroll
+        counted = self.countedloop(node) if factor > 1 else None
+        if not counted:
+            return [node]
+        counter, bound, step = counted
+        if node.count is not None:
+            # unrolling cold loops only makes the code larger
+            if node.count == 0 or node.count < self.hottest * coldloop:
+                return [node]
+            # the profile shows how many iterations the loop does every time it is entered. Iterations that do not fill a complete
+            # unrolled iteration run in the remainder-loop, so the factor is halved until it fits
+            trips = node.count // max(node.entries or 0, 1)
+            while factor > 1 and trips < factor:
+                factor //= 2
+            if factor < 2:
+                return [node]
+        info = loopinfo(node)
+        # unrolling nested loops only makes the code larger. The overhead of the outer loop does not matter
+        if info.loops > 1 or info.size * factor > maxunrollsize:
+            return [node]
+
+        distance = (factor - 1) * step
+        before = []
+        if type(bound) == ast.Const:
+            # the new bound must not overflow
+            if int(bound.value) - distance < -2**63:
+                return [node]
+            newbound = self.const(int(bound.value) - distance, bound)
+        else:
+            # compute the new bound once, before the loop
+            value = ast.Binary("-", copy.deepcopy(bound),
+                               self.const(distance, bound), bound.line)
+            value.type = "INT"
+            name = self.newvar(value, "unroll")
+            before.append(ast.LocalDef(name, value, "INT", bound.line))
+            newbound = self.var(name, bound)
+
+        exp = ast.Binary(node.exp.op, copy.deepcopy(
+            node.exp.val1), newbound, node.exp.line)
+        exp.type = node.exp.type
+        unrolled = ast.While(exp, [], node.line)
+        for _ in range(factor):
+            unrolled.statements += copy.deepcopy(node.statements)
+        # the unrolled loop runs factor iterations per check of it's condition
+        if node.count is not None:
+            unrolled.count, unrolled.entries = node.count // factor, node.entries
+        self.unrolled += 1
+        return before + [unrolled, node]
+
+    def inductionvariables(self, node):
+        """ Returns the induction-variables of the loop: Local INT variables that are changed exactly once per iteration by x = x + c (or x - c).
+        Returns a list of (variable, c, index of the update-statement)"""
+        info = loopinfo(node)
+        result = []
+        for index, statement in enumerate(node.statements):
+            if type(statement) != ast.Assign or info.assigned[statement.name] != 1 or statement.name not in self.func.localvars:
+                continue
+            value = statement.value
+            if (type(value) == ast.Binary and value.op in ["+", "-"] and type(value.val1) == ast.Var and value.val1.name == statement.name
+                    and type(value.val2) == ast.Const and value.val2.type == "INT"):
+                step = int(value.val2.value)
+                result.append(
+                    (statement.name, step if value.op == "+" else -step, index))
+        # the update-statements are inserted behind the induction-variable. Process the last one first, so the indices stay valid
+        return reversed(result)
+
+    def newvar(self, node, prefix):
+        """ Create a new local variable in the current function, that is initialized with the given expression, and return it's name"""
+        self.counter += 1
+        name = "_{}{}".format(prefix, self.counter)
+        self.func.localvars[name] = node
+        self.func.localvartypes[name] = node.type
+        return name
+
+    def var(self, name, node):
+        """ Returns a (typed) reference to the given variable. node is the expression the variable replaces"""
+        var = ast.Var(name, node.line)
+        var.type = self.func.localvartypes[name]
+        return var
+
+    def const(self, value, node):
+        return ast.Const(str(value), "INT", node.line)
+
+
+def optimize(programm, unroll=0):
+    """ Optimize all loops of the given (checked) programm. Counted loops are unrolled unroll times (0 or 1 disable unrolling).
+    Returns the number of hoisted expressions, reduced multiplications and unrolled loops"""
+    optimizer = LoopOptimizer(programm, unroll)
+    optimizer.optimize()
+    return optimizer.hoisted, optimizer.reduced, optimizer.unrolled
@@ -257,8 +257,7 @@ def ifstatement(t):
     elsestatements = None
 
     # ELSE-blocks are optional. Check if there is one
-    tok = t.peek()
-    if tok.type == "ELSE":
+    if t.peek().type == "ELSE":
         t.next()
         nl = t.next()
         if nl.type != "NL":
@@ -490,7 +489,7 @@ def factor(t):
             value = "1"
             vtype = "BOOL"
         if value == "FALSE":
-            value == "0"
+            value = "0"
             vtype = "BOOL"
         return ast.Const(value, vtype, tok.line)
     # or a bracketed expression
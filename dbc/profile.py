@@ -0,0 +1,221 @@
+""" Reads the profiles written by programms compiled with --profile and turns them into human-readable reports.
+    A profile contains one entry per instrumented node (see ASMGenerator.probe()). Entries are identified by source-file, function,
+    kind and ordinal (the n-th node of that kind in the function), so they can be mapped back to the AST of the source-file.
+
+    Profiles can also be fed back into the compiler (dbc --use-profile), which then annotates the AST with the measured counts (see annotate())
+    and optimizes the hot parts of the programm.
+
+    Usage: dbc profile-report [dbc.profile] [--annotate]
+"""
+import os.path
+import hashlib
+from collections import OrderedDict, Counter
+
+from dbc.visit import Visitor
+
+
+class ProfileError(Exception):
+    """ Is raised if a profile can not be read """
+
+    def __init__(self, msg):
+        super().__init__(msg)
+
+
+class Entry:
+    """ A single counter-entry of a profile """
+
+    def __init__(self, file, kind, function, line, ordinal, target, count, value):
+        """ The source-file the counted node is in"""
+        self.file = file
+        """ What is counted: func (calls of a function), call (executions of a call-site), loop (iterations of a WHILE) or if (evaluations of an IF-condition)"""
+        self.kind = kind
+        """ The function the counted node is in"""
+        self.function = function
+        """ The source-line of the counted node"""
+        self.line = line
+        """ The number of the node among the nodes of the same kind in it's function (in order of the source)"""
+        self.ordinal = ordinal
+        """ The called function (for func and call), else None"""
+        self.target = target
+        """ How often the node was executed (calls, iterations, evaluations)"""
+        self.count = count
+        """ Depends on kind: cycles spent in the function (func), how often the loop was entered (loop), how often the condition was true (if)"""
+        self.value = value
+
+
+def load(path):
+    """ Read the profile from the given file and return a list of Entry-objects """
+    entries = []
+    try:
+        with open(path) as f:
+            header = f.readline()
+            if not header.startswith("# dbc-profile"):
+                raise ProfileError("{} is not a dbc profile".format(path))
+            for number, line in enumerate(f, 2):
+                fields = line.rstrip("\n").split("\t")
+                if len(fields) != 8:
+                    raise ProfileError(
+                        "{}:{}: malformed profile entry".format(path, number))
+                file, kind, function, srcline, ordinal, target, count, value = fields
+                entries.append(Entry(file, kind, function, int(srcline), int(ordinal),
+                                     None if target == "-" else target, int(count), int(value)))
+    except (OSError, ValueError) as e:
+        raise ProfileError("Can not read profile {}: {}".format(path, e))
+    return entries
+
+
+def forfile(entries, filename):
+    """ Returns the entries that belong to the given source-file. If the profile does not contain the file (e.g. because the programm
+    was profiled in another directory) the entries of a file with the same basename are used"""
+    filename = os.path.abspath(filename)
+    found = [e for e in entries if os.path.abspath(e.file) == filename]
+    if not found:
+        found = [e for e in entries if os.path.basename(
+            e.file) == os.path.basename(filename)]
+    return found
+
+
+def digest(entries):
+    """ Returns a string identifying the given entries. Used as part of cache-keys"""
+    h = hashlib.sha256()
+    for e in entries:
+        h.update("{}\t{}\t{}\t{}\t{}\t{}\n".format(
+            e.kind, e.function, e.line, e.ordinal, e.count, e.value).encode())
+    return h.hexdigest()[:32]
+
+
+class Annotator(Visitor):
+    """ Annotates the nodes of an AST with the counts of their profile-entries (see the fields count, taken, entries and cycles of the ast-nodes).
+    Entries are matched to nodes by function, kind and ordinal. The nodes are numbered in the same order as ASMGenerator.probe() numbers them
+    when instrumenting the code. Entries whose line does not match the node (because the source changed since profiling) are ignored."""
+
+    def __init__(self, entries):
+        """ The entries of the profile. Dict of (function, kind, ordinal) to Entry"""
+        self.entries = {(e.function, e.kind, e.ordinal): e for e in entries}
+        """ The function that is currently annotated"""
+        self.funcname = None
+        """ Counts the nodes of every kind in the current function"""
+        self.ordinals = Counter()
+        """ The number of annotated nodes"""
+        self.annotated = 0
+        super().__init__()
+
+    def entry(self, kind, node):
+        """ Returns the profile-entry for the next node of the given kind (or None)"""
+        ordinal = self.ordinals[kind]
+        self.ordinals[kind] += 1
+        entry = self.entries.get((self.funcname, kind, ordinal))
+        if entry and entry.line == node.line:
+            self.annotated += 1
+            return entry
+        return None
+
+    def visitFuncdef(self, node):
+        self.funcname = node.name
+        self.ordinals = Counter()
+        entry = self.entry("func", node)
+        if entry:
+            node.count, node.cycles = entry.count, entry.value
+        super().visitFuncdef(node)
+
+    def visitCall(self, node):
+        # the arguments are generated (and numbered) before the call itself
+        super().visitCall(node)
+        entry = self.entry("call", node)
+        if entry:
+            node.count = entry.count
+
+    def visitIf(self, node):
+        self.visit(node.exp)
+        entry = self.entry("if", node)
+        if entry:
+            node.count, node.taken = entry.count, entry.value
+        for statement in node.statements:
+            self.visit(statement)
+        if node.elsestatements:
+            for statement in node.elsestatements:
+                self.visit(statement)
+
+    def visitWhile(self, node):
+        entry = self.entry("loop", node)
+        if entry:
+            node.count, node.entries = entry.count, entry.value
+        super().visitWhile(node)
+
+
+def annotate(syntaxtree, entries):
+    """ Annotate the given AST with the counts of the given profile-entries (which should belong to the source-file of the AST, see forfile()).
+    Returns the number of annotated nodes"""
+    annotator = Annotator(entries)
+    annotator.visit(syntaxtree)
+    return annotator.annotated
+
+
+def sourcelines(file):
+    """ Returns the lines of the given source-file (or an empty list if it does not exist anymore)"""
+    try:
+        with open(file) as f:
+            return f.read().split("\n")
+    except OSError:
+        return []
+
+
+def location(entry, cwd):
+    return "{}:{}".format(os.path.relpath(entry.file, cwd), entry.line)
+
+
+def report(entries, annotate=False, top=20, cwd=None):
+    """ Returns a human-readable report of the given profile-entries
+
+    :params entries: The entries of the profile (see load())
+    :params annotate: Also print the complete source-files with the execution-counts of every line
+    :params top: The number of hottest lines to show
+    :params cwd: Paths are shown relative to this directory
+    """
+    cwd = cwd or os.getcwd()
+    sources = dict()
+
+    def sourceline(entry):
+        if entry.file not in sources:
+            sources[entry.file] = sourcelines(entry.file)
+        lines = sources[entry.file]
+        return lines[entry.line-1].strip() if 0 < entry.line <= len(lines) else ""
+
+    # functions, sorted by the time spent in them (cycles include the called functions)
+    functions = sorted([e for e in entries if e.kind == "func"],
+                       key=lambda e: e.value, reverse=True)
+    text = "{:>12}{:>16}{:>14}  {:<20}{}\n".format(
+        "calls", "cycles", "cycles/call", "function", "location")
+    for e in functions:
+        text += "{:>12}{:>16}{:>14}  {:<20}{}\n".format(e.count, e.value, e.value // e.count if e.count else 0,
+                                                        e.function, location(e, cwd))
+
+    # the most executed lines
+    hot = sorted([e for e in entries if e.kind != "func"],
+                 key=lambda e: e.count, reverse=True)[:top]
+    text += "\n{:>12}  {:<8}{:<24}{:<24}{}\n".format(
+        "count", "kind", "location", "detail", "source")
+    for e in hot:
+        if e.kind == "loop":
+            detail = "{:.1f} iter/entry".format(
+                e.count / e.value) if e.value else ""
+        elif e.kind == "if":
+            detail = "{:.1f}% taken".format(
+                e.value * 100 / e.count) if e.count else ""
+        else:
+            detail = "calls " + (e.target or "")
+        text += "{:>12}  {:<8}{:<24}{:<24}{}\n".format(
+            e.count, e.kind, location(e, cwd), detail, sourceline(e))
+
+    if annotate:
+        # show every source-file with the highest count of every line (like gcov)
+        counts = OrderedDict()
+        for e in entries:
+            lines = counts.setdefault(e.file, dict())
+            lines[e.line] = max(lines.get(e.line, 0), e.count)
+        for file, lines in counts.items():
+            text += "\n{}:\n".format(os.path.relpath(file, cwd))
+            for number, line in enumerate(sourcelines(file), 1):
+                count = str(lines[number]) if number in lines else "-"
+                text += "{:>12} {:>5}: {}\n".format(count, number, line)
+    return text
@@ -0,0 +1,101 @@
+""" Finds the pure functions of a programm and the ones that are worth memoizing (see --memoize).
+    A function is pure, if it's result only depends on it's arguments and calling it has no other effect than computing the result:
+    It does not assign global variables, does not read global variables that are assigned anywhere in the programm, does not call
+    print() or input(), does not call functions of other compilation-units (nothing is known about them) and only calls pure functions.
+
+    Calls of memoized functions first look up their arguments in a table of previous results. Only on a miss the function is executed and
+    it's result stored in the table. The table is a fixed-size hash-table (memoentries entries). Colliding arguments simply replace the older
+    entry, so the memory needed is bounded and lookups are always O(1). This turns the exponential runtime of recursive functions like fib
+    into a (nearly) linear one.
+"""
+from dbc.visit import Visitor
+
+""" Only pure functions with at most this many arguments are memoized """
+maxargs = 3
+""" The number of entries in the table of every memoized function. Must be a power of 2 """
+memoentries = 4096
+""" log2(memoentries). The index into the table are the upper bits of the (multiplicative) hash of the arguments"""
+memobits = 12
+""" The multiplier for the hash (2^64 divided by the golden ratio, like in Fibonacci-hashing)"""
+memomultiplier = 0x9E3779B97F4A7C15
+
+
+class FunctionInfo(Visitor):
+    """ Collects the global variables a function reads and writes and the functions it calls """
+
+    def __init__(self, func):
+        self.func = func
+        self.reads = set()
+        self.writes = set()
+        self.calls = set()
+        super().__init__()
+
+    def isglobal(self, name):
+        return name not in self.func.localvars
+
+    def visitVar(self, node):
+        if self.isglobal(node.name):
+            self.reads.add(node.name)
+
+    def visitAssign(self, node):
+        if self.isglobal(node.name):
+            self.writes.add(node.name)
+        super().visitAssign(node)
+
+    def visitLocaldef(self, node):
+        self.visitAssign(node)
+
+    def visitCall(self, node):
+        self.calls.add(node.name)
+        super().visitCall(node)
+
+
+def functioninfos(programm):
+    """ Returns a dict of function-name to the FunctionInfo of the function"""
+    infos = dict()
+    for func in programm.funcdefs:
+        infos[func.name] = FunctionInfo(func)
+        infos[func.name].visit(func)
+    return infos
+
+
+def purefunctions(programm):
+    """ Returns the set of the names of the pure functions of the given (checked) programm """
+    infos = functioninfos(programm)
+    written = set()
+    for info in infos.values():
+        written |= info.writes
+    # start by assuming every function is pure (recursive functions call themselves) and remove the impure ones until nothing changes
+    pure = {name for name, info in infos.items() if not info.writes and not (info.reads & written)}
+    changed = True
+    while changed:
+        changed = False
+        for name in list(pure):
+            # builtins and functions of other compilation-units are not in infos
+            if any(callee not in pure for callee in infos[name].calls):
+                pure.remove(name)
+                changed = True
+    return pure
+
+
+def memoizable(programm):
+    """ Returns the names of the functions of the given (checked) programm that should be memoized:
+    Pure, recursive functions that return a value and have between 1 and maxargs arguments.
+    Non-recursive functions are not worth it, the lookup would often cost more than computing the result"""
+    infos = functioninfos(programm)
+    pure = purefunctions(programm)
+    result = []
+    for func in programm.funcdefs:
+        if func.name not in pure or func.name == "main" or not func.returntype or not 1 <= len(func.args) <= maxargs:
+            continue
+        # recursive: the function can be reached from the functions it calls
+        reached = set()
+        pending = list(infos[func.name].calls)
+        while pending:
+            name = pending.pop()
+            if name not in reached and name in infos:
+                reached.add(name)
+                pending += infos[name].calls
+        if func.name in reached:
+            result.append(func.name)
+    return result
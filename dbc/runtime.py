@@ -0,0 +1,218 @@
+""" Contains the runtime-library of DBASIC. The runtime holds the code for the builtin functions (input(), print()) and the buffers they need.
+    Instead of emitting this code into every compiled programm (and having gcc re-assemble it on every build), it is assembled
+    once into an object-file that is cached on disk and linked to every programm.
+    The cache is keyed on the compiler version (see fingerprint()), so updating the compiler automatically rebuilds the runtime.
+"""
+import os
+import os.path
+import hashlib
+import subprocess
+import tempfile
+import functools
+from textwrap import dedent
+
+import dbc
+from dbc.errors import LinkError
+
+
+def builtinFunctions():
+    """ generate code for the builtin functions """
+    code = "    .text\n"
+    code += "    .globl input\n"
+    code += "    .globl print\n"
+    # the type and size of the functions make them show up properly in tools like perf
+    code += "    .type input, @function\n"
+    code += "    .type print, @function\n"
+    input = "\n\ninput:\n"
+    input += generateSyscall(0, "$0", "$inputbuf", "$127")
+    input += "mov $inputbuf, %rdi\n"
+    # the call of input() pushed the return-address. Keep %rsp 16-byte aligned for atoi (the ABI requires it at every call)
+    input += "sub $8, %rsp\n"
+    input += "call atoi\n"
+    input += "add $8, %rsp\n"
+    input += "ret\n"
+    input += ".size input, .-input\n\n\n"
+    print = "\n\nprint:\n"
+    # printf has to see the arguments that were passed on the stack exactly where the caller placed them, so nothing may be pushed.
+    # Instead the return-address is moved out of the way, which also leaves %rsp 16-byte aligned (like it was at the call)
+    print += "pop printret(%rip)\n"
+    print += "mov $0, %rax\n"
+    print += "call printf\n"
+    # fflush(NULL) flushes all streams. Unlike the address of stdout, it needs no data from the C-library (see dbc.jit)
+    print += "mov $0, %rdi\n"
+    print += "call fflush\n"
+    print += "push printret(%rip)\n"
+    print += "ret\n"
+    print += ".size print, .-print\n\n"
+    data = ".data\n"
+    data += "inputbuf:\n.skip 128\n\n"
+    data += "printret:\n.quad 0\n\n"
+    # the runtime does not need an executable stack
+    data += ".section .note.GNU-stack,\"\",@progbits\n"
+    return code+input+print+data
+
+
+def profileruntime():
+    """ generate the (c-)code of the profiling-runtime. It is only linked to programms compiled with --profile.
+    Every instrumented object registers it's profiling-table (see ASMGenerator.profileTable()) here before main() runs.
+    When the programm exits, the counters of all tables are written to the file named by $DBC_PROFILE (default: dbc.profile).
+    Every line of the file describes one counter: source-file, kind, function, line, ordinal, target, count and a second value
+    (cycles for functions, entries for loops, taken-count for IFs)"""
+    return dedent("""\
+    #include <stdio.h>
+    #include <stdlib.h>
+    #include <stdint.h>
+    #include <inttypes.h>
+
+    struct entry {
+        int64_t count;
+        int64_t value;
+        const char *desc;
+    };
+
+    struct table {
+        struct table *next;
+        const char *file;
+        int64_t size;
+        struct entry entries[];
+    };
+
+    static struct table *tables;
+
+    static void dump(void) {
+        const char *path = getenv("DBC_PROFILE");
+        FILE *f = fopen(path && *path ? path : "dbc.profile", "w");
+        if (!f) {
+            perror("dbc: can not write profile");
+            return;
+        }
+        fprintf(f, "# dbc-profile 1\\n");
+        for (struct table *t = tables; t; t = t->next) {
+            for (int64_t i = 0; i < t->size; i++) {
+                fprintf(f, "%s\\t%s\\t%" PRId64 "\\t%" PRId64 "\\n", t->file, t->entries[i].desc,
+                        t->entries[i].count, t->entries[i].value);
+            }
+        }
+        fclose(f);
+    }
+
+    void dbc_profile_register(struct table *t) {
+        if (!tables) {
+            atexit(dump);
+        }
+        t->next = tables;
+        tables = t;
+    }
+    """)
+
+
+def generateSyscall(call, *args):
+    """ generate the code needed to perform a syscall """
+    # the registers for passing arguments
+    regs = ["rdi", "rsi", "rdx", "r10", "r8", "r9"]
+    # choose syscall via number in %eax
+    code = "mov ${}, %eax\n".format(call)
+    # place arguments in registers
+    for i, arg in enumerate(args):
+        code += "mov {}, %{}\n".format(arg, regs[i])
+    # perform syscall
+    code += "syscall\n"
+    return code
+
+
+@functools.lru_cache(maxsize=None)
+def fingerprint():
+    """ Returns a string that identifies the exact version of the compiler. Consists of the version-number and a hash over the compiler's sources,
+        so that cached artifacts are also invalidated when the compiler is modified during development (see 'pip install -e').
+    """
+    h = hashlib.sha256()
+    pkgdir = os.path.dirname(os.path.abspath(dbc.__file__))
+    for name in sorted(os.listdir(pkgdir)):
+        if name.endswith(".py"):
+            with open(os.path.join(pkgdir, name), "rb") as f:
+                h.update(name.encode())
+                h.update(f.read())
+    return dbc.__version__ + "-" + h.hexdigest()[:16]
+
+
+def cachedir():
+    """ Returns the directory used to cache build-artifacts (the runtime-object, compiled objects etc.).
+        Can be overridden by setting the environment-variable DBC_CACHE_DIR.
+    """
+    path = os.environ.get("DBC_CACHE_DIR")
+    if not path:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+            os.path.expanduser("~"), ".cache")
+        path = os.path.join(base, "dbc")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def cachedfile(key, suffix, build):
+    """ Returns the path to a file in the cache identified by key. If the file does not exist yet, it is created by calling build(path).
+        build() writes to a temporary file that is then atomically moved into place. This way concurrently running compilers never see half-written files.
+
+        :params key: A string uniquely identifying the content of the file
+        :params suffix: The file-extension to use for the cached file
+        :params build: A function that receives a path and writes the wanted file to it
+        :returns: The path of the cached file
+    """
+    path = os.path.join(cachedir(), key + suffix)
+    if os.path.isfile(path):
+        return path
+    fd, tmppath = tempfile.mkstemp(suffix=suffix, dir=cachedir())
+    os.close(fd)
+    try:
+        build(tmppath)
+        os.replace(tmppath, path)
+    finally:
+        if os.path.exists(tmppath):
+            os.remove(tmppath)
+    return path
+
+
+async def cachedfileasync(key, suffix, build, rebuild=False):
+    """ Like cachedfile(), but build is a coroutine-function. Allows to create multiple cached files concurrently.
+    If rebuild is true, the file is built (and replaced) even if it is already in the cache"""
+    path = os.path.join(cachedir(), key + suffix)
+    if os.path.isfile(path) and not rebuild:
+        return path
+    fd, tmppath = tempfile.mkstemp(suffix=suffix, dir=cachedir())
+    os.close(fd)
+    try:
+        await build(tmppath)
+        os.replace(tmppath, path)
+    finally:
+        if os.path.exists(tmppath):
+            os.remove(tmppath)
+    return path
+
+
+def gcc(args, code=None):
+    """ Run gcc with the given args and code as stdin. Raises LinkError (containing the errors reported by gcc) if gcc fails """
+    result = subprocess.run(["gcc"] + args, input=code.encode()
+                            if code is not None else None, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise LinkError(result.stderr.decode())
+
+
+def runtimeobject():
+    """ Returns the path to the assembled runtime-object. Assembles it if it is not yet cached for this compiler version."""
+    code = builtinFunctions()
+    key = "runtime-" + fingerprint()
+
+    def build(path):
+        gcc(["-c", "-o", path, "-xassembler", "-"], code)
+
+    return cachedfile(key, ".o", build)
+
+
+def profileobject():
+    """ Returns the path to the compiled profiling-runtime (see profileruntime()). Compiles it if it is not yet cached for this compiler version."""
+    code = profileruntime()
+    key = "profile-" + fingerprint()
+
+    def build(path):
+        gcc(["-c", "-O2", "-o", path, "-xc", "-"], code)
+
+    return cachedfile(key, ".o", build)
@@ -0,0 +1,54 @@
+""" The DBASIC compile-server. It keeps the compiler loaded (and it's caches warm) and compiles the programms it receives via a
+    unix-socket. Every request is handled in it's own thread, so multiple requests are processed concurrently.
+
+    The protocol is as simple as possible: The client sends a single line containing a JSON object with the command-line arguments
+    for dbc ('args') and the directory these arguments are relative to ('cwd'). The server answers with a JSON object containing the
+    exit-status ('status') and the output of the compilation ('output') and closes the connection.
+"""
+import io
+import os
+import json
+import socketserver
+
+import dbc.cli as cli
+from dbc.client import socketpath
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    """ Handles a single compile-request """
+
+    def handle(self):
+        out = io.StringIO()
+        try:
+            request = json.loads(self.rfile.readline().decode())
+            status = cli.run(request["args"], out, request["cwd"], True)
+        except Exception as e:
+            # never let a broken request kill the server
+            out.write("Internal compiler error: {}\n".format(e))
+            status = 1
+        self.wfile.write(json.dumps(
+            {"status": status, "output": out.getvalue()}).encode())
+
+
+class Server(socketserver.ThreadingUnixStreamServer):
+    """ The compile-server. Handles every request in a separate thread """
+    daemon_threads = True
+
+
+def serve(path=None):
+    """ Start the server and handle requests until interrupted
+
+    :params path: The path of the unix-socket to listen on. Defaults to client.socketpath()
+    """
+    path = path or socketpath()
+    # remove the socket of a previous server that did not shut down cleanly
+    if os.path.exists(path):
+        os.remove(path)
+    with Server(path, RequestHandler) as server:
+        print("Listening on "+path, flush=True)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.remove(path)
@@ -0,0 +1,96 @@
+""" Stack-slot coloring. Is used by the asm-backend with -O1 or higher to shrink the stack-frames (see ASMGenerator.visitFuncdef()).
+
+    Every local variable that is not kept in a register needs a slot in the stack-frame. But variables that are never live at the same time
+    (like the variables of two blocks that follow each other) can share a slot: The value of one of them is never needed anymore when the
+    other one is assigned.
+    A liveness-analysis (like the one of dbc.deadcode) finds the variables that are live at every assignment. The assigned variable
+    interferes with all of them, they need different slots. Then the variables are colored greedily (in the order of their declaration)
+    with the lowest slot that none of the variables they interfere with uses.
+
+    Variables that are read before they are assigned (which is possible, as the checker only requires the declaration to be somewhere in front
+    of the use) get a slot of their own, as their value is whatever the slot contains.
+"""
+import dbc.ast as ast
+from dbc.deadcode import used
+
+
+class Interference:
+    """ Builds the interference-graph of the variables of a function """
+
+    def __init__(self, func, variables):
+        self.func = func
+        """ Dict of variable-name to the set of variables it interferes with. Only contains the variables that need a slot"""
+        self.edges = {name: set() for name in variables}
+        """ The variables that need a slot"""
+        self.variables = set(variables)
+        """ The variables read by the expressions. Dict of id(expression) to set. The loops are analysed repeatedly"""
+        self.reads = dict()
+
+    def used(self, exp):
+        """ Returns the set of variables read by the given expression (or None)"""
+        key = id(exp)
+        if key not in self.reads:
+            self.reads[key] = used(exp)
+        return self.reads[key]
+
+    def interfere(self, name, others):
+        """ Let the variable interfere with all the other variables"""
+        if name not in self.edges:
+            return
+        others = self.variables.intersection(others)
+        others.discard(name)
+        self.edges[name] |= others
+        for other in others:
+            self.edges[other].add(name)
+
+    def build(self):
+        live = self.live(self.func.statements, set())
+        # the arguments are all assigned when the function is entered
+        for arg in self.func.args:
+            self.interfere(arg, live | set(self.func.args))
+        for name in live - set(self.func.args):
+            self.interfere(name, self.variables)
+        return self.edges
+
+    def live(self, statements, live):
+        """ Returns the variables that are live before the given statements, if the variables live are live behind them.
+        Records the interference of every assigned variable with the variables live behind the assignment"""
+        for statement in reversed(statements):
+            t = type(statement)
+            if t in [ast.Assign, ast.LocalDef]:
+                self.interfere(statement.name, live)
+                live = (live - {statement.name}) | self.used(statement.value)
+            elif t == ast.Return:
+                # nothing behind a RETURN is executed
+                live = self.used(statement.expression)
+            elif t == ast.Call:
+                live = live | self.used(statement)
+            elif t == ast.If:
+                thenlive = self.live(statement.statements, live)
+                elselive = self.live(statement.elsestatements or [], live)
+                live = self.used(statement.exp) | thenlive | elselive
+            elif t == ast.While:
+                # the variables used by the loop are live at it's end too. Repeat until nothing changes anymore
+                # (the live sets only grow, so the interferences recorded in the earlier rounds are correct too)
+                looplive = self.used(statement.exp) | live
+                while True:
+                    new = looplive | self.live(statement.statements, looplive)
+                    if new == looplive:
+                        break
+                    looplive = new
+                live = looplive
+        return live
+
+
+def color(func, variables):
+    """ Assign stack-slots to the given variables (of the checked FuncDef func). Variables that are never live at the same time share slots.
+    Returns a dict of variable-name to slot-number (starting at 0) and the number of used slots"""
+    edges = Interference(func, variables).build()
+    slots = dict()
+    for name in variables:
+        taken = set(slots[other] for other in edges[name] if other in slots)
+        slot = 0
+        while slot in taken:
+            slot += 1
+        slots[name] = slot
+    return slots, len(set(slots.values()))
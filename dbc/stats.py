@@ -0,0 +1,158 @@
+""" Collects statistics about a compilation: How much time (wall and cpu) and memory every stage of the compiler needed and
+    how big the processed programm was (tokens, AST-nodes, emitted instructions etc.).
+    Statistics can be reported human-readable or as JSON (e.g. to track the performance of the compiler over time).
+
+    Usage:
+        stats = Statistics()
+        with stats.measure("parse"):
+            ...
+        stats.count("tokens", 42)
+        print(stats.report())
+"""
+import json
+import time
+import threading
+import tracemalloc
+import contextlib
+from collections import OrderedDict
+
+from dbc.visit import Visitor
+
+""" tracemalloc measures the whole process. Stages whose memory is measured must not run at the same time (e.g. in the threads of the
+    compile-server), or they would reset (or stop) each other's measurement. Reentrant, as measured stages can contain others"""
+memorylock = threading.RLock()
+
+
+class Statistics:
+    """ Holds the timings of the compiler-stages and the counters of a compilation """
+
+    def __init__(self, enabled=True, memory=True):
+        """ If false, nothing is recorded. Is used as default, so that code does not need to check for None everywhere"""
+        self.enabled = enabled
+        """ If true, the peak memory usage of every stage is measured using tracemalloc. Makes the compilation noticeably slower."""
+        self.memory = memory
+        """ The measured stages. Dict of stage-name to dict with the keys 'wall', 'cpu' (both seconds), 'memory' (peak, bytes) and 'runs'"""
+        self.passes = OrderedDict()
+        """ Dict of counter-name to value"""
+        self.counters = OrderedDict()
+
+    @contextlib.contextmanager
+    def measure(self, name):
+        """ Context-manager that measures the time and memory needed by the code inside of it. The results are added to stage 'name'"""
+        if not self.enabled:
+            yield
+            return
+        started = False
+        if self.memory:
+            memorylock.acquire()
+            if tracemalloc.is_tracing():
+                tracemalloc.reset_peak()
+            else:
+                tracemalloc.start()
+                started = True
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall
+            cpu = time.process_time() - cpu
+            memory = None
+            if self.memory:
+                memory = tracemalloc.get_traced_memory()[1]
+                if started:
+                    tracemalloc.stop()
+                memorylock.release()
+            self.record(name, wall, cpu, memory)
+
+    def record(self, name, wall, cpu, memory=None):
+        """ Add a measurement for the stage 'name'. Is used for stages that can not be measured by measure() (e.g. because they run in a subprocess)"""
+        if not self.enabled:
+            return
+        stage = self.passes.setdefault(
+            name, {"wall": 0, "cpu": 0, "memory": None, "runs": 0})
+        stage["wall"] += wall
+        stage["cpu"] += cpu
+        stage["runs"] += 1
+        if memory is not None:
+            stage["memory"] = max(stage["memory"] or 0, memory)
+
+    def count(self, name, value=1):
+        """ Increase the counter 'name' by value """
+        if not self.enabled:
+            return
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def merge(self, other):
+        """ Add the measurements and counters of other (e.g. from the compilation of another file) to this one"""
+        for name, stage in other.passes.items():
+            self.record(name, stage["wall"], stage["cpu"], stage["memory"])
+            self.passes[name]["runs"] += stage["runs"] - 1
+        for name, value in other.counters.items():
+            self.count(name, value)
+
+    def report(self, timings=True, counters=True):
+        """ Returns a human-readable report
+
+        :params timings: Include the timings of the stages
+        :params counters: Include the counters
+        """
+        text = ""
+        if timings:
+            text += "{:<20}{:>12}{:>12}{:>16}\n".format("stage",
+                                                      "wall (ms)", "cpu (ms)", "peak mem (KiB)")
+            for name, stage in self.passes.items():
+                memory = "{:.1f}".format(
+                    stage["memory"]/1024) if stage["memory"] is not None else "-"
+                text += "{:<20}{:>12.3f}{:>12.3f}{:>16}\n".format(
+                    name, stage["wall"]*1000, stage["cpu"]*1000, memory)
+            text += "{:<20}{:>12.3f}{:>12.3f}\n".format("total", sum(s["wall"] for s in self.passes.values())*1000,
+                                                        sum(s["cpu"] for s in self.passes.values())*1000)
+        if counters:
+            if timings:
+                text += "\n"
+            for name, value in self.counters.items():
+                text += "{:<28}{:>12}\n".format(name, value)
+        return text
+
+    def json(self, timings=True, counters=True):
+        """ Returns the statistics as JSON. See report() for the parameters """
+        data = OrderedDict()
+        if timings:
+            data["passes"] = self.passes
+        if counters:
+            data["counters"] = self.counters
+        return json.dumps(data, indent=2)
+
+
+""" Statistics-object that records nothing. Used as default-argument """
+nostats = Statistics(enabled=False)
+
+
+class NodeCounter(Visitor):
+    """ Counts the nodes of an AST """
+
+    def __init__(self):
+        self.count = 0
+        super().__init__()
+
+    def visit(self, node):
+        self.count += 1
+        return self.dispatch[type(node)](self, node)
+
+
+def countnodes(node):
+    """ Returns the number of nodes in the given AST """
+    counter = NodeCounter()
+    counter.visit(node)
+    return counter.count
+
+
+def countinstructions(code):
+    """ Returns the number of instructions in the given assembler-code (lines that are neither labels nor directives) """
+    count = 0
+    for line in code.splitlines():
+        line = line.strip()
+        if line and not line.startswith(".") and not line.endswith(":") and not line.startswith("#"):
+            count += 1
+    return count
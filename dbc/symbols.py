@@ -0,0 +1,46 @@
+""" The symbol-table of a programm. It is built once by the VariableChecker (and stored in ast.Programm.symbols) and used by all later stages
+    to look up functions and variables by name, instead of searching the lists of the AST.
+
+    All names entered into the table (and the names in the nodes that refer to them) are interned (see sys.intern). Equal names are then
+    the same string-object, which makes comparing them and looking them up in dicts cheaper.
+"""
+import sys
+
+
+class SymbolTable:
+    """ Hashed lookup of the functions, global variables and local variables of a programm """
+
+    def __init__(self):
+        """ Dict of function-name to the definition (ast.FuncDef) of the function"""
+        self.functions = dict()
+        """ Dict of the name of a global variable to it's initial value. Is the same dict as ast.Programm.globalvars"""
+        self.globalvars = dict()
+        """ Dict of the name of a global variable to it's type. Is the same dict as ast.Programm.globalvartypes"""
+        self.globalvartypes = dict()
+
+    def intern(self, name):
+        """ Returns the interned version of name"""
+        return sys.intern(name)
+
+    def define(self, func):
+        """ Enter the given function (ast.FuncDef) into the table. Stages that create functions (see dbc.constprop) must call this"""
+        func.name = self.intern(func.name)
+        self.functions[func.name] = func
+
+    def remove(self, name):
+        """ Remove the function with the given name from the table"""
+        self.functions.pop(name, None)
+
+    def function(self, name):
+        """ Returns the definition of the function with the given name, or None if it is not defined in this programm"""
+        return self.functions.get(name)
+
+    def islocal(self, name, func):
+        """ Returns true if name is a local variable (or argument) of the given function"""
+        return func is not None and name in func.localvartypes
+
+    def vartype(self, name, func):
+        """ Returns the type of the variable with the given name, as seen from inside the given function (None for global code)"""
+        if self.islocal(name, func):
+            return func.localvartypes[name]
+        return self.globalvartypes[name]
@@ -13,50 +13,80 @@ class VisitorError(Exception):
         super().__init__(msg)
 
 
+""" The method of a Visitor that is called for every type of AST-node"""
+methodnames = {
+    ast.Programm: "visitProgramm",
+    ast.Unary: "visitUnary",
+    ast.Binary: "visitBinary",
+    ast.Var: "visitVar",
+    ast.Const: "visitConst",
+    ast.Str: "visitStr",
+    ast.Assign: "visitAssign",
+    ast.If: "visitIf",
+    ast.While: "visitWhile",
+    ast.Return: "visitReturn",
+    ast.Call: "visitCall",
+    ast.FuncDef: "visitFuncdef",
+    ast.GlobalDef: "visitGlobaldef",
+    ast.LocalDef: "visitLocaldef",
+}
+
+
 class Visitor():
     """ The baseclass for all visitores. It knows which function to call for which ast-type.
     All visitors override the provided default-methods with their own logic.
     The un-overriden method contain the logic to visit all the children of the specifi node type.
     If a visitor does not need to perform special actions for some specific type it does not need to override the specific method.
+
+    The dispatch-tables (node-type to method) are built only once per visitor-class, when the class is created (see __init_subclass__).
+    The un-overriden methods call the methods for the children directly from the table, which saves the call of visit() for every node.
+    Visitors that override visit() (e.g. to count the nodes) get a table that calls their visit() for every child instead.
     """
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.builddispatch()
+
+    @classmethod
+    def builddispatch(cls):
+        """ Build the dispatch-tables of this class"""
+        # the methods are looked up on the class, so the overrides of the subclass are found
+        """ Dict of ast-type to the (unbound) visitXXX method of this class. Used by visit()"""
+        cls.dispatch = {t: getattr(cls, name)
+                        for t, name in methodnames.items()}
+        """ Dict of ast-type to the (unbound) method the un-overriden methods call for the children of a node"""
+        if cls.visit is Visitor.visit:
+            cls.childdispatch = cls.dispatch
+        else:
+            cls.childdispatch = {t: cls.visit for t in methodnames}
+
     def __init__(self):
-        self.funcmapping = {
-            ast.Programm: self.visitProgramm,
-            ast.Unary: self.visitUnary,
-            ast.Binary: self.visitBinary,
-            ast.Var: self.visitVar,
-            ast.Const: self.visitConst,
-            ast.Str: self.visitStr,
-            ast.Assign: self.visitAssign,
-            ast.If: self.visitIf,
-            ast.While: self.visitWhile,
-            ast.Return: self.visitReturn,
-            ast.Call: self.visitCall,
-            ast.FuncDef: self.visitFuncdef,
-            ast.GlobalDef: self.visitGlobaldef,
-            ast.LocalDef: self.visitLocaldef,
-        }
+        # attributes of the instance are found faster than the ones of the class
+        self.dispatch = self.dispatch
+        self.childdispatch = self.childdispatch
 
     def visit(self, node):
         """ Main visit-function. Calles the correct visitXX method based on the type of node"""
-        visitfunc = self.funcmapping[type(node)]
-        if not visitfunc:
+        try:
+            visitfunc = self.dispatch[type(node)]
+        except KeyError:
             raise VisitorError("Unkown AST-Node-Type:" + str(node))
-        return visitfunc(node)
+        return visitfunc(self, node)
 
     def visitProgramm(self, node):
+        dispatch = self.childdispatch
         for glob in node.globaldefs:
-            self.visit(glob)
+            dispatch[type(glob)](self, glob)
         for func in node.funcdefs:
-            self.visit(func)
+            dispatch[type(func)](self, func)
 
     def visitUnary(self, node):
-        self.visit(node.val)
+        self.childdispatch[type(node.val)](self, node.val)
 
     def visitBinary(self, node):
-        self.visit(node.val1)
-        self.visit(node.val2)
+        dispatch = self.childdispatch
+        dispatch[type(node.val1)](self, node.val1)
+        dispatch[type(node.val2)](self, node.val2)
 
     def visitVar(self, node):
         pass
@@ -68,36 +98,42 @@ class Visitor():
         pass
 
     def visitAssign(self, node):
-        self.visit(node.value)
+        self.childdispatch[type(node.value)](self, node.value)
 
     def visitIf(self, node):
-        self.visit(node.exp)
+        dispatch = self.childdispatch
+        dispatch[type(node.exp)](self, node.exp)
         for statement in node.statements:
-            self.visit(statement)
+            dispatch[type(statement)](self, statement)
         if node.elsestatements:
             for statement in node.elsestatements:
-                self.visit(statement)
-        pass
+                dispatch[type(statement)](self, statement)
 
     def visitWhile(self, node):
-        self.visit(node.exp)
+        dispatch = self.childdispatch
+        dispatch[type(node.exp)](self, node.exp)
         for statement in node.statements:
-            self.visit(statement)
+            dispatch[type(statement)](self, statement)
 
     def visitReturn(self, node):
         if node.expression:
-            self.visit(node.expression)
+            self.childdispatch[type(node.expression)](self, node.expression)
 
     def visitCall(self, node):
+        dispatch = self.childdispatch
         for arg in node.args:
-            self.visit(arg)
+            dispatch[type(arg)](self, arg)
 
     def visitFuncdef(self, node):
+        dispatch = self.childdispatch
         for statement in node.statements:
-            self.visit(statement)
+            dispatch[type(statement)](self, statement)
 
     def visitGlobaldef(self, node):
-        self.visit(node.value)
+        self.childdispatch[type(node.value)](self, node.value)
 
     def visitLocaldef(self, node):
-        self.visit(node.value)
+        self.childdispatch[type(node.value)](self, node.value)
+
+
+Visitor.builddispatch()
@@ -0,0 +1,433 @@
+""" A register-based bytecode-interpreter for DBASIC (see 'dbc run --backend vm'). It is an engine for dbc.interpret.Programm.
+
+    The BytecodeGenerator compiles every function of the checked AST into a list of instructions. An instruction is a tuple
+    (opcode, a, b, c) of small ints. Most operands are registers. The registers of a running function are a python-list:
+    - The local variables (the arguments first). A variable's register is it's position in FuncDef.localvars
+    - The constants (INTs and the strings passed to print()) the function uses
+    - The temporaries needed to compute the expressions
+    Variables and constants are registers, so reading them needs no instruction at all. Operations compute their result directly
+    into the register of the variable it is assigned to (or into the argument of a call), so 'x = x + 1' is a single instruction.
+    Comparisons that decide an IF or a WHILE are fused with the conditional jump. Global variables are loaded and stored by
+    instructions of their own.
+    Every call copies the registers of the function from a list that contains the values of the constants, so they never have to be
+    loaded either.
+
+    The Machine runs the instructions in a single loop. Calls do not recurse in python: The registers and the position of the caller
+    are pushed on a list, so the depth of the recursion is only limited by the available memory.
+    The loop tests the opcodes in the order of their numbers, which puts the most frequent ones first.
+"""
+import dbc.ast as ast
+from dbc.visit import Visitor
+from dbc.constprop import wrap
+from dbc.interpret import divide, printformat, unescape, INTMIN
+import dbc.interpret as interpret
+
+""" The opcodes. Most frequent first, as the Machine tests them in this order"""
+(ADD, JLT, MOVE, SUB, AND, CALL, RET, MUL, JGE, JUMP, DIV, JLE, JGT, JEQ, JNE, LOADG,
+ STOREG, JTRUE, JFALSE, OR, LT, GE, LE, GT, EQ, NE, NEG, PRINT, INPUT) = range(29)
+
+""" The names of the opcodes (see disassemble())"""
+opnames = ["ADD", "JLT", "MOVE", "SUB", "AND", "CALL", "RET", "MUL", "JGE", "JUMP", "DIV", "JLE", "JGT", "JEQ", "JNE", "LOADG",
+           "STOREG", "JTRUE", "JFALSE", "OR", "LT", "GE", "LE", "GT", "EQ", "NE", "NEG", "PRINT", "INPUT"]
+
+""" The biggest value of an INT"""
+INTMAX = -INTMIN - 1
+
+""" The opcode of every binary operator: regs[a] = regs[b] op regs[c]"""
+binaryops = {"+": ADD, "-": SUB, "*": MUL, "/": DIV, "&": AND, "|": OR,
+             "<": LT, ">=": GE, "<=": LE, ">": GT, "==": EQ, "!=": NE}
+
+""" The opcode of the conditional jump of every comparison: if regs[a] op regs[b]: jump to c"""
+jumps = {"<": JLT, ">=": JGE, "<=": JLE, ">": JGT, "==": JEQ, "!=": JNE}
+
+""" The comparison that is true if the key is false"""
+negations = {"==": "!=", "!=": "==", "<": ">=",
+             ">": "<=", "<=": ">", ">=": "<"}
+
+
+class Function:
+    """ A function compiled to bytecode """
+
+    def __init__(self, name, nargs):
+        self.name = name
+        """ The number of arguments. They are the first registers"""
+        self.nargs = nargs
+        """ The instructions. A list of tuples (opcode, a, b, c)"""
+        self.code = []
+        """ The initial values of the registers behind the arguments (local variables, constants and temporaries).
+        Every call copies them"""
+        self.registers = []
+
+
+class Constants(Visitor):
+    """ Collects the constants used by a function. Every constant gets a register """
+
+    def __init__(self):
+        super().__init__()
+        """ The values of the constants (the keys, a dict keeps them in order). 0 is the result of functions that do not return a value"""
+        self.values = {0: None}
+
+    def visitConst(self, node):
+        self.values.setdefault(int(node.value))
+
+    def visitStr(self, node):
+        self.values.setdefault(unescape(node.value))
+
+    def visitUnary(self, node):
+        # negative constants are computed by the BytecodeGenerator
+        if type(node.val) == ast.Const:
+            self.values.setdefault(wrap(-int(node.val.value)))
+        else:
+            super().visitUnary(node)
+
+    def visitCall(self, node):
+        # the format-string of print() is not kept in a register
+        for arg in node.args[1:] if node.name == "print" else node.args:
+            self.visit(arg)
+
+
+class BytecodeGenerator(Visitor):
+    """ Compiles a checked AST to bytecode. The visitXXX methods of the expressions return the register that contains their value.
+    While generating the code the instructions are lists (so the targets of the jumps can be filled in later) """
+
+    def __init__(self):
+        super().__init__()
+        """ The compiled functions"""
+        self.functions = []
+        """ Dict of function-name to the index of the Function in self.functions"""
+        self.index = dict()
+        """ Dict of the name of a global variable to it's index in the list of the values of the globals"""
+        self.globals = dict()
+        """ The format-strings of the print()s as dbc.interpret.Format. Are referenced by their index"""
+        self.formats = []
+        # the state of the function that is currently compiled
+        """ The instructions of the function"""
+        self.code = None
+        """ Dict of the names of the local variables to their register"""
+        self.registers = None
+        """ Dict of the value of a constant to it's register"""
+        self.constants = None
+        """ The register of the first temporary"""
+        self.temporaries = 0
+        """ The number of temporaries currently in use and the maximal number used at once"""
+        self.used = 0
+        self.maxused = 0
+        """ The register the parent of the current expression wants it's value in (see expression())"""
+        self.target = None
+
+    def generate(self, syntaxtree):
+        """ Compile the given checked AST. Returns the Functions, the index of the functions and the initial values of the globals"""
+        self.visit(syntaxtree)
+        return self.functions, self.index, [int(value) for value in syntaxtree.globalvars.values()]
+
+    def emit(self, opcode, a, b, c):
+        """ Append an instruction. Returns it's index"""
+        self.code.append([opcode, a, b, c])
+        return len(self.code) - 1
+
+    def patch(self, jump, target):
+        """ Let the jump-instruction with the given index jump to the target (an index)"""
+        self.code[jump][3] = target
+
+    def temporary(self):
+        """ Returns a new temporary register. It is in use until self.used is reset below it"""
+        reg = self.temporaries + self.used
+        self.used += 1
+        self.maxused = max(self.maxused, self.used)
+        return reg
+
+    def expression(self, node, target=None):
+        """ Generate the code of the expression. If target is given, it's value should be computed into this register.
+        Returns the register that contains the value, which is not target, if the value already is in a register (variables and constants)"""
+        self.target = target
+        return self.visit(node)
+
+    def result(self):
+        """ Returns the register the current expression has to compute it's value into: The target given by it's parent
+        or a new temporary. Every expression has to call this (or reset self.target) before it generates the code of it's children"""
+        target = self.target
+        self.target = None
+        if target is None:
+            return self.temporary()
+        return target
+
+    def jump(self, node, when):
+        """ Generate the code of the condition and a jump that is taken if it's value is when (True or False).
+        Returns the index of the jump. It's target has to be patched"""
+        mark = self.used
+        if type(node) == ast.Binary and node.op in jumps:
+            left = self.expression(node.val1)
+            right = self.expression(node.val2)
+            self.used = mark
+            op = node.op if when else negations[node.op]
+            return self.emit(jumps[op], left, right, None)
+        reg = self.expression(node)
+        self.used = mark
+        return self.emit(JTRUE if when else JFALSE, reg, 0, None)
+
+    def block(self, statements):
+        for statement in statements:
+            self.target = None
+            # the temporaries of a statement are not needed after it
+            mark = self.used
+            self.visit(statement)
+            self.used = mark
+
+    def visitProgramm(self, node):
+        self.globals = {name: i for i, name in enumerate(node.globalvars)}
+        # every function needs an index before the first call to it is compiled
+        for func in node.funcdefs:
+            self.index[func.name] = len(self.functions)
+            self.functions.append(Function(func.name, len(func.args)))
+        for func in node.funcdefs:
+            self.visit(func)
+
+    def visitFuncdef(self, node):
+        self.registers = {name: i for i, name in enumerate(node.localvars)}
+        constants = Constants()
+        constants.visit(node)
+        self.constants = {value: len(self.registers) + i
+                          for i, value in enumerate(constants.values)}
+        self.temporaries = len(self.registers) + len(self.constants)
+        self.used = self.maxused = 0
+        self.code = []
+        self.block(node.statements)
+        # return 0 if the end of the function is reached
+        self.emit(RET, self.constants[0], 0, 0)
+
+        func = self.functions[self.index[node.name]]
+        func.code = [tuple(instruction) for instruction in self.code]
+        # variables that are read before they are assigned are 0
+        func.registers = [0] * (len(self.registers) - func.nargs) + \
+            list(constants.values) + [0] * self.maxused
+
+    def visitUnary(self, node):
+        if type(node.val) == ast.Const:
+            self.target = None
+            return self.constants[wrap(-int(node.val.value))]
+        dst = self.result()
+        mark = self.used
+        src = self.expression(node.val)
+        self.used = mark
+        self.emit(NEG, dst, src, 0)
+        return dst
+
+    def visitBinary(self, node):
+        dst = self.result()
+        mark = self.used
+        left = self.expression(node.val1)
+        right = self.expression(node.val2)
+        self.used = mark
+        self.emit(binaryops[node.op], dst, left, right)
+        return dst
+
+    def visitVar(self, node):
+        if node.name in self.registers:
+            self.target = None
+            return self.registers[node.name]
+        dst = self.result()
+        self.emit(LOADG, dst, self.globals[node.name], 0)
+        return dst
+
+    def visitConst(self, node):
+        self.target = None
+        return self.constants[int(node.value)]
+
+    def visitStr(self, node):
+        self.target = None
+        return self.constants[unescape(node.value)]
+
+    def visitAssign(self, node):
+        if node.name in self.registers:
+            reg = self.registers[node.name]
+            src = self.expression(node.value, reg)
+            if src != reg:
+                self.emit(MOVE, reg, src, 0)
+        else:
+            src = self.expression(node.value)
+            self.emit(STOREG, self.globals[node.name], src, 0)
+
+    def visitLocaldef(self, node):
+        self.visitAssign(node)
+
+    def visitIf(self, node):
+        skip = self.jump(node.exp, False)
+        self.block(node.statements)
+        if node.elsestatements:
+            end = self.emit(JUMP, 0, 0, None)
+            self.patch(skip, len(self.code))
+            self.block(node.elsestatements)
+            self.patch(end, len(self.code))
+        else:
+            self.patch(skip, len(self.code))
+
+    def visitWhile(self, node):
+        # the condition is at the end of the loop. So every iteration needs only one jump
+        enter = self.emit(JUMP, 0, 0, None)
+        start = len(self.code)
+        self.block(node.statements)
+        self.patch(enter, len(self.code))
+        self.patch(self.jump(node.exp, True), start)
+
+    def visitReturn(self, node):
+        if node.expression:
+            reg = self.expression(node.expression)
+        else:
+            reg = self.constants[0]
+        self.emit(RET, reg, 0, 0)
+
+    def visitCall(self, node):
+        if node.name == "input":
+            dst = self.result()
+            self.emit(INPUT, dst, 0, 0)
+            return dst
+        isprint = node.name == "print"
+        dst = None if isprint else self.result()
+        args = node.args[1:] if isprint else node.args
+        # the arguments are computed into consecutive temporaries
+        mark = self.used
+        base = self.temporaries + self.used
+        for _ in args:
+            self.temporary()
+        for i, arg in enumerate(args):
+            reg = self.expression(arg, base + i)
+            if reg != base + i:
+                self.emit(MOVE, base + i, reg, 0)
+        self.used = mark
+        if isprint:
+            self.formats.append(printformat(node.args[0].value))
+            self.emit(PRINT, len(self.formats) - 1, base, len(args))
+            return None
+        self.emit(CALL, dst, self.index[node.name], base)
+        return dst
+
+
+def disassemble(func):
+    """ Returns a readable listing of the instructions of the Function"""
+    return "".join("{:>4}  {:<8}{} {} {}\n".format(i, opnames[op], a, b, c) for i, (op, a, b, c) in enumerate(func.code))
+
+
+class Machine:
+    """ The engine that runs the bytecode. Compiles the (checked) AST when it is created """
+
+    def __init__(self, syntaxtree, console):
+        self.console = console
+        generator = BytecodeGenerator()
+        """ The Functions, the dict of their names to their index and the values of the global variables"""
+        self.functions, self.index, self.globals = generator.generate(syntaxtree)
+        """ The Formats of the print()s"""
+        self.formats = generator.formats
+
+    def execute(self, name, args):
+        """ Run the function with the given name and arguments (ints). Returns it's result"""
+        func = self.functions[self.index[name]]
+        return self.loop(func, list(args) + func.registers)
+
+    def loop(self, func, regs):
+        """ Run the function with the given registers until it returns. Returns it's result """
+        functions = self.functions
+        globs = self.globals
+        formats = self.formats
+        console = self.console
+        frames = []
+        code = func.code
+        pc = 0
+        while True:
+            op, a, b, c = code[pc]
+            pc += 1
+            if op == ADD:
+                value = regs[b] + regs[c]
+                # only results that overflowed need to wrap around
+                regs[a] = value if INTMIN <= value <= INTMAX else wrap(value)
+            elif op == JLT:
+                if regs[a] < regs[b]:
+                    pc = c
+            elif op == MOVE:
+                regs[a] = regs[b]
+            elif op == SUB:
+                value = regs[b] - regs[c]
+                regs[a] = value if INTMIN <= value <= INTMAX else wrap(value)
+            elif op == AND:
+                regs[a] = regs[b] & regs[c]
+            elif op == CALL:
+                # remember where to continue and where the result goes
+                frames.append((code, pc, regs, a))
+                callee = functions[b]
+                regs = regs[c:c+callee.nargs] + callee.registers
+                code = callee.code
+                pc = 0
+            elif op == RET:
+                value = regs[a]
+                if not frames:
+                    return value
+                code, pc, regs, a = frames.pop()
+                regs[a] = value
+            elif op == MUL:
+                value = regs[b] * regs[c]
+                regs[a] = value if INTMIN <= value <= INTMAX else wrap(value)
+            elif op == JGE:
+                if regs[a] >= regs[b]:
+                    pc = c
+            elif op == JUMP:
+                pc = c
+            elif op == DIV:
+                x = regs[b]
+                y = regs[c]
+                regs[a] = x // y if x >= 0 and y > 0 else divide(x, y)
+            elif op == JLE:
+                if regs[a] <= regs[b]:
+                    pc = c
+            elif op == JGT:
+                if regs[a] > regs[b]:
+                    pc = c
+            elif op == JEQ:
+                if regs[a] == regs[b]:
+                    pc = c
+            elif op == JNE:
+                if regs[a] != regs[b]:
+                    pc = c
+            elif op == LOADG:
+                regs[a] = globs[b]
+            elif op == STOREG:
+                globs[a] = regs[b]
+            elif op == JTRUE:
+                if regs[a]:
+                    pc = c
+            elif op == JFALSE:
+                if not regs[a]:
+                    pc = c
+            elif op == OR:
+                regs[a] = regs[b] | regs[c]
+            elif op == LT:
+                regs[a] = regs[b] < regs[c]
+            elif op == GE:
+                regs[a] = regs[b] >= regs[c]
+            elif op == LE:
+                regs[a] = regs[b] <= regs[c]
+            elif op == GT:
+                regs[a] = regs[b] > regs[c]
+            elif op == EQ:
+                regs[a] = regs[b] == regs[c]
+            elif op == NE:
+                regs[a] = regs[b] != regs[c]
+            elif op == NEG:
+                regs[a] = wrap(-regs[b])
+            elif op == PRINT:
+                console.print(formats[a], regs[b:b+c])
+            elif op == INPUT:
+                regs[a] = console.input()
+
+
+def load(sources, requiremain=True, optimize=None, console=None):
+    """ Load the given DBASIC-sources into the bytecode-interpreter. Returns a dbc.interpret.Programm (see dbc.interpret.load())"""
+    return interpret.load(sources, requiremain, optimize, console, Machine)
+
+
+def loadsource(source, requiremain=True, optimize=None, console=None):
+    """ Load the given DBASIC source-code into the bytecode-interpreter. Returns a dbc.interpret.Programm"""
+    return interpret.loadsource(source, requiremain, optimize, console, Machine)
+
+
+def run(source, optimize=None, console=None):
+    """ Run the given DBASIC source-code (a complete programm) with the bytecode-interpreter. Returns the result of main()"""
+    return interpret.run(source, optimize, console, Machine)
@@ -19,6 +19,6 @@ setuptools.setup(
         "Operating System :: Unix",
     ),
     entry_points={
-        'console_scripts': ['dbc=dbc.cli:main'],
+        'console_scripts': ['dbc=dbc.cli:main', 'dbc-client=dbc.client:main'],
     }
 )
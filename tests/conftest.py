@@ -0,0 +1,10 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def cachedir(tmp_path, monkeypatch):
+    # every test builds it's objects and the runtime in an empty cache. Otherwise the tests would write to the cache of the user
+    # and could pass on stale objects built by an older compiler
+    cache = tmp_path / "dbc-cache"
+    monkeypatch.setenv("DBC_CACHE_DIR", str(cache))
+    return cache
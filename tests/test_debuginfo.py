@@ -0,0 +1,19 @@
+from dbc.cli import main
+import subprocess
+
+
+def test_line_information(tmp_path):
+    out = str(tmp_path / "fib")
+    main(["examples/fib.basic", "-o", out, "-g"])
+    # every function has a size and it's address maps to the line of it's definition
+    symbols = subprocess.run(["nm", "-S", out], stdout=subprocess.PIPE).stdout.decode()
+    fib = [line.split() for line in symbols.splitlines()
+           if line.endswith(" T fib")][0]
+    assert len(fib) == 4
+    location = subprocess.run(["addr2line", "-e", out, fib[0]],
+                              stdout=subprocess.PIPE).stdout.decode()
+    assert location.strip().endswith("examples/fib.basic:13")
+    # there is call-frame-information for the function
+    frames = subprocess.run(["readelf", "--debug-dump=frames", out],
+                            stdout=subprocess.PIPE).stdout.decode()
+    assert "DW_CFA_def_cfa_register: r6 (rbp)" in frames
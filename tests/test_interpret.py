@@ -0,0 +1,173 @@
+import io
+from dbc.cli import run
+from dbc.errors import ExecutionError
+import dbc.interpret as interpret
+import dbc.vm as vm
+import dbc.closures as closures
+import pytest
+
+# the output was compared with the one of the compiled programm
+semantics = """GLOBAL INT g = 5
+GLOBAL BOOL flag = TRUE
+
+FUNC many(INT a, INT b, INT c, INT d, INT e, INT f, INT h, INT i) INT
+    RETURN a - b + c*d - e + f*h - i
+END
+
+FUNC fact(INT n) INT
+    IF n <= 1 THEN
+        RETURN 1
+    END
+    RETURN n * fact(n-1)
+END
+
+FUNC bump()
+    g = g + 1
+    RETURN
+END
+
+FUNC main() INT
+    INT x = 0
+    INT big = 9223372036854775807
+    print("wrap %ld %ld\\n", big + 1, -big - 2)
+    print("div %d %d %d %d\\n", 7/2, -7/2, 7/(0-2), -7/(0-2))
+    print("low %d %ld\\n", big, big)
+    print("fmt [%5d] [%-4d] [%05d] [%x] [%X] [%o] [%#o] [%c] [%s] [%u] 100%%\\n", 42, 7, -3, 255, 255, 8, 8, 65, "str", -1)
+    WHILE x < 10 DO
+        IF (x & 1) == 0 THEN
+            bump()
+        ELSE
+            g = g - 1
+        END
+        x = x + 1
+    END
+    print("g %d fact %ld many %d\\n", g, fact(20), many(1, 2, 3, 4, 5, 6, 7, 8))
+    BOOL b = x > 3 & flag
+    IF b THEN
+        print("bool\\n")
+    END
+    print("neg %d %d\\n", -x, -(x+1))
+    RETURN fact(5) - 100
+END"""
+
+expected = """wrap -9223372036854775808 9223372036854775807
+div 3 -3 -3 3
+low -1 9223372036854775807
+fmt [   42] [7   ] [-0003] [ff] [FF] [10] [010] [A] [str] [4294967295] 100%
+g 5 fact 2432902008176640000 many 40
+bool
+neg -10 -11
+"""
+
+library = """GLOBAL INT offset = 7
+FUNC add(INT a, INT b) INT
+    RETURN a+b+offset
+END
+FUNC negative(INT a) BOOL
+    RETURN a < 0
+END
+FUNC depth(INT n) INT
+    IF n == 0 THEN
+        RETURN 0
+    END
+    RETURN depth(n-1) + 1
+END
+FUNC echo() INT
+    INT a = input()
+    INT b = input()
+    print("%d %d\\n", a, b)
+    RETURN a + b
+END
+FUNC divide(INT a, INT b) INT
+    RETURN a / b
+END"""
+
+engines = [interpret.Interpreter, vm.Machine, closures.ClosureCompiler]
+
+
+@pytest.mark.parametrize("engine", engines)
+@pytest.mark.parametrize("optimize", [None, 2])
+def test_semantics(engine, optimize):
+    out = io.StringIO()
+    assert interpret.run(semantics, optimize, interpret.Console(out), engine) == 20
+    assert out.getvalue() == expected
+
+
+@pytest.mark.parametrize("engine", engines)
+def test_call(tmp_path, engine):
+    lib = tmp_path / "lib.basic"
+    lib.write_text(library)
+    console = interpret.Console(io.StringIO(), io.StringIO("12\n -3xyz\n"))
+    with interpret.load([str(lib)], requiremain=False, console=console, engine=engine) as programm:
+        assert programm.call("add", 1, 2) == 10
+        assert programm.call("negative", -1) is True
+        assert programm.call("echo") == 9
+        assert console.stdout.getvalue() == "12 -3\n"
+        with pytest.raises(ExecutionError):
+            programm.call("add", 1)
+        with pytest.raises(ExecutionError):
+            programm.call("add", 1, True)
+        with pytest.raises(ExecutionError):
+            programm.call("divide", 1, 0)
+
+
+@pytest.mark.parametrize("engine", engines)
+def test_call_optimized(engine):
+    # main only calls helper(5) and never unused. Both must still be callable with any argument
+    source = "\n".join(["FUNC helper(INT x) INT", "    RETURN x + 1", "END",
+                        "FUNC unused(INT x) INT", "    RETURN x * 2", "END",
+                        "FUNC main() INT", "    RETURN helper(5)", "END"])
+    programm = interpret.loadsource(source, optimize=2, engine=engine)
+    assert programm.call("helper", 1) == 2
+    assert programm.call("unused", 4) == 8
+    assert programm.main() == 6
+    # dbc run only calls main(), so the programm is optimized as a whole
+    programm = interpret.loadsource(
+        source, optimize=2, engine=engine, wholeprogramm=True)
+    assert programm.main() == 6
+    with pytest.raises(ExecutionError):
+        programm.call("unused", 4)
+
+
+def test_recursion(tmp_path):
+    # the bytecode-interpreter does not recurse in python
+    lib = tmp_path / "lib.basic"
+    lib.write_text(library)
+    with vm.load([str(lib)], requiremain=False) as programm:
+        assert programm.call("depth", 100000) == 100000
+
+
+def test_closures():
+    # a library embedded in python
+    programm = closures.loadsource(library, requiremain=False)
+    assert programm.call("add", 2, 3) == 12
+    assert programm.call("negative", 5) is False
+    assert programm.call("depth", 100) == 100
+    with pytest.raises(ExecutionError):
+        programm.call("depth", 100000)
+
+
+def test_bytecode():
+    syntaxtree = interpret.frontend([library], requiremain=False)
+    machine = vm.Machine(syntaxtree, interpret.Console())
+    code = vm.disassemble(machine.functions[machine.index["depth"]])
+    # n is register 0, the constants 0 and 1 are the registers 1 and 2. The comparison is fused with the jump
+    # and n-1 is computed directly into the argument of the call
+    assert code.split() == ["0", "JNE", "0", "1", "2",
+                            "1", "RET", "1", "0", "0",
+                            "2", "SUB", "5", "0", "2",
+                            "3", "CALL", "4", "2", "5",
+                            "4", "ADD", "3", "4", "2",
+                            "5", "RET", "3", "0", "0",
+                            "6", "RET", "1", "0", "0"]
+
+
+@pytest.mark.parametrize("backend", ["vm", "closures", "tree"])
+def test_run(tmp_path, capsys, backend):
+    prog = tmp_path / "prog.basic"
+    prog.write_text("FUNC main() INT\n    print(\"sum %d\\n\", 12)\n    RETURN 42\nEND")
+    assert run(["run", str(prog), "--backend", backend]) == 42
+    assert capsys.readouterr().out == "sum 12\n"
+    # C-functions can not be called
+    prog.write_text("FUNC main() INT\n    nothere()\n    RETURN 0\nEND")
+    assert run(["run", str(prog), "--backend", backend]) == 1
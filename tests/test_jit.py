@@ -0,0 +1,72 @@
+from dbc.cli import run
+import dbc.jit as jit
+import pytest
+
+library = """GLOBAL INT offset = 7
+FUNC add(INT a, INT b) INT
+    RETURN a+b+offset
+END
+FUNC negative(INT a) BOOL
+    RETURN a < 0
+END
+FUNC sum(INT a, INT b, INT c, INT d, INT e, INT f, INT g, INT h) INT
+    RETURN a+b+c+d+e+f+g+h
+END"""
+
+programm = """FUNC main() INT
+    print("sum %d\\n", add(2,3))
+    RETURN add(30, 5)
+END"""
+
+
+def write(path, content):
+    with open(path, "w") as f:
+        f.write(content)
+    return str(path)
+
+
+@pytest.mark.parametrize("options", [["-O0"], ["-O1", "--omit-frame-pointer"]])
+def test_run(tmp_path, capfd, options):
+    lib = write(tmp_path / "lib.basic", library)
+    prog = write(tmp_path / "prog.basic", programm)
+    assert run(["run", prog, lib] + options) == 42
+    assert capfd.readouterr().out == "sum 12\n"
+
+
+def test_call(tmp_path):
+    lib = write(tmp_path / "lib.basic", library)
+    with jit.load([lib], requiremain=False, optimize=1) as programm:
+        assert programm.call("add", 1, 2) == 10
+        assert programm.call("add", -20, 2) == -11
+        assert programm.call("negative", -1) is True
+        assert programm.call("sum", 1, 2, 3, 4, 5, 6, 7, 8) == 36
+        with pytest.raises(jit.JITError):
+            programm.call("add", 1)
+        with pytest.raises(jit.JITError):
+            programm.call("add", 1, True)
+        with pytest.raises(jit.JITError):
+            programm.call("add", 1, 2**64)
+
+
+def test_call_optimized(tmp_path):
+    # main only calls helper(5) and never unused. Both must still be callable with any argument
+    prog = write(tmp_path / "prog.basic", "\n".join([
+        "FUNC helper(INT x) INT", "    RETURN x + 1", "END",
+        "FUNC unused(INT x) INT", "    RETURN x * 2", "END",
+        "FUNC main() INT", "    RETURN helper(5)", "END"]))
+    with jit.load([prog], optimize=2) as programm:
+        assert programm.call("helper", 1) == 2
+        assert programm.call("unused", 4) == 8
+        assert programm.main() == 6
+    # dbc run only calls main(), so the programm is optimized as a whole
+    with jit.load([prog], optimize=2, wholeprogramm=True) as programm:
+        assert programm.main() == 6
+        with pytest.raises(jit.JITError):
+            programm.call("unused", 4)
+
+
+def test_undefined(tmp_path):
+    prog = write(tmp_path / "prog.basic",
+                 "FUNC main() INT\n    nothere()\n    RETURN 0\nEND")
+    with pytest.raises(jit.JITError):
+        jit.load([prog])
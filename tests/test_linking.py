@@ -0,0 +1,210 @@
+from dbc.cli import main, run
+import io
+import os
+import subprocess
+import pytest
+
+library = """GLOBAL INT offset = 7
+FUNC add(INT a, INT b) INT
+    RETURN a+b+offset
+END
+FUNC hello()
+    print("hello\\n")
+    RETURN
+END"""
+
+programm = """FUNC main() INT
+    print("sum %d\\n", add(2,3))
+    hello()
+    RETURN 0
+END"""
+
+
+def write(path, content):
+    with open(path, "w") as f:
+        f.write(content)
+    return str(path)
+
+
+def test_link_multiple_sources(tmp_path):
+    lib = write(tmp_path / "lib.basic", library)
+    prog = write(tmp_path / "prog.basic", programm)
+    out = str(tmp_path / "prog")
+    main([prog, lib, "-o", out])
+    result = subprocess.run([out], stdout=subprocess.PIPE)
+    assert result.stdout == b"sum 12\nhello\n"
+
+
+def test_separate_compilation(tmp_path):
+    lib = write(tmp_path / "lib.basic", library)
+    prog = write(tmp_path / "prog.basic", programm)
+    main(["-c", lib])
+    assert os.path.isfile(str(tmp_path / "lib.o"))
+    out = str(tmp_path / "prog")
+    main([prog, str(tmp_path / "lib.o"), "-o", out])
+    result = subprocess.run([out], stdout=subprocess.PIPE)
+    assert result.stdout == b"sum 12\nhello\n"
+
+
+def test_parallel_batch(tmp_path, capsys):
+    for i in range(4):
+        write(tmp_path / "prog{}.basic".format(i),
+              "FUNC main() INT\n    print(\"%d\\n\", {})\n    RETURN 0\nEND".format(i))
+    write(tmp_path / "broken.basic", "FUNC main() INT\n    x = 1\n    RETURN 0\nEND")
+    with pytest.raises(SystemExit):
+        main([str(tmp_path), "--separate", "-j", "2"])
+    # the error is reported for the broken file, all other files are still compiled
+    assert "broken.basic: Semantic error on line 2" in capsys.readouterr().out
+    for i in range(4):
+        result = subprocess.run(
+            [str(tmp_path / "prog{}".format(i))], stdout=subprocess.PIPE)
+        assert result.stdout == "{}\n".format(i).encode()
+
+
+# calls the DBASIC-function work() with known values in the callee-saved registers and checks that they are preserved
+callersource = """    .text
+.globl main
+main:
+    push %rbx
+    push %r12
+    push %r13
+    push %r14
+    push %r15
+    mov $11, %rbx
+    mov $12, %r12
+    mov $13, %r13
+    mov $14, %r14
+    mov $15, %r15
+    mov $10, %rdi
+    call work
+    cmp $11, %rbx
+    jne .Lbroken
+    cmp $12, %r12
+    jne .Lbroken
+    cmp $13, %r13
+    jne .Lbroken
+    cmp $14, %r14
+    jne .Lbroken
+    cmp $15, %r15
+    jne .Lbroken
+    cmp $3628800, %rax
+    jne .Lbroken
+    mov $0, %rax
+    jmp .Lexit
+.Lbroken:
+    mov $1, %rax
+.Lexit:
+    pop %r15
+    pop %r14
+    pop %r13
+    pop %r12
+    pop %rbx
+    ret
+.section .note.GNU-stack,"",@progbits
+"""
+
+worksource = """FUNC fac(INT n) INT
+    IF n < 2 THEN
+        RETURN 1
+    END
+    RETURN n * fac(n-1)
+END
+FUNC work(INT n) INT
+    INT a = 0
+    INT b = 0
+    INT c = 0
+    INT d = 0
+    INT e = 0
+    INT f = 0
+    WHILE a < n DO
+        a = a + 1
+        b = b + a
+        c = c + b
+        d = d + c
+        e = e + d
+        f = f + e
+    END
+    RETURN fac(n) + (a+b+c+d+e+f) - (a+b+c+d+e+f)
+END"""
+
+
+@pytest.mark.parametrize("level", ["-O0", "-O1", "-O2"])
+def test_callee_saved_registers(tmp_path, level):
+    caller = write(tmp_path / "caller.s", callersource)
+    work = write(tmp_path / "work.basic", worksource)
+    out = str(tmp_path / "prog")
+    main([work, caller, "-o", out, level])
+    assert subprocess.run([out]).returncode == 0
+
+
+# exits with code 3 if %rsp was not 16-byte aligned at the call (the return-address is 8 bytes below the aligned address)
+checksource = """    .text
+.globl checkalignment
+checkalignment:
+    mov %rsp, %rax
+    and $15, %rax
+    cmp $8, %rax
+    jne .Lmisaligned
+    ret
+.Lmisaligned:
+    mov $60, %eax
+    mov $3, %edi
+    syscall
+.section .note.GNU-stack,"",@progbits
+"""
+
+manysource = """FUNC inc(INT n) INT
+    checkalignment()
+    RETURN n + 1
+END
+FUNC sum(INT a, INT b, INT c, INT d, INT e, INT f, INT g, INT h, INT i) INT
+    checkalignment()
+    RETURN a + b*2 + c*3 + d*4 + e*5 + f*6 + g*7 + h*8 + i*9
+END
+FUNC mix(INT a, INT b, INT c, INT d, INT e, INT f, INT g, INT h) INT
+    INT x = g / (h - 1)
+    RETURN sum(a, b, c, d, e, f, x, sum(h, g, f, e, d, c, b, a, inc(x)), g) - h
+END
+FUNC main() INT
+    INT t = mix(1, 2, 3, 4, 5, 6, 70, 8) + inc(inc(4) + inc(5))
+    print("%d %d %d %d %d %d %d %d\\n", t, inc(1), 3, 4, 5, inc(inc(5)), inc(6) + inc(7), sum(9, 8, 7, 6, 5, 4, 3, 2, 1))
+    RETURN 0
+END"""
+
+
+@pytest.mark.parametrize("options", [["-O0"], ["-O1"], ["-O2"], ["--omit-frame-pointer"], ["-O1", "--omit-frame-pointer"]])
+def test_stack_arguments(tmp_path, options):
+    check = write(tmp_path / "check.s", checksource)
+    many = write(tmp_path / "many.basic", manysource)
+    out = str(tmp_path / "prog")
+    main([many, check, "-o", out] + options)
+    result = subprocess.run([out], stdout=subprocess.PIPE)
+    assert result.returncode == 0
+    assert result.stdout == b"3555 2 3 4 5 7 15 165\n"
+
+
+def test_runtime_error(tmp_path, monkeypatch):
+    # gcc-errors while building the runtime are reported like all other errors of the build. The cache is empty (see conftest.py)
+    import dbc.runtime as runtime
+    monkeypatch.setattr(runtime, "builtinFunctions",
+                        lambda: "this is not assembler\n")
+    prog = write(tmp_path / "prog.basic", "FUNC main() INT\n    RETURN 0\nEND")
+    out = io.StringIO()
+    assert run([prog, "-o", str(tmp_path / "prog")], out) == 1
+    assert "prog.basic: " in out.getvalue()
+    assert "no such instruction" in out.getvalue()
+
+
+def test_objectkey():
+    # every option that changes the generated code needs it's own object in the cache
+    import dbc.driver as driver
+    source = "FUNC main() INT\n    RETURN 0\nEND"
+    options = [driver.Options(), driver.Options("c"), driver.Options(optimize=1), driver.Options(profile=True),
+               driver.Options(debuginfo=True), driver.Options(unroll=2), driver.Options(memoize=True),
+               driver.Options(omitframepointer=True)]
+    keys = [driver.objectkey(source, options=o) for o in options]
+    assert len(set(keys)) == len(keys)
+    assert driver.objectkey(source, options=options[2].replace(optimize=None)) == keys[0]
+    # the name of the source-file is only part of objects that contain it
+    assert driver.objectkey(source, filename="a.basic") == keys[0]
+    assert driver.objectkey(source, options=options[4], filename="a.basic") != keys[4]
@@ -0,0 +1,51 @@
+from dbc.cli import main
+import dbc.driver as driver
+import dbc.purity as purity
+import subprocess
+
+source = "\n".join([
+    "GLOBAL INT calls = 0",
+    "GLOBAL INT base = 1",
+    "FUNC binom(INT n, INT k) INT",
+    "    IF k == 0 | k == n THEN",
+    "        RETURN base",
+    "    END",
+    "    RETURN binom(n-1, k-1) + binom(n-1, k)",
+    "END",
+    "FUNC counted(INT n) INT",
+    "    calls = calls + 1",
+    "    IF n < 2 THEN",
+    "        RETURN n",
+    "    END",
+    "    RETURN counted(n-1) + counted(n-2)",
+    "END",
+    "FUNC square(INT n) INT",
+    "    RETURN n*n",
+    "END",
+    "FUNC main() INT",
+    "    INT c = counted(20)",
+    "    print(\"%d %d %d %d\\n\", binom(32, 16), c, calls, square(3))",
+    "    RETURN 0",
+    "END"])
+
+
+def test_purity():
+    syntaxtree = driver.parsesource(source)
+    driver.check(syntaxtree)
+    # base is never assigned, so reading it is fine. counted assigns a global, main prints
+    assert purity.purefunctions(syntaxtree) == {"binom", "square"}
+    # square is not recursive
+    assert purity.memoizable(syntaxtree) == ["binom"]
+
+
+def test_memoize(tmp_path):
+    infile = tmp_path / "memo.basic"
+    infile.write_text(source)
+    for backend in ["asm", "c"]:
+        out = str(tmp_path / backend)
+        main([str(infile), "-o", out, "--memoize", "--backend", backend])
+        # without memoization, binom(32, 16) needs more than a billion calls
+        result = subprocess.run([out], stdout=subprocess.PIPE, timeout=10)
+        assert result.stdout.split()[0] == b"601080390"
+    result = subprocess.run([str(tmp_path / "asm")], stdout=subprocess.PIPE)
+    assert result.stdout == b"601080390 6765 21891 9\n"
@@ -0,0 +1,332 @@
+from dbc.cli import main
+import dbc.driver as driver
+import subprocess
+
+
+def build(tmp_path, source, name, *args):
+    out = str(tmp_path / name)
+    main([source, "-o", out] + list(args))
+    return subprocess.run([out], stdout=subprocess.PIPE).stdout
+
+
+def test_loop_optimizations(tmp_path):
+    kernel = "benchmarks/kernels/stride.basic"
+    assert build(tmp_path, kernel, "O0") == build(tmp_path, kernel, "O1", "-O1")
+
+    with open(kernel) as f:
+        stats = driver.timepasses(f.read(), driver.Options(optimize=1), memory=False)
+    # i*scale, n*4-1 and the load of the global scale are invariant. j*8 is reduced
+    assert stats.counters["hoisted-expressions"] == 3
+    assert stats.counters["reduced-multiplications"] == 1
+
+    # the loops are rotated. They do not jump back to their start unconditionally
+    with open(kernel) as f:
+        code = driver.compileunit(f.read(), driver.Options(optimize=1))
+    assert "jmp .Lwhilestart" not in code
+    assert "jl .Lwhilestart" in code
+
+
+def test_unroll(tmp_path):
+    # loops with variable bounds and trip-counts that are no multiple of the unroll-factor (including zero and negative ones)
+    source = tmp_path / "unroll.basic"
+    source.write_text("\n".join([
+        "FUNC sum(INT from, INT to) INT",
+        "    INT s = 0",
+        "    INT i = from",
+        "    WHILE i < to DO",
+        "        s = s + i",
+        "        i = i + 3",
+        "    END",
+        "    INT j = from",
+        "    WHILE j <= to DO",
+        "        s = s * 3 + j",
+        "        j = j + 1",
+        "    END",
+        "    RETURN s",
+        "END",
+        "FUNC main() INT",
+        "    INT n = 0 - 5",
+        "    WHILE n < 30 DO",
+        "        print(\"%d \", sum(0, n))",
+        "        n = n + 1",
+        "    END",
+        "    RETURN 0",
+        "END"]))
+    expected = build(tmp_path, str(source), "O0")
+    assert build(tmp_path, str(source), "O2", "-O2") == expected
+    assert build(tmp_path, str(source), "U3", "-O1", "--unroll", "3") == expected
+
+    stats = driver.timepasses(source.read_text(), driver.Options(optimize=2), memory=False)
+    assert stats.counters["unrolled-loops"] == 3
+    stats = driver.timepasses(
+        source.read_text(), driver.Options(optimize=2, unroll=1), memory=False)
+    assert stats.counters["unrolled-loops"] == 0
+
+
+def test_deadcode(tmp_path):
+    source = tmp_path / "dead.basic"
+    source.write_text("\n".join([
+        "GLOBAL INT g = 0",
+        "FUNC unused(INT a) INT",
+        "    RETURN onlyfromunused()",
+        "END",
+        "FUNC onlyfromunused() INT",
+        "    RETURN 1",
+        "END",
+        "FUNC helper(INT a) INT",
+        "    g = g + a",
+        "    RETURN a",
+        "END",
+        "FUNC pick(INT a) INT",
+        "    INT x = a * 2",
+        "    INT y = 7",
+        "    INT z = helper(a)",
+        "    y = x + 1",
+        "    x = 3",
+        "    IF a > 2 THEN",
+        "        RETURN y",
+        "    ELSE",
+        "        RETURN z",
+        "    END",
+        "    print(\"never\")",
+        "    RETURN 0",
+        "END",
+        "FUNC main() INT",
+        "    INT i = 0",
+        "    INT s = 0",
+        "    WHILE i < 5 DO",
+        "        INT t = i * 3",
+        "        s = s + pick(i)",
+        "        t = s",
+        "        i = i + 1",
+        "    END",
+        "    print(\"%d %d\\n\", s, g)",
+        "    RETURN 0",
+        "END"]))
+    assert build(tmp_path, str(source), "O0") == b"19 10\n"
+    assert build(tmp_path, str(source), "O1", "-O1") == b"19 10\n"
+
+    stats = driver.timepasses(source.read_text(), driver.Options(optimize=1), memory=False)
+    # y = 7, x = 3, the print and RETURN behind the IF, INT t = i * 3 and t = s. z = helper(a) calls a function and is kept
+    assert stats.counters["removed-statements"] == 6
+    # t is not used anymore
+    assert stats.counters["removed-variables"] == 1
+    assert stats.counters["removed-functions"] == 2
+
+
+def test_cse(tmp_path):
+    source = tmp_path / "cse.basic"
+    source.write_text("\n".join([
+        "GLOBAL INT g = 2",
+        "FUNC change() INT",
+        "    g = g + 1",
+        "    RETURN 0",
+        "END",
+        "FUNC calc(INT a, INT b, INT c) INT",
+        "    INT x = a*b+c",
+        "    INT y = a*b-c",
+        "    INT z = b",
+        "    INT u = a*z + g*c",
+        "    INT v = change()",
+        "    INT w = a*b + g*c",
+        "    IF x > 0 THEN",
+        "        a = 1",
+        "    END",
+        "    print(\"%d %d %d %d %d\\n\", y, u, w, a*b, z)",
+        "    RETURN 0",
+        "END",
+        "FUNC main() INT",
+        "    RETURN calc(6, 7, 1)",
+        "END"]))
+    expected = b"41 44 45 7 7\n"
+    assert build(tmp_path, str(source), "O0") == expected
+    assert build(tmp_path, str(source), "O1", "-O1") == expected
+
+    stats = driver.timepasses(source.read_text(), driver.Options(optimize=1), memory=False)
+    # a*b is reused by y = a*b-c, by u = a*z + g*c (z is a copy of b) and by w = a*b + g*c.
+    # g*c is computed again after the call, a*b again after a changed in the IF. The z in the print is replaced by b
+    assert stats.counters["eliminated-expressions"] == 3
+    assert stats.counters["propagated-copies"] == 1
+
+
+def test_constprop(tmp_path):
+    source = tmp_path / "constprop.basic"
+    source.write_text("\n".join([
+        "FUNC scale(INT x, INT factor) INT",
+        "    RETURN x*factor",
+        "END",
+        "FUNC calc(INT x, INT mode) INT",
+        "    IF mode == 1 THEN",
+        "        RETURN x*2+1",
+        "    END",
+        "    IF mode == 2 THEN",
+        "        RETURN x*x-3",
+        "    END",
+        "    RETURN x/(mode-3)",
+        "END",
+        "FUNC main() INT",
+        "    INT i = 0",
+        "    INT sum = 0",
+        "    WHILE i < 10 DO",
+        "        sum = sum + calc(i, 1) + calc(i, 2) + calc(i, 5) + scale(i, 3)",
+        "        i = i + 1",
+        "    END",
+        "    print(\"%d %d\\n\", sum, calc(7, 4-2))",
+        "    RETURN 0",
+        "END"]))
+    expected = b"510 46\n"
+    assert build(tmp_path, str(source), "O0") == expected
+    assert build(tmp_path, str(source), "O1", "-O1") == expected
+    assert build(tmp_path, str(source), "O2", "-O2") == expected
+
+    stats = driver.timepasses(source.read_text(), driver.Options(optimize=1), memory=False)
+    # every call of scale passes 3 as factor
+    assert stats.counters["propagated-arguments"] == 1
+    assert stats.counters["cloned-functions"] == 0
+    stats = driver.timepasses(source.read_text(), driver.Options(optimize=2), memory=False)
+    # calc is cloned for the modes 1, 2 and 5 and for calc(7, 2)
+    assert stats.counters["cloned-functions"] == 4
+    assert stats.counters["removed-functions"] == 1
+
+
+def test_frames(tmp_path):
+    source = tmp_path / "frames.basic"
+    source.write_text("\n".join([
+        "FUNC leaf(INT a, INT b) INT",
+        "    INT c = a * b",
+        "    RETURN c + a - b",
+        "END",
+        "FUNC divide(INT a, INT b) INT",
+        "    RETURN (a + 1) / b",
+        "END",
+        "FUNC many(INT n) INT",
+        "    INT a = n",
+        "    INT b = a+n",
+        "    INT c = b+n",
+        "    INT d = c+n",
+        "    INT e = d+n",
+        "    INT f = e+n",
+        "    INT g = f+n",
+        "    INT h = g+n",
+        "    INT i = h+n",
+        "    INT j = i+n",
+        "    INT k = j+n",
+        "    INT l = k+n",
+        "    RETURN a+b+c+d+e+f+g+h+i+j+k+l",
+        "END",
+        "FUNC main() INT",
+        "    print(\"%d %d %d\\n\", leaf(6, 7), divide(20, 3), many(2))",
+        "    RETURN 0",
+        "END"]))
+    expected = b"41 7 156\n"
+    assert build(tmp_path, str(source), "O0") == expected
+    assert build(tmp_path, str(source), "O1", "-O1") == expected
+    assert build(tmp_path, str(source), "omit",
+                 "--omit-frame-pointer") == expected
+
+    # with optimizations, leaf-functions do not set up a frame-pointer. With debug-information, all functions do
+    code = driver.compileunit(source.read_text(), driver.Options(optimize=1))
+    assert code.count("push %rbp") == 1
+    code = driver.compileunit(
+        source.read_text(), driver.Options(optimize=1, debuginfo=True))
+    assert code.count("push %rbp") == 4
+    code = driver.compileunit(
+        source.read_text(), driver.Options(omitframepointer=True))
+    assert "%rbp" not in code
+
+
+def test_stackslots(tmp_path):
+    # the variables of the blocks are never live at the same time. sum() calls print, so it's variables stay on the stack
+    source = tmp_path / "slots.basic"
+    source.write_text("\n".join([
+        "FUNC sum(INT n) INT",
+        "    INT total = 0",
+        "    IF n > 3 THEN",
+        "        INT a = n * 2",
+        "        INT b = a + 1",
+        "        print(\"%d \", b)",
+        "        total = total + b",
+        "    ELSE",
+        "        INT c = n * 3",
+        "        print(\"%d \", c)",
+        "        total = total + c",
+        "    END",
+        "    INT i = 0",
+        "    WHILE i < n DO",
+        "        INT d = i * i",
+        "        print(\"%d \", d)",
+        "        total = total + d",
+        "        i = i + 1",
+        "    END",
+        "    RETURN total",
+        "END",
+        "FUNC main() INT",
+        "    print(\"%d\\n\", sum(2) + sum(5))",
+        "    RETURN 0",
+        "END"]))
+    expected = build(tmp_path, str(source), "O0")
+    assert build(tmp_path, str(source), "O1", "-O1") == expected
+
+    stats = driver.timepasses(source.read_text(), driver.Options(optimize=1), memory=False)
+    assert stats.counters["frame-bytes-after"] < stats.counters["frame-bytes-before"]
+
+
+def test_overflow(tmp_path):
+    # INTs wrap around on overflow with every backend. gcc must not optimize the c-code assuming signed overflow never happens
+    source = tmp_path / "overflow.basic"
+    source.write_text("\n".join([
+        "FUNC check(INT x) BOOL",
+        "    RETURN x + 1 > x",
+        "END",
+        "FUNC main() INT",
+        "    print(\"%d\\n\", check(9223372036854775807))",
+        "    INT i = 9223372036854775800",
+        "    INT n = 0",
+        "    WHILE i > 0 DO",
+        "        i = i + 1",
+        "        n = n + 1",
+        "    END",
+        "    print(\"%d %d\\n\", n, i * 3 - 1)",
+        "    RETURN 0",
+        "END"]))
+    results = []
+    for backend in ["asm", "c"]:
+        out = str(tmp_path / backend)
+        main([str(source), "-o", out, "--backend", backend, "-O2"])
+        results.append(subprocess.run(
+            [out], stdout=subprocess.PIPE, timeout=10).stdout)
+    # i*3-1 is INTMAX, %d prints it's lower 32 bits
+    assert results == [b"0\n8 -1\n"] * 2
+
+
+def test_c_semantics(tmp_path):
+    # constants are 64bit wide in the c-code too and operands and arguments are evaluated from left to right
+    source = tmp_path / "semantics.basic"
+    source.write_text("\n".join([
+        "GLOBAL INT g = 1",
+        "FUNC f(INT x) INT",
+        "    print(\"f%ld \", x)",
+        "    g = g * 10",
+        "    RETURN x",
+        "END",
+        "FUNC main() INT",
+        "    print(\"%ld %ld %ld\\n\", 1000000 * 1000000, (-13), 9223372036854775807 + 1)",
+        "    print(\"%ld %ld %ld\\n\", f(1), f(2), g)",
+        "    INT a = g + f(3)",
+        "    INT b = f(4) + g",
+        "    print(\"%ld %ld\\n\", a, b)",
+        "    INT i = 0",
+        "    WHILE f(i) < g - 100000 + 2 DO",
+        "        i = i + 1",
+        "    END",
+        "    RETURN 0",
+        "END"]))
+    results = []
+    for backend in ["asm", "c"]:
+        out = str(tmp_path / backend)
+        main([str(source), "-o", out, "--backend", backend])
+        results.append(subprocess.run(
+            [out], stdout=subprocess.PIPE, timeout=10).stdout)
+    assert results[0] == results[1]
+    assert results[0].startswith(
+        b"1000000000000 -13 -9223372036854775808\nf1 f2 1 2 100\nf3 f4 103 10004\nf0 ")
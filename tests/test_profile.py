@@ -0,0 +1,174 @@
+from dbc.cli import main, run
+import dbc.profile as profile
+import dbc.driver as driver
+import dbc.ast as ast
+import io
+import os
+import subprocess
+
+library = """FUNC square(INT x) INT
+    RETURN x*x
+END"""
+
+programm = """FUNC main() INT
+    INT i = 0
+    INT sum = 0
+    WHILE i < 10 DO
+        IF i < 3 THEN
+            sum = sum + square(i)
+        ELSE
+            sum = sum + 1
+        END
+        i = i+1
+    END
+    print("%d\\n", sum)
+    RETURN 0
+END"""
+
+
+def write(path, content):
+    with open(path, "w") as f:
+        f.write(content)
+    return str(path)
+
+
+def test_profile(tmp_path):
+    lib = write(tmp_path / "lib.basic", library)
+    prog = write(tmp_path / "prog.basic", programm)
+    out = str(tmp_path / "prog")
+    main([prog, lib, "-o", out, "--profile"])
+    profilepath = str(tmp_path / "prog.profile")
+    result = subprocess.run([out], stdout=subprocess.PIPE,
+                            env=dict(os.environ, DBC_PROFILE=profilepath))
+    assert result.stdout == b"12\n"
+
+    entries = {(e.function, e.kind, e.ordinal): e for e in profile.load(profilepath)}
+    assert entries[("square", "func", 0)].count == 3
+    assert entries[("square", "func", 0)].file == lib
+    assert entries[("main", "loop", 0)].count == 10
+    assert entries[("main", "loop", 0)].value == 1
+    assert entries[("main", "if", 0)].count == 10
+    assert entries[("main", "if", 0)].value == 3
+    assert entries[("main", "if", 0)].line == 5
+    assert entries[("main", "call", 0)].target == "square"
+
+    report = io.StringIO()
+    assert run(["profile-report", profilepath, "--annotate"], report) == 0
+    assert "prog.basic:4" in report.getvalue()
+
+
+def counts(executable, profilepath):
+    """ Run the instrumented executable. Returns it's output and the calls of every function in the written profile"""
+    result = subprocess.run([executable], stdout=subprocess.PIPE,
+                            env=dict(os.environ, DBC_PROFILE=profilepath))
+    return result.stdout, {e.function: e.count for e in profile.load(profilepath) if e.kind == "func"}
+
+
+def test_use_profile(tmp_path):
+    # hotcall calls a small function in a hot loop and has an IF that is rarely true
+    kernel = "benchmarks/kernels/hotcall.basic"
+    instrumented = str(tmp_path / "instrumented")
+    main([kernel, "-o", instrumented, "--profile"])
+    profilepath = str(tmp_path / "hotcall.profile")
+    plainoutput, plaincalls = counts(instrumented, profilepath)
+
+    # the trained build beats the plain one: instrumented again, it shows that the 30 million calls of step are gone
+    trained = str(tmp_path / "trained")
+    main([kernel, "-o", trained, "--profile", "--use-profile", profilepath])
+    trainedoutput, trainedcalls = counts(
+        trained, str(tmp_path / "trained.profile"))
+    assert trainedoutput == plainoutput
+    assert plaincalls["step"] == 30000000
+    assert trainedcalls["step"] == 0
+
+    # the hot call of step is inlined and the rarely executed if-block is moved behind the RETURN of main
+    plain = str(tmp_path / "plain")
+    main([kernel, "-t", "asm", "-o", plain + ".asm"])
+    main([kernel, "-t", "asm", "-o", trained + ".asm",
+          "--use-profile", profilepath])
+    with open(plain + ".asm") as f:
+        assert "call step" in f.read()
+    with open(trained + ".asm") as f:
+        code = f.read()
+    assert "call step" not in code
+    mainfunc = code[code.index("\nmain:"):]
+    assert mainfunc.index("\n.Lif") > mainfunc.index("\n    ret")
+
+
+hotness = """FUNC step(INT x) INT
+    RETURN x
+END
+FUNC work(INT n) INT
+    INT s = 0
+    INT i = 0
+    WHILE i < n DO
+        s = s + step(i)
+        i = i + 1
+    END
+    RETURN s
+END
+FUNC main() INT
+    INT total = 0
+    INT k = 0
+    WHILE k < 1000 DO
+        INT i = 0
+        WHILE i < 2 DO
+            total = total + i
+            i = i + 1
+        END
+        total = total + work(k / 1000)
+        k = k + 1
+    END
+    INT j = 0
+    WHILE j < 100000 DO
+        total = total + j
+        j = j + 1
+    END
+    INT c = 0
+    WHILE c < 10 DO
+        total = total + c
+        c = c + 1
+    END
+    print("%ld\\n", total)
+    RETURN 0
+END"""
+
+
+def loops(statements):
+    """ Returns the number of statements of every loop (in order, including nested ones)"""
+    result = []
+    for statement in statements:
+        if type(statement) == ast.While:
+            result += [len(statement.statements)] + loops(statement.statements)
+    return result
+
+
+def test_profile_hotness(tmp_path):
+    prog = write(tmp_path / "hotness.basic", hotness)
+    instrumented = str(tmp_path / "instrumented")
+    main([prog, "-o", instrumented, "--profile"])
+    profilepath = str(tmp_path / "hotness.profile")
+    counts(instrumented, profilepath)
+    entries = profile.load(profilepath)
+
+    # without profile, every counted loop that is not nested is unrolled 4 times. With profile, the loop that does 2 iterations
+    # per entry is unrolled twice and the cold loop (10 iterations) is not unrolled
+    unrolled = []
+    for data in [None, entries]:
+        syntaxtree = driver.parsesource(hotness)
+        driver.check(syntaxtree)
+        if data:
+            driver.optimizeprofile(syntaxtree, data)
+        driver.optimizeast(syntaxtree, 2)
+        unrolled.append(loops(syntaxtree.symbols.function("main").statements))
+    # the nested loop is unrolled (and followed by it's remainder-loop) inside of the outer loop
+    assert unrolled[0] == [5, 8, 2, 8, 2, 8, 2]
+    assert unrolled[1] == [5, 4, 2, 8, 2, 2]
+
+    # work is called 1000 times, but it's loop never runs. Keeping it's variables in callee-saved registers would cost more
+    # saves and restores than it saves accesses
+    for data, promoted in [(None, True), (entries, False)]:
+        code = driver.compileunit(hotness, driver.Options(optimize=1), profiledata=data)
+        work = code[code.index("\nwork:"):]
+        work = work[:work.index(".size")]
+        assert ("%r12" in work) == promoted
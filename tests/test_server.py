@@ -0,0 +1,32 @@
+import dbc.server as server
+import dbc.client as client
+import dbc.parse as parse
+import os
+import threading
+
+
+def test_server(tmp_path):
+    path = str(tmp_path / "dbc.sock")
+    with open(str(tmp_path / "prog.basic"), "w") as f:
+        f.write("FUNC main() INT\n    RETURN 0\nEND")
+    with open(str(tmp_path / "broken.basic"), "w") as f:
+        f.write("FUNC main() INT\n    x = 1\n    RETURN 0\nEND")
+    with server.Server(path, server.RequestHandler) as srv:
+        threading.Thread(target=srv.serve_forever, daemon=True).start()
+        try:
+            # relative paths are relative to the client's directory
+            status, output = client.request(
+                ["prog.basic", "-t", "asm"], str(tmp_path), path)
+            assert status == 0 and output == ""
+            assert os.path.isfile(str(tmp_path / "prog.asm"))
+            status, output = client.request(
+                ["broken.basic"], str(tmp_path), path)
+            assert status == 1
+            assert output.startswith("broken.basic: Semantic error on line 2")
+            # debug-logging would be enabled for all following requests
+            status, output = client.request(
+                ["prog.basic", "--debug", "1"], str(tmp_path), path)
+            assert status == 1 and "--debug" in output
+            assert not parse.debug
+        finally:
+            srv.shutdown()
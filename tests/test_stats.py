@@ -0,0 +1,43 @@
+from dbc.cli import main
+import dbc.driver as driver
+import json
+import threading
+
+
+def test_timepasses():
+    with open("examples/fib.basic") as f:
+        source = f.read()
+    stats = driver.timepasses(source, pipeline="separate")
+    assert list(stats.passes.keys()) == [
+        "tokenize", "parse", "VariableChecker", "TypeChecker", "ASMGenerator", "format"]
+    stats = driver.timepasses(source)
+    assert list(stats.passes.keys()) == [
+        "tokenize", "parse", "SemanticChecker", "ASMGenerator", "format"]
+    assert all(p["memory"] > 0 for p in stats.passes.values())
+    assert stats.counters["functions"] == 2
+    assert stats.counters["register-spills"] == stats.counters["register-reloads"]
+
+
+def test_timepasses_threads():
+    # concurrent requests to the compile-server measure memory at the same time. They must not stop each other's tracemalloc
+    with open("examples/fib.basic") as f:
+        source = f.read()
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(driver.timepasses(source)))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(results) == 4
+    assert all(p["memory"] > 0 for stats in results for p in stats.passes.values())
+
+
+def test_stats_json(tmp_path):
+    report = str(tmp_path / "stats.json")
+    main(["examples/fib.basic", "-o", str(tmp_path / "fib"),
+          "--time-passes", "--stats", "--stats-format", "json", "--stats-file", report])
+    with open(report) as f:
+        data = json.load(f)
+    assert "gcc" in data["passes"]
+    assert data["counters"]["instructions"] > 0
@@ -0,0 +1,34 @@
+import glob
+import dbc.driver as driver
+from dbc.errors import CheckError
+import pytest
+
+
+def test_symboltable():
+    with open("examples/functions.basic") as f:
+        tree = driver.check(driver.parsesource(f.read()))
+    symbols = tree.symbols
+    assert symbols.function("test") is tree.funcdefs[0]
+    assert symbols.function("print") is None
+    assert symbols.vartype("myconst", None) == "INT"
+    assert symbols.vartype("unused", symbols.function("othertest")) == "BOOL"
+    assert not symbols.islocal("myconst", symbols.function("main"))
+    # the names in the AST are interned, so every use of a variable refers to the same string
+    test = symbols.function("test")
+    assert test.args[0] is test.statements[0].expression.val1.val1.val1.name
+
+
+def test_duplicate_function():
+    source = "FUNC f() INT\n    RETURN 1\nEND\nFUNC f() INT\n    RETURN 2\nEND\nFUNC main() INT\n    RETURN f()\nEND"
+    with pytest.raises(CheckError, match="previously been defined"):
+        driver.check(driver.parsesource(source))
+
+
+def test_fused_checker():
+    # the fused checker must annotate the AST exactly like the separate checkers
+    for example in glob.glob("examples/*.basic"):
+        with open(example) as f:
+            source = f.read()
+        for target in ["asm", "c"]:
+            assert driver.compileunit(source, driver.Options(target), pipeline="fused") == driver.compileunit(
+                source, driver.Options(target), pipeline="separate")